@@ -1,27 +1,89 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 import os
+import sys
 from dotenv import load_dotenv
 import json
 import requests
 from datetime import datetime
 from medical_analyzer import MedicalAnalyzer
-from hospital_data import HospitalDataManager
+from hospital_data import HospitalDataManager, check_procedures
 from insurance_analyzer import InsuranceAnalyzer
 from conversation_manager import ConversationManager
+from dataset import (DatasetWatcher, add_snapshot_warmer, freeze_loaded_objects, get_dataset, reload_dataset,
+                     reload_dataset_async, set_dataset)
+from sqlite_store import SQLiteHospitalStore
+from records import json_default, public_hospital
 
 # Load environment variables
 load_dotenv()
 
+class RecordJSONProvider(DefaultJSONProvider):
+    """Flask JSON encoding that also encodes hospital records and lazy comparison results"""
+    
+    @staticmethod
+    def default(o):
+        try:
+            return json_default(o)
+        except TypeError:
+            return DefaultJSONProvider.default(o)
+
 app = Flask(__name__)
+app.json = RecordJSONProvider(app)
+
+MAX_BATCH_QUERIES = 10000  # queries accepted by one /api/compare-hospitals/batch call
+BATCH_STREAM_CHUNK = 256   # queries answered between flushes of a streamed batch
 app.secret_key = os.getenv('SECRET_KEY', 'your-secret-key-here')
 CORS(app)
 
-# Initialize components
+def _open_hospital_store():
+    """Open the SQLite hospital store named by HOSPITAL_DB, if one is configured"""
+    path = os.getenv('HOSPITAL_DB')
+    if not path:
+        return None
+    try:
+        return SQLiteHospitalStore(path)
+    except Exception as e:
+        print(f"Error opening hospital database {path}, using the in-memory dataset: {e}")
+        return None
+
+# Initialize components (the dataset is loaded once and shared by all of them)
+hospital_store = _open_hospital_store()
+if hospital_store is not None:
+    # The store holds the plans and conditions too, so the JSON dataset is never loaded
+    set_dataset(hospital_store.snapshot())
 medical_analyzer = MedicalAnalyzer()
-hospital_data_manager = HospitalDataManager()
+hospital_data_manager = HospitalDataManager(store=hospital_store)
 insurance_analyzer = InsuranceAnalyzer()
-conversation_manager = ConversationManager()
+conversation_manager = ConversationManager(medical_analyzer, hospital_data_manager, insurance_analyzer)
+
+# Reloaded snapshots get their indexes built before they are swapped in
+add_snapshot_warmer(hospital_data_manager.warm_indexes)
+
+def preload():
+    """Load and index the dataset, then freeze it; call in a preloading server's master before forking"""
+    snapshot = get_dataset()
+    hospital_data_manager.warm_indexes(snapshot)
+    frozen = freeze_loaded_objects()
+    print(f"Preloaded dataset version {snapshot.version} ({frozen:,} objects frozen for copy-on-write sharing)")
+    return snapshot
+
+def start_data_watcher():
+    """Watch the data files and hot reload them when they change, if DATA_RELOAD_INTERVAL is set
+
+    A store is not reloaded. Returns the started watcher, or None.
+    """
+    if not os.getenv('DATA_RELOAD_INTERVAL') or hospital_store is not None:
+        return None
+    watcher = DatasetWatcher(interval=float(os.getenv('DATA_RELOAD_INTERVAL')))
+    watcher.start()
+    return watcher
+
+# Under gunicorn the app is imported in the master, where a thread would not survive the fork;
+# gunicorn.conf.py starts a watcher in each worker instead
+if 'gunicorn' not in sys.modules:
+    start_data_watcher()
 
 @app.route('/')
 def index():
@@ -58,22 +120,148 @@ def compare_hospitals():
         data = request.get_json()
         procedures = data.get('procedures', [])
         location = data.get('location', 'New York')
+        filters = data.get('filters')
+        limit = data.get('limit')
+        offset = data.get('offset', 0)
+        sort_by = data.get('sort_by')
+        weights = data.get('weights')
+        
+        try:
+            check_procedures(procedures)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if limit is not None and (isinstance(limit, bool) or not isinstance(limit, int) or limit < 1):
+            return jsonify({'error': 'limit should be a whole number of at least 1'}), 400
+        if isinstance(offset, bool) or not isinstance(offset, int) or offset < 0:
+            return jsonify({'error': 'offset should be a whole number of at least 0'}), 400
+        
+        # Get hospital comparison data, limited to hospitals matching the optional filters and
+        # ranked by price unless sort_by/weights say otherwise; with a limit only that page is
+        # built, and count says how many hospitals matched
+        try:
+            if limit is None:
+                hospital_comparison = hospital_data_manager.compare_hospitals(
+                    procedures, location, filters, offset=offset, sort_by=sort_by, weights=weights)
+            else:
+                page = hospital_data_manager.compare_hospitals_page(
+                    procedures, location, filters, limit, offset, sort_by=sort_by, weights=weights)
+                hospital_comparison = page['hospitals']
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        if not procedures:
-            return jsonify({'error': 'No procedures provided'}), 400
-        
-        # Get hospital comparison data
-        hospital_comparison = hospital_data_manager.compare_hospitals(procedures, location)
-        
-        return jsonify({
+        response = {
             'hospitals': hospital_comparison,
             'location': location,
             'timestamp': datetime.now().isoformat()
+        }
+        if limit is not None:
+            response['count'] = page['count']
+        return jsonify(response)
+    
+    except Exception as e:
+        return jsonify({'error': f'Hospital comparison failed: {str(e)}'}), 500
+
+@app.route('/api/compare-hospitals/batch', methods=['POST'])
+def compare_hospitals_batch():
+    """Compare hospital prices for many queries in one call, answered in input order
+    
+    Each query takes the /api/compare-hospitals fields. With "stream": true (or an
+    application/x-ndjson Accept header) results are streamed as one JSON line per query.
+    """
+    try:
+        data = request.get_json()
+        queries = data.get('queries')
+        
+        if not isinstance(queries, list) or not queries:
+            return jsonify({'error': 'No queries provided'}), 400
+        if len(queries) > MAX_BATCH_QUERIES:
+            return jsonify({'error': f'At most {MAX_BATCH_QUERIES} queries can be sent in one batch'}), 400
+        
+        if data.get('stream') or request.accept_mimetypes.best == 'application/x-ndjson':
+            def generate():
+                try:
+                    for entry in hospital_data_manager.iter_compare_hospitals_batch(queries, BATCH_STREAM_CHUNK):
+                        yield json.dumps(entry, default=json_default) + "\n"
+                except Exception as e:
+                    yield json.dumps({'error': f'Hospital comparison failed: {str(e)}'}) + "\n"
+            return Response(generate(), mimetype='application/x-ndjson')
+        
+        return jsonify({
+            'results': hospital_data_manager.compare_hospitals_batch(queries),
+            'timestamp': datetime.now().isoformat()
         })
     
     except Exception as e:
         return jsonify({'error': f'Hospital comparison failed: {str(e)}'}), 500
 
+@app.route('/api/cheapest-hospitals', methods=['POST'])
+def cheapest_hospitals():
+    """Cheapest hospitals for a procedure set in one state, or nationwide when no state is given"""
+    try:
+        data = request.get_json()
+        procedures = data.get('procedures', [])
+        state = data.get('state') or None
+        limit = data.get('limit', 10)
+        price = data.get('price', 'cash_price')
+        
+        try:
+            check_procedures(procedures)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if isinstance(limit, bool) or not isinstance(limit, int) or not 1 <= limit <= 100:
+            return jsonify({'error': 'limit should be a whole number from 1 to 100'}), 400
+        
+        try:
+            hospitals = hospital_data_manager.cheapest_in_region(procedures, state, limit, price, data.get('filters'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        return jsonify({
+            'hospitals': hospitals,
+            'scope': state or 'nationwide',
+            'timestamp': datetime.now().isoformat()
+        })
+    
+    except Exception as e:
+        return jsonify({'error': f'Cheapest hospital search failed: {str(e)}'}), 500
+
+@app.route('/api/hospitals/<hospital_id>')
+def hospital_details(hospital_id):
+    """Full record of one hospital, by id, from anywhere in the dataset"""
+    try:
+        match = hospital_data_manager.get_hospital(hospital_id)
+        if match is None:
+            return jsonify({'error': f'Hospital not found: {hospital_id}'}), 404
+        
+        (state, city), hospital = match
+        return jsonify({
+            'hospital': public_hospital(hospital),
+            'state': state,
+            'city': city,
+            'timestamp': datetime.now().isoformat()
+        })
+    
+    except Exception as e:
+        return jsonify({'error': f'Hospital lookup failed: {str(e)}'}), 500
+
+@app.route('/api/hospitals')
+def find_hospitals():
+    """Every hospital with a given name, ignoring case and punctuation"""
+    try:
+        name = request.args.get('name', '')
+        if not name:
+            return jsonify({'error': 'No hospital name provided'}), 400
+        
+        matches = hospital_data_manager.find_hospitals_by_name(name)
+        return jsonify({
+            'hospitals': [{'hospital': public_hospital(hospital), 'state': state, 'city': city}
+                          for (state, city), hospital in matches],
+            'timestamp': datetime.now().isoformat()
+        })
+    
+    except Exception as e:
+        return jsonify({'error': f'Hospital lookup failed: {str(e)}'}), 500
+
 @app.route('/api/analyze-insurance', methods=['POST'])
 def analyze_insurance():
     """Analyze insurance coverage vs out-of-pocket costs"""
@@ -86,6 +274,11 @@ def analyze_insurance():
         if not procedures or not insurance_plan:
             return jsonify({'error': 'Missing required information'}), 400
         
+        # A hospital given by id or name is looked up, preferring one in the given location
+        if isinstance(hospital, str):
+            details = hospital_data_manager.get_hospital_details(hospital, data.get('location'))
+            hospital = public_hospital(details) if details is not None else {'name': hospital}
+        
         # Analyze insurance coverage
         coverage_analysis = insurance_analyzer.analyze_coverage(
             procedures, insurance_plan, hospital
@@ -141,7 +334,8 @@ def handle_initial_form():
         # Generate a response based on form data
         if location and procedure:
             # If we have both location and procedure, get pricing
-            hospitals = hospital_data_manager.compare_hospitals([procedure], location)
+            comparison = hospital_data_manager.compare_hospitals_page([procedure], location, limit=5)
+            hospitals = comparison['hospitals']
             
             response_msg = f"Thank you for providing your information!\n\n"
             response_msg += f"📍 **Location:** {location}\n"
@@ -152,8 +346,8 @@ def handle_initial_form():
                 response_msg += f"🏥 **Insurance:** Not provided\n\n"
             
             if hospitals:
-                cheapest = hospitals[0]
-                most_expensive = hospitals[-1]
+                cheapest = comparison['cheapest']
+                most_expensive = comparison['most_expensive']
                 
                 response_msg += f"**💰 Price Analysis for {procedure} in {location}:**\n"
                 response_msg += f"• Best Price: ${cheapest['total_cash_cost']} at {cheapest['hospital']['name']}\n"
@@ -172,7 +366,7 @@ def handle_initial_form():
                     'response': {
                         'type': 'form_analysis',
                         'message': response_msg,
-                        'hospitals': hospitals[:5],
+                        'hospitals': hospitals,
                         'location': location,
                         'procedure': procedure,
                         'insurance': insurance
@@ -475,13 +669,46 @@ def extract_procedures_from_message(message_lower):
     
     return found_procedures if found_procedures else ['Physical examination']
 
+@app.route('/api/admin/reload-data', methods=['POST'])
+def reload_data():
+    """Reload pricing data from disk and swap the new snapshot in atomically"""
+    admin_token = os.getenv('ADMIN_TOKEN')
+    if not admin_token or request.headers.get('X-Admin-Token') != admin_token:
+        return jsonify({'error': 'Unauthorized'}), 403
+    if hospital_store is not None:
+        return jsonify({'error': 'Hospital data is served from HOSPITAL_DB; rebuild it and restart to reload'}), 409
+    
+    try:
+        previous_version = get_dataset().version
+        
+        # By default the new snapshot is built in the background; ?wait=true blocks until it is live
+        if request.args.get('wait', '').lower() == 'true':
+            snapshot = reload_dataset()
+            return jsonify({
+                'status': 'reloaded' if snapshot.version != previous_version else 'unchanged',
+                'previous_version': previous_version,
+                'dataset_version': snapshot.version,
+                'timestamp': datetime.now().isoformat()
+            })
+        
+        reload_dataset_async()
+        return jsonify({
+            'status': 'reloading',
+            'previous_version': previous_version,
+            'timestamp': datetime.now().isoformat()
+        }), 202
+    
+    except Exception as e:
+        return jsonify({'error': f'Data reload failed: {str(e)}'}), 500
+
 @app.route('/api/health')
 def health_check():
     """Health check endpoint"""
     return jsonify({
         'status': 'healthy',
         'timestamp': datetime.now().isoformat(),
-        'version': '1.0.0'
+        'version': '1.0.0',
+        'dataset_version': get_dataset().version
     })
 
 if __name__ == '__main__':
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Pricing Benchmark for FinHealth Bot
+Times compare_hospitals with the per-hospital dict loop and the NumPy kernel
+
+Usage:
+    python benchmark_pricing.py                   # cities of 8, 50 and 500 hospitals
+    python benchmark_pricing.py 20 200 2000       # other city sizes
+
+Cities are made of hospitals from data/hospital_pricing_data.json with jittered prices.
+Every engine's output is checked against the dict loop before it is timed.
+"""
+
+import json
+import random
+import sys
+import time
+from dataset import DatasetSnapshot
+from hospital_data import HospitalDataManager
+from records import json_default
+from vector_pricing import HAVE_NUMPY
+
+SOURCE_FILE = 'data/hospital_pricing_data.json'
+DEFAULT_SIZES = (8, 50, 500)
+PROCEDURES = ['MRI', 'CT scan', 'X-ray', 'Blood tests', 'ECG']
+REPEATS = 7          # timing rounds per engine; the fastest is reported, as timeit suggests
+ROUND_SECONDS = 0.1  # length of each round
+
+
+def synthetic_city(hospitals, size, rng):
+    """size copies of source hospitals with prices scaled by up to 30% either way"""
+    city = []
+    for number in range(size):
+        hospital = json.loads(json.dumps(rng.choice(hospitals)))
+        hospital['id'] = f"bench_hospital_{number:05d}"
+        for prices in hospital['procedures'].values():
+            scale = rng.uniform(0.7, 1.3)
+            for key in ('base_price', 'cash_price', 'insurance_price'):
+                if key in prices:
+                    prices[key] = round(prices[key] * scale, 2)
+            prices.pop('savings_cash', None)
+        city.append(hospital)
+    return city
+
+
+def time_call(call):
+    """Microseconds per call in the fastest of REPEATS rounds, after one warm-up call"""
+    call()
+    best = None
+    for _ in range(REPEATS):
+        calls = 0
+        started = time.perf_counter()
+        while True:
+            call()
+            calls += 1
+            elapsed = time.perf_counter() - started
+            if elapsed >= ROUND_SECONDS:
+                break
+        best = min(best or elapsed / calls, elapsed / calls)
+    return best * 1e6
+
+
+def rank_by_dicts(hospitals, procedures):
+    """Rows by total cash price read from the procedure dicts, as the per-hospital loop ranks them"""
+    totals = []
+    for hospital in hospitals:
+        hospital_procedures = hospital['procedures']
+        total = 0
+        for procedure in procedures:
+            if procedure in hospital_procedures:
+                total += hospital_procedures[procedure]['cash_price']
+        totals.append(round(total, 2))
+    return sorted(range(len(hospitals)), key=totals.__getitem__)
+
+
+def print_header(engines):
+    print(f"{'hospitals':>10}" + "".join(f"{name:>12}" for name, _ in engines) + f"{'speedup':>10}")
+
+
+def print_timings(size, timings):
+    """One table row; speedup is the dict engine's time over the last engine's"""
+    print(f"{size:>10}" + "".join(f"{timing:>12.1f}" for timing in timings) + f"{timings[0] / timings[-1]:>9.1f}x")
+
+
+def main(args):
+    sizes = [int(arg) for arg in args] or list(DEFAULT_SIZES)
+    with open(SOURCE_FILE, 'r') as f:
+        source = json.load(f)
+    hospitals = [hospital for city in source['hospitals'].values() for hospital in city]
+    rng = random.Random(42)
+    snapshot = DatasetSnapshot({"hospitals": {f"Bench {size}": synthetic_city(hospitals, size, rng) for size in sizes}})
+
+    engines = [("dict", HospitalDataManager(snapshot))]
+    if HAVE_NUMPY:
+        engines.append(("numpy", HospitalDataManager(snapshot, vectorized=True)))
+    else:
+        print("NumPy is not installed; timing the dict engine only\n")
+    for _, manager in engines:
+        manager.warm_indexes()
+
+    for size in sizes:
+        location = f"Bench {size}"
+        expected = json.dumps(engines[0][1].compare_hospitals(PROCEDURES, location), default=json_default)
+        for name, manager in engines[1:]:
+            if json.dumps(manager.compare_hospitals(PROCEDURES, location), default=json_default) != expected:
+                print(f"❌ {name} results differ from the dict engine for {size} hospitals")
+                return 1
+
+    print(f"Pricing and ranking {len(PROCEDURES)} procedures, microseconds per city\n")
+    print_header(engines)
+    for size in sizes:
+        location_key, hospitals = engines[0][1]._locate_city(snapshot, f"Bench {size}")
+        kernels = [lambda: rank_by_dicts(hospitals, PROCEDURES)]
+        if HAVE_NUMPY:
+            matrix = engines[1][1].get_vector_matrix(location_key, hospitals)
+            kernels.append(lambda: matrix.rank(matrix.cents(matrix.cash_totals(PROCEDURES)[1])))
+        print_timings(size, [time_call(kernel) for kernel in kernels])
+
+    # Results are lazy views, so encode them to time the whole response
+    print("\ncompare_hospitals encoded as JSON, microseconds per call\n")
+    print_header(engines)
+    for size in sizes:
+        location = f"Bench {size}"
+        print_timings(size, [time_call(lambda: json.dumps(manager.compare_hospitals(PROCEDURES, location),
+                                                          default=json_default))
+                             for _, manager in engines])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Dataset Build Step for FinHealth Bot
+Validates the pricing data and precomputes every value the request path would otherwise derive
+
+Usage:
+    python build_dataset.py data/nationwide_hospital_data.json [-o built.json]
+
+The build fills in defaulted hospital fields, resolves the cash and insurance price fallbacks,
+and adds savings_cash per procedure, the estimated_wait_time text, lowercased insurance names,
+a lowercased city list and a lat/lon centroid per city. A malformed record fails the build
+with a message naming it, and the file is only rewritten when every record is valid. Data that
+was never built is built when it is loaded, with malformed records skipped, so request code
+can read every field directly.
+"""
+
+import json
+import math
+import os
+import sys
+from collections.abc import Mapping, Sequence
+from geo_index import build_location_coordinates
+
+BUILD_FORMAT = 'finhealth-built-v1'
+
+DEFAULT_CASH_DISCOUNT = 15
+DEFAULT_WAIT_TIME = 45
+CASH_PRICE_RATE = 0.85       # cash price when a procedure only lists its base price
+INSURANCE_PRICE_RATE = 0.75  # insurance price when a procedure only lists its base price
+
+
+class DatasetValidationError(ValueError):
+    """A dataset record is missing a required field or has a field of the wrong type"""
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def _is_text(value):
+    return isinstance(value, str)
+
+
+def _is_text_list(value):
+    return isinstance(value, (list, tuple)) and all(isinstance(item, str) for item in value)
+
+
+# Optional hospital fields: (field, check, expected type, default)
+HOSPITAL_FIELDS = (
+    ('rating', _is_number, 'a number', 0),
+    ('address', _is_text, 'text', ''),
+    ('phone', _is_text, 'text', ''),
+    ('emergency', lambda value: isinstance(value, bool), 'true or false', False),
+    ('specialties', _is_text_list, 'a list of names', []),
+    ('insurance_accepted', _is_text_list, 'a list of names', []),
+    ('cash_discount', _is_number, 'a number', DEFAULT_CASH_DISCOUNT),
+    ('average_wait_time', _is_number, 'a number', DEFAULT_WAIT_TIME),
+)
+
+
+def _price(prices, key, default, procedure):
+    value = prices.get(key, default)
+    if not _is_number(value) or value < 0:
+        raise DatasetValidationError(f"procedure {procedure!r} has an invalid {key}: {value!r}")
+    return value
+
+
+def build_procedure(procedure, prices):
+    """Validate one procedure's prices and resolve its fallback prices and savings"""
+    if not isinstance(prices, Mapping):
+        raise DatasetValidationError(f"procedure {procedure!r} prices are not an object")
+    if 'base_price' not in prices:
+        raise DatasetValidationError(f"procedure {procedure!r} has no base_price")
+
+    base_price = _price(prices, 'base_price', None, procedure)
+    cash_price = _price(prices, 'cash_price', base_price * CASH_PRICE_RATE, procedure)
+    built = dict(prices)
+    built['base_price'] = base_price
+    built['cash_price'] = cash_price
+    built['insurance_price'] = _price(prices, 'insurance_price', base_price * INSURANCE_PRICE_RATE, procedure)
+    built['savings_cash'] = base_price - cash_price
+    return built
+
+
+def build_hospital(hospital):
+    """Validate one hospital record and return it with defaults and derived fields filled in"""
+    if not isinstance(hospital, Mapping):
+        raise DatasetValidationError("hospital record is not an object")
+    name = hospital.get('name')
+    if not isinstance(name, str) or not name.strip():
+        raise DatasetValidationError("hospital has no name")
+
+    built = dict(hospital)
+    for field, check, expected, default in HOSPITAL_FIELDS:
+        if field not in hospital:
+            built[field] = list(default) if isinstance(default, list) else default
+        elif check(hospital[field]):
+            built[field] = list(hospital[field]) if isinstance(default, list) else hospital[field]
+        else:
+            raise DatasetValidationError(f"{name}: {field} should be {expected}, got {hospital[field]!r}")
+
+    procedures = hospital.get('procedures', {})
+    if not isinstance(procedures, Mapping):
+        raise DatasetValidationError(f"{name}: procedures should be an object")
+    try:
+        built['procedures'] = {procedure: build_procedure(procedure, prices)
+                               for procedure, prices in procedures.items()}
+    except DatasetValidationError as e:
+        raise DatasetValidationError(f"{name}: {e}") from None
+
+    built['estimated_wait_time'] = f"{built['average_wait_time']} minutes"
+    built['insurance_lower'] = [plan.lower() for plan in built['insurance_accepted']]
+    return built
+
+
+def build_locations(hospitals_data):
+    """[city_lower, state, city] for every city in data order; state is None in the flat format"""
+    locations = []
+    for key, value in hospitals_data.items():
+        if isinstance(value, Mapping):
+            locations.extend([city.lower(), key, city] for city in value)
+        else:
+            locations.append([key.lower(), None, key])
+    return locations
+
+
+def build_hospital_list(label, hospitals, errors):
+    """Build a city's hospitals, recording malformed ones in errors and leaving them out"""
+    if not isinstance(hospitals, Sequence) or isinstance(hospitals, str):
+        errors.append(f"{label}: hospitals should be a list")
+        return []
+    built = []
+    for index, hospital in enumerate(hospitals):
+        try:
+            built.append(build_hospital(hospital))
+        except DatasetValidationError as e:
+            errors.append(f"{label}[{index}]: {e}")
+    return built
+
+
+def is_dataset(data):
+    """Whether loaded JSON is pricing data, rather than a reference table such as data/zip_ranges.json"""
+    return isinstance(data, Mapping) and isinstance(data.get('hospitals'), Mapping)
+
+
+def is_built(data):
+    """Whether a dataset (or shard manifest) already went through the build step"""
+    return data.get('metadata', {}).get('build_format') == BUILD_FORMAT
+
+
+def build_dataset(data, strict=True):
+    """Validate a dataset and return (built_data, errors)
+
+    With strict=True any malformed record raises DatasetValidationError listing
+    every problem; otherwise malformed records are left out and reported in errors.
+    """
+    errors = []
+    hospitals = {}
+    for key, value in data.get('hospitals', {}).items():
+        if isinstance(value, Mapping):
+            hospitals[key] = {city: build_hospital_list(f"{key}/{city}", city_hospitals, errors)
+                              for city, city_hospitals in value.items()}
+        else:
+            hospitals[key] = build_hospital_list(key, value, errors)
+
+    if strict and errors:
+        raise DatasetValidationError(f"{len(errors)} malformed records:\n  " + "\n  ".join(errors))
+
+    built = dict(data)
+    built['hospitals'] = hospitals
+    built['locations'] = build_locations(hospitals)
+    built['location_coordinates'] = build_location_coordinates(built['locations'], data.get('city_coordinates'))
+    built['metadata'] = dict(data.get('metadata', {}), build_format=BUILD_FORMAT)
+    return built, errors
+
+
+def ensure_built(data, source='dataset'):
+    """Return the data unchanged when it is already built, otherwise build it leniently"""
+    if is_built(data):
+        return data
+    built, errors = build_dataset(data, strict=False)
+    if errors:
+        print(f"Skipped {len(errors)} malformed records in {source}: {errors[0]}")
+    return built
+
+
+def main(args):
+    """Validate and build each dataset file, rewriting it only when every record is valid"""
+    output = None
+    if '-o' in args:
+        position = args.index('-o')
+        output = args[position + 1]
+        args = args[:position] + args[position + 2:]
+    if not args:
+        print("Usage: python build_dataset.py data/*.json [-o output.json]")
+        return 1
+
+    status = 0
+    for path in args:
+        with open(path, 'r') as f:
+            data = json.load(f)
+        if not is_dataset(data):
+            print(f"Skipping {path}: it holds no hospitals")
+            continue
+        try:
+            built, _ = build_dataset(data)
+        except DatasetValidationError as e:
+            print(f"❌ {path}: {e}")
+            status = 1
+            continue
+
+        output_path = output or path
+        tmp_path = output_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(built, f, indent=2)
+        os.replace(tmp_path, output_path)
+        hospital_count = sum(len(value) if not isinstance(value, Mapping) else
+                             sum(len(city) for city in value.values())
+                             for value in built['hospitals'].values())
+        print(f"✅ Built {path} -> {output_path} ({hospital_count:,} hospitals, {len(built['locations']):,} locations)")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
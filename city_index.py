@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+City Name Index for FinHealth Bot
+Resolves user-typed city names to dataset locations with constant-time keyed lookups
+
+Names that do not match exactly go through search(), which ranks cities named inside the
+query, prefix and substring matches and misspellings. Prefixes come from a sorted name list
+(a flat trie) and substring and typo candidates from a trigram index, so a search only looks
+at names sharing part of the query instead of scanning every city.
+"""
+
+import re
+from bisect import bisect_left
+from collections import Counter
+
+# Common alternative names for dataset cities; aliases whose city is not in the data are ignored
+CITY_ALIASES = {
+    "nyc": "New York",
+    "new york city": "New York",
+    "manhattan": "New York",
+    "brooklyn": "New York",
+    "la": "Los Angeles",
+    "sf": "San Francisco",
+    "san fran": "San Francisco",
+    "philly": "Philadelphia",
+    "vegas": "Las Vegas",
+    "nola": "New Orleans",
+    "okc": "Oklahoma City",
+    "slc": "Salt Lake City",
+    "kc": "Kansas City",
+}
+
+US_STATES = {
+    "AL": "Alabama", "AK": "Alaska", "AZ": "Arizona", "AR": "Arkansas", "CA": "California",
+    "CO": "Colorado", "CT": "Connecticut", "DE": "Delaware", "DC": "District of Columbia",
+    "FL": "Florida", "GA": "Georgia", "HI": "Hawaii", "ID": "Idaho", "IL": "Illinois",
+    "IN": "Indiana", "IA": "Iowa", "KS": "Kansas", "KY": "Kentucky", "LA": "Louisiana",
+    "ME": "Maine", "MD": "Maryland", "MA": "Massachusetts", "MI": "Michigan", "MN": "Minnesota",
+    "MS": "Mississippi", "MO": "Missouri", "MT": "Montana", "NE": "Nebraska", "NV": "Nevada",
+    "NH": "New Hampshire", "NJ": "New Jersey", "NM": "New Mexico", "NY": "New York",
+    "NC": "North Carolina", "ND": "North Dakota", "OH": "Ohio", "OK": "Oklahoma", "OR": "Oregon",
+    "PA": "Pennsylvania", "RI": "Rhode Island", "SC": "South Carolina", "SD": "South Dakota",
+    "TN": "Tennessee", "TX": "Texas", "UT": "Utah", "VT": "Vermont", "VA": "Virginia",
+    "WA": "Washington", "WV": "West Virginia", "WI": "Wisconsin", "WY": "Wyoming",
+}
+
+# Spelled-out and abbreviated name parts that should match each other
+_TOKEN_FORMS = {"saint": "st", "fort": "ft", "mount": "mt"}
+
+_SEPARATORS = re.compile(r"[\W_]+")
+
+MIN_PARTIAL_LENGTH = 3  # shorter queries only match exactly or as a word of the query
+MAX_CANDIDATES = 200    # names examined per prefix, substring and typo pass, bounding search time
+
+
+def normalize_city_name(name):
+    """Normalized form used as an index key: "St. Louis" and "Saint Louis" both become "st louis" """
+    name = name.lower().replace("'", "")
+    tokens = [token for token in _SEPARATORS.split(name) if token]
+    return " ".join(_TOKEN_FORMS.get(token, token) for token in tokens)
+
+
+# Normalized state names and postal abbreviations -> state name
+_STATE_KEYS = {}
+for _abbreviation, _state in US_STATES.items():
+    _STATE_KEYS[_abbreviation.lower()] = _state
+    _STATE_KEYS[_state.lower()] = _state
+_MAX_STATE_WORDS = max(len(state.split()) for state in US_STATES.values())
+
+
+def state_name(name):
+    """Full name of a state given by name or postal abbreviation ("TX", "texas"), or None"""
+    return _STATE_KEYS.get(normalize_city_name(name))
+
+
+def split_state(name):
+    """Split "Portland, OR" or "Columbus Georgia" into ("Portland", "Oregon")
+
+    Abbreviations are only recognised after a comma, since "me", "in" or "or" are
+    also ordinary words. Returns (name, None) when no state is given.
+    """
+    if "," in name:
+        city, qualifier = name.rsplit(",", 1)
+        state = _STATE_KEYS.get(" ".join(qualifier.lower().split()))
+        if state and city.strip():
+            return city.strip(), state
+    words = name.split()
+    for size in range(min(_MAX_STATE_WORDS, len(words) - 1), 0, -1):
+        qualifier = " ".join(words[-size:]).lower()
+        if len(qualifier) > 2 and qualifier in _STATE_KEYS:
+            return " ".join(words[:-size]), _STATE_KEYS[qualifier]
+    return name, None
+
+
+def _trigrams(name):
+    padded = f" {name} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _max_typos(query):
+    """Edit distance a query of this length may be off by"""
+    if len(query) < 4:
+        return 0
+    return 1 if len(query) <= 6 else 2
+
+
+def bounded_edit_distance(a, b, limit):
+    """Levenshtein distance between a and b, or None when it is larger than limit"""
+    if abs(len(a) - len(b)) > limit:
+        return None
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if min(current) > limit:
+            return None
+        previous = current
+    return previous[-1] if previous[-1] <= limit else None
+
+
+class CityIndex:
+    """Normalized city name -> [(state, city), ...] for every location of a dataset
+
+    Locations keep data order, so the first entry is the city the old linear scan
+    found first; state is None for the flat dataset format. Aliases put the
+    locations of the city they name ahead of any real city with the alias's name.
+    """
+
+    def __init__(self, locations):
+        self._names = {}
+        self._state_names = {}
+        for _, state, city in locations:
+            key = normalize_city_name(city)
+            self._names.setdefault(key, []).append((state, city))
+            self._state_names.setdefault((key, state), (state, city))
+
+        # Alias keys whose first candidate is the alias's own city
+        self._aliases = set()
+        for alias, city in CITY_ALIASES.items():
+            targets = self._names.get(normalize_city_name(city))
+            if not targets:
+                continue
+            # The alias's city comes first; a real city of that name (Manhattan, KS) follows it
+            # and is still found state-qualified ("Manhattan, KS")
+            key = normalize_city_name(alias)
+            others = [location for location in self._names.get(key, []) if location not in targets]
+            self._names[key] = list(targets) + others
+            self._aliases.add(key)
+
+        self._order = {key: position for position, key in enumerate(self._names)}
+        self._sorted_names = sorted(self._names)
+        self._max_words = max((len(key.split()) for key in self._names), default=0)
+        self._trigram_names = {}
+        for key in self._names:
+            for gram in _trigrams(key):
+                self._trigram_names.setdefault(gram, []).append(key)
+
+    def lookup(self, name):
+        """(state, city) of the best exact or alias match, or None
+
+        An alias names its city; otherwise a city spelled exactly as given wins over
+        one that only normalizes the same.
+        """
+        key = normalize_city_name(name)
+        candidates = self._names.get(key)
+        if not candidates:
+            return None
+        if key in self._aliases:
+            return candidates[0]
+        name_lower = name.lower()
+        for state, city in candidates:
+            if city.lower() == name_lower:
+                return state, city
+        return candidates[0]
+
+    def lookup_in_state(self, name, state):
+        """(state, city) of the city with this name in one state, or None
+
+        Flat datasets have no states, so any of their cities matches.
+        """
+        key = normalize_city_name(name)
+        location = self._state_names.get((key, state)) or self._state_names.get((key, None))
+        if location is None:
+            # Aliases ("nyc, ny") only live in the name index
+            location = next((candidate for candidate in self._names.get(key, ())
+                             if candidate[0] in (state, None)), None)
+        return location
+
+    def resolve(self, name, search=True):
+        """Best (state, city) for a query, or None
+
+        A state-qualified query ("Portland, OR") only matches cities in that state,
+        so a town without data ("Waco, TX") gives None rather than a look-alike
+        elsewhere. Otherwise the exact or alias match wins, then the top search result;
+        search=False stops at exact and alias matches.
+        """
+        location = self.lookup(name)
+        if location is not None:
+            return location
+
+        city, state = split_state(name)
+        if state is not None:
+            location = self.lookup_in_state(city, state)
+            if location is None and search:
+                matches = self.search(city, limit=1, state=state)
+                location = matches[0] if matches else None
+            return location
+        if not search:
+            return None
+        matches = self.search(name, limit=1)
+        return matches[0] if matches else None
+
+    def search(self, name, limit=5, state=None):
+        """Ranked (state, city) matches for a query that may be partial or misspelled
+
+        Exact matches come first, then cities named inside the query ("dallas tx"),
+        names starting with the query, names containing it and finally names within
+        one or two typos. Ties keep data order. A state limits results to cities
+        in that state.
+        """
+        query = normalize_city_name(name)
+        if not query:
+            return []
+
+        ranks = {}
+
+        def add(key, rank):
+            if key not in ranks or rank < ranks[key]:
+                ranks[key] = rank
+
+        if query in self._names:
+            add(query, (0, 0, 0))
+
+        words = query.split()
+        for size in range(min(len(words), self._max_words), 0, -1):
+            for start in range(len(words) - size + 1):
+                span = " ".join(words[start:start + size])
+                if span in self._names:
+                    add(span, (1, 0, -len(span)))
+
+        if len(query) >= MIN_PARTIAL_LENGTH:
+            position = bisect_left(self._sorted_names, query)
+            for key in self._sorted_names[position:position + MAX_CANDIDATES]:
+                if not key.startswith(query):
+                    break
+                # Whole-word prefixes ("san" -> San Jose) rank above mid-word ones (Sandy)
+                add(key, (2, key[len(query):len(query) + 1] not in ("", " "), len(key) - len(query)))
+
+            max_typos = _max_typos(query)
+            shared = Counter()
+            for gram in _trigrams(query):
+                shared.update(self._trigram_names.get(gram, ()))
+            for key, _ in shared.most_common(MAX_CANDIDATES):
+                if query in key:
+                    add(key, (3, 0, len(key) - len(query)))
+                elif max_typos:
+                    distance = bounded_edit_distance(query, key, max_typos)
+                    if distance is not None:
+                        add(key, (4, 0, distance))
+
+        results = []
+        for key in sorted(ranks, key=lambda key: (ranks[key], self._order[key])):
+            for location in self._names[key]:
+                if state is not None and location[0] not in (state, None):
+                    continue
+                if location not in results:
+                    results.append(location)
+                if len(results) >= limit:
+                    return results
+        return results
+
+    def candidates(self, name):
+        """Every (state, city) whose name or alias matches exactly
+
+        A state-qualified name ("Columbus, GA") gives the one city in that state, or
+        every city of that name when the state has none.
+        """
+        candidates = self._names.get(normalize_city_name(name))
+        if candidates:
+            return list(candidates)
+        city, state = split_state(name)
+        if state is None:
+            return []
+        location = self.lookup_in_state(city, state)
+        return [location] if location is not None else list(self._names.get(normalize_city_name(city), ()))
+
+    def __len__(self):
+        return len(self._names)
@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+"""
+Compiled Dataset Format for FinHealth Bot
+Compiles the JSON pricing data into a compact binary artifact that is memory-mapped at startup
+
+Usage:
+    python compile_dataset.py data/*.json
+
+Each dataset file is written next to itself with the .fhdb extension; JSON files that hold
+no hospitals, such as the reference tables in data/, are skipped. The artifact holds
+struct-packed hospital records, an interned string table and typed price arrays, so loading
+it only maps the file instead of parsing and materialising the whole JSON document.
+"""
+
+import hashlib
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+from array import array
+from collections.abc import Sequence
+from build_dataset import ensure_built, is_dataset
+
+MAGIC = b'FHDB'
+FORMAT_VERSION = 3
+COMPILED_SUFFIX = '.fhdb'
+
+# Header flags
+FLAG_NESTED = 1  # hospitals are grouped as state -> city -> hospitals
+
+NONE = 0xFFFFFFFF  # missing string id / missing list
+
+SECTIONS = (
+    'string_offsets', 'string_blob', 'locations', 'hospitals', 'list_pool',
+    'price_procedures', 'price_base', 'price_insurance', 'price_cash', 'price_savings',
+    'price_int_flags', 'meta'
+)
+# magic, format version, flags, content version (hex digest prefix), section offsets and lengths
+HEADER = struct.Struct('<4sHH12s' + 'QQ' * len(SECTIONS))
+VERSION_LENGTH = 12
+LOCATION = struct.Struct('<IIII')
+# id, name, address, phone, extra, rating, cash_discount, average_wait_time, emergency, int flags,
+# specialties (start, count), insurance_accepted (start, count), procedures (start, count)
+HOSPITAL = struct.Struct('<5I3dBB2x6I')
+
+# Hospital int flags record which numeric fields were integers in the source data
+INT_RATING, INT_CASH_DISCOUNT, INT_WAIT_TIME = 1, 2, 4
+# Price int flags, one byte per procedure row
+INT_BASE, INT_INSURANCE, INT_CASH, INT_SAVINGS = 1, 2, 4, 8
+
+HOSPITAL_KEYS = (
+    'id', 'name', 'rating', 'address', 'phone', 'emergency', 'specialties',
+    'insurance_accepted', 'cash_discount', 'average_wait_time', 'procedures'
+)
+
+
+def compiled_path_for(json_path):
+    """Path of the compiled artifact that belongs to a JSON dataset file"""
+    return os.path.splitext(json_path)[0] + COMPILED_SUFFIX
+
+
+def _number(value):
+    """Encode an optional number as a float, using NaN for missing values"""
+    return math.nan if value is None else float(value)
+
+
+class _StringTable:
+    """Interns strings so each distinct value is stored once"""
+
+    def __init__(self):
+        self.ids = {}
+        self.values = []
+
+    def add(self, value):
+        if value is None:
+            return NONE
+        string_id = self.ids.get(value)
+        if string_id is None:
+            string_id = len(self.values)
+            self.ids[value] = string_id
+            self.values.append(value)
+        return string_id
+
+
+def compile_dataset(data, output_path):
+    """Write a dataset dict to a compiled artifact, building it first if needed"""
+    data = ensure_built(data, output_path)
+    strings = _StringTable()
+    locations = bytearray()
+    hospitals = bytearray()
+    list_pool = array('I')
+    price_procedures = array('I')
+    price_base = array('d')
+    price_insurance = array('d')
+    price_cash = array('d')
+    price_savings = array('d')
+    price_int_flags = array('B')
+
+    hospitals_data = data.get('hospitals', {})
+    nested = any(isinstance(value, dict) for value in hospitals_data.values())
+
+    if nested:
+        groups = [(state, city, city_hospitals)
+                  for state, cities in hospitals_data.items()
+                  for city, city_hospitals in cities.items()]
+    else:
+        groups = [(None, city, city_hospitals) for city, city_hospitals in hospitals_data.items()]
+
+    hospital_count = 0
+    for state, city, city_hospitals in groups:
+        locations += LOCATION.pack(strings.add(state), strings.add(city), hospital_count, len(city_hospitals))
+
+        for hospital in city_hospitals:
+            extra = {key: value for key, value in hospital.items() if key not in HOSPITAL_KEYS}
+
+            int_flags = 0
+            for key, flag in (('rating', INT_RATING), ('cash_discount', INT_CASH_DISCOUNT),
+                              ('average_wait_time', INT_WAIT_TIME)):
+                if isinstance(hospital.get(key), int):
+                    int_flags |= flag
+
+            lists = []
+            for key in ('specialties', 'insurance_accepted'):
+                values = hospital.get(key)
+                if values is None:
+                    lists.extend((0, NONE))
+                else:
+                    lists.extend((len(list_pool), len(values)))
+                    list_pool.extend(strings.add(value) for value in values)
+
+            procedures = hospital.get('procedures')
+            if procedures is None:
+                lists.extend((0, NONE))
+            else:
+                lists.extend((len(price_procedures), len(procedures)))
+                for procedure, prices in procedures.items():
+                    row_flags = 0
+                    for key, flag in (('base_price', INT_BASE), ('insurance_price', INT_INSURANCE),
+                                      ('cash_price', INT_CASH), ('savings_cash', INT_SAVINGS)):
+                        if isinstance(prices.get(key), int):
+                            row_flags |= flag
+                    price_procedures.append(strings.add(procedure))
+                    price_base.append(_number(prices.get('base_price')))
+                    price_insurance.append(_number(prices.get('insurance_price')))
+                    price_cash.append(_number(prices.get('cash_price')))
+                    price_savings.append(_number(prices.get('savings_cash')))
+                    price_int_flags.append(row_flags)
+
+            emergency = hospital.get('emergency')
+            hospitals += HOSPITAL.pack(
+                strings.add(hospital.get('id')),
+                strings.add(hospital.get('name')),
+                strings.add(hospital.get('address')),
+                strings.add(hospital.get('phone')),
+                strings.add(json.dumps(extra)) if extra else NONE,
+                _number(hospital.get('rating')),
+                _number(hospital.get('cash_discount')),
+                _number(hospital.get('average_wait_time')),
+                2 if emergency is None else int(bool(emergency)),
+                int_flags,
+                *lists
+            )
+            hospital_count += 1
+
+    encoded = [value.encode('utf-8') for value in strings.values]
+    string_offsets = array('I', [0])
+    for value in encoded:
+        string_offsets.append(string_offsets[-1] + len(value))
+
+    meta = {key: value for key, value in data.items() if key != 'hospitals'}
+
+    typed_arrays = (string_offsets, list_pool, price_procedures, price_base,
+                    price_insurance, price_cash, price_savings, price_int_flags)
+    if sys.byteorder != 'little':
+        for typed in typed_arrays:
+            typed.byteswap()
+
+    payloads = {
+        'string_offsets': string_offsets.tobytes(),
+        'string_blob': b''.join(encoded),
+        'locations': bytes(locations),
+        'hospitals': bytes(hospitals),
+        'list_pool': list_pool.tobytes(),
+        'price_procedures': price_procedures.tobytes(),
+        'price_base': price_base.tobytes(),
+        'price_insurance': price_insurance.tobytes(),
+        'price_cash': price_cash.tobytes(),
+        'price_savings': price_savings.tobytes(),
+        'price_int_flags': price_int_flags.tobytes(),
+        'meta': json.dumps(meta).encode('utf-8'),
+    }
+
+    # Lay the sections out back to back, each aligned to 8 bytes
+    table = []
+    offset = HEADER.size
+    digest = hashlib.sha1()
+    for name in SECTIONS:
+        offset += -offset % 8
+        table.extend((offset, len(payloads[name])))
+        offset += len(payloads[name])
+        digest.update(payloads[name])
+    # Stored in the header so loading never reads the whole file to version it
+    version = digest.hexdigest()[:VERSION_LENGTH].encode('ascii')
+
+    tmp_path = output_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, FLAG_NESTED if nested else 0, version, *table))
+        for name in SECTIONS:
+            f.write(b'\0' * (-f.tell() % 8))
+            f.write(payloads[name])
+    os.replace(tmp_path, output_path)
+
+    return {
+        'hospitals': hospital_count,
+        'locations': len(groups),
+        'strings': len(strings.values),
+        'price_rows': len(price_procedures),
+        'bytes': os.path.getsize(output_path)
+    }
+
+
+class CompiledDataset:
+    """Read-only, memory-mapped view of a compiled dataset artifact"""
+
+    def __init__(self, path):
+        if sys.byteorder != 'little':
+            raise ValueError("compiled datasets can only be mapped on little-endian hosts")
+
+        self.path = path
+        with open(path, 'rb') as f:
+            self._buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        view = memoryview(self._buffer)
+        header = HEADER.unpack_from(view, 0)
+        magic, version, self.flags, content_version = header[:4]
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"{path} is not a version {FORMAT_VERSION} compiled dataset")
+
+        sections = {}
+        for i, name in enumerate(SECTIONS):
+            offset, length = header[4 + 2 * i], header[5 + 2 * i]
+            sections[name] = view[offset:offset + length]
+
+        self._string_offsets = sections['string_offsets'].cast('I')
+        self._string_blob = sections['string_blob']
+        self._locations = sections['locations']
+        self._hospitals = sections['hospitals']
+        self._list_pool = sections['list_pool'].cast('I')
+        self._price_procedures = sections['price_procedures'].cast('I')
+        self._price_base = sections['price_base'].cast('d')
+        self._price_insurance = sections['price_insurance'].cast('d')
+        self._price_cash = sections['price_cash'].cast('d')
+        self._price_savings = sections['price_savings'].cast('d')
+        self._price_int_flags = sections['price_int_flags']
+        self._meta = json.loads(bytes(sections['meta']).decode('utf-8'))
+
+        self.hospital_count = len(self._hospitals) // HOSPITAL.size
+        self.version = content_version.decode('ascii')
+        self._strings = {}
+
+    @property
+    def nested(self):
+        return bool(self.flags & FLAG_NESTED)
+
+    def string(self, string_id):
+        """Decode an interned string, caching it so repeated values share one object"""
+        if string_id == NONE:
+            return None
+        value = self._strings.get(string_id)
+        if value is None:
+            start, end = self._string_offsets[string_id], self._string_offsets[string_id + 1]
+            value = str(self._string_blob[start:end], 'utf-8')
+            self._strings[string_id] = value
+        return value
+
+    def hospital(self, index):
+        """Decode one hospital record into the JSON dict shape"""
+        (id_s, name_s, address_s, phone_s, extra_s, rating, cash_discount, wait_time,
+         emergency, int_flags, spec_start, spec_count, ins_start, ins_count,
+         price_start, price_count) = HOSPITAL.unpack_from(self._hospitals, index * HOSPITAL.size)
+
+        hospital = {}
+        for key, value in (('id', self.string(id_s)), ('name', self.string(name_s))):
+            if value is not None:
+                hospital[key] = value
+        if not math.isnan(rating):
+            hospital['rating'] = int(rating) if int_flags & INT_RATING else rating
+        for key, value in (('address', self.string(address_s)), ('phone', self.string(phone_s))):
+            if value is not None:
+                hospital[key] = value
+        if emergency != 2:
+            hospital['emergency'] = bool(emergency)
+        if spec_count != NONE:
+            hospital['specialties'] = self._string_list(spec_start, spec_count)
+        if ins_count != NONE:
+            hospital['insurance_accepted'] = self._string_list(ins_start, ins_count)
+        if not math.isnan(cash_discount):
+            hospital['cash_discount'] = int(cash_discount) if int_flags & INT_CASH_DISCOUNT else cash_discount
+        if not math.isnan(wait_time):
+            hospital['average_wait_time'] = int(wait_time) if int_flags & INT_WAIT_TIME else wait_time
+        if price_count != NONE:
+            hospital['procedures'] = self._procedures(price_start, price_count)
+        if extra_s != NONE:
+            hospital.update(json.loads(self.string(extra_s)))
+        return hospital
+
+    def _string_list(self, start, count):
+        return [self.string(string_id) for string_id in self._list_pool[start:start + count]]
+
+    def _procedures(self, start, count):
+        procedures = {}
+        for row in range(start, start + count):
+            row_flags = self._price_int_flags[row]
+            prices = {}
+            for key, column, flag in (('base_price', self._price_base, INT_BASE),
+                                      ('insurance_price', self._price_insurance, INT_INSURANCE),
+                                      ('cash_price', self._price_cash, INT_CASH),
+                                      ('savings_cash', self._price_savings, INT_SAVINGS)):
+                value = column[row]
+                if not math.isnan(value):
+                    prices[key] = int(value) if row_flags & flag else value
+            procedures[self.string(self._price_procedures[row])] = prices
+        return procedures
+
+    def to_data(self):
+        """Build the dataset dict, with lazily decoded hospital lists"""
+        hospitals = {}
+        for offset in range(0, len(self._locations), LOCATION.size):
+            state_s, city_s, first, count = LOCATION.unpack_from(self._locations, offset)
+            city_hospitals = CompiledHospitalList(self, first, count)
+            if self.nested:
+                hospitals.setdefault(self.string(state_s), {})[self.string(city_s)] = city_hospitals
+            else:
+                hospitals[self.string(city_s)] = city_hospitals
+
+        data = dict(self._meta)
+        data['hospitals'] = hospitals
+        return data
+
+
+class CompiledHospitalList(Sequence):
+    """A city's hospitals, decoded from the mapped artifact only when accessed
+
+    Each hospital is decoded once and the dict is kept, so hot hospitals are shared
+    by every request instead of being decoded again on each read.
+    """
+
+    def __init__(self, dataset, first, count):
+        self._dataset = dataset
+        self._first = first
+        self._count = count
+        self._decoded = [None] * count
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._count))]
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError('hospital index out of range')
+        hospital = self._decoded[index]
+        if hospital is None:
+            hospital = self._decoded[index] = self._dataset.hospital(self._first + index)
+        return hospital
+
+    def __repr__(self):
+        return f"<CompiledHospitalList hospitals={self._count}>"
+
+
+def main(paths):
+    """Compile each JSON dataset file given on the command line"""
+    if not paths:
+        print("Usage: python compile_dataset.py data/*.json")
+        return 1
+
+    for path in paths:
+        with open(path, 'r') as f:
+            data = json.load(f)
+        if not is_dataset(data):
+            print(f"Skipping {path}: it holds no hospitals")
+            continue
+
+        output_path = compiled_path_for(path)
+        stats = compile_dataset(data, output_path)
+        json_size = os.path.getsize(path)
+        print(f"✅ Compiled {path} -> {output_path}")
+        print(f"   🏥 {stats['hospitals']:,} hospitals in {stats['locations']:,} locations")
+        print(f"   🔤 {stats['strings']:,} interned strings, {stats['price_rows']:,} price rows")
+        print(f"   📁 {json_size:,} bytes -> {stats['bytes']:,} bytes")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -9,21 +9,23 @@ import os
 import re
 import openai
 from datetime import datetime
+from city_index import split_state
 from medical_analyzer import MedicalAnalyzer
 from hospital_data import HospitalDataManager
 from insurance_analyzer import InsuranceAnalyzer
+from zip_index import ZIP_PATTERN, zip_place
 
 class ConversationManager:
-    def __init__(self):
+    def __init__(self, medical_analyzer=None, hospital_data_manager=None, insurance_analyzer=None):
         # Initialize OpenAI
         self.openai_api_key = os.getenv('OPENAI_API_KEY')
         if self.openai_api_key:
             openai.api_key = self.openai_api_key
         
-        # Initialize other components
-        self.medical_analyzer = MedicalAnalyzer()
-        self.hospital_data_manager = HospitalDataManager()
-        self.insurance_analyzer = InsuranceAnalyzer()
+        # Reuse the caller's components when given; all of them share one dataset snapshot
+        self.medical_analyzer = medical_analyzer or MedicalAnalyzer()
+        self.hospital_data_manager = hospital_data_manager or HospitalDataManager()
+        self.insurance_analyzer = insurance_analyzer or InsuranceAnalyzer()
         
         # Enhanced conversation context tracking
         self.conversation_context = {
@@ -95,50 +97,64 @@ class ConversationManager:
         procedures = self.conversation_context.get('required_procedures')
         insurance = self.conversation_context.get('insurance_plan')
         
-        # Get hospital comparison
-        hospitals = self.hospital_data_manager.compare_hospitals(procedures, location)
+        # Get hospital comparison; a place without data gets the nearest city that has it instead of New York
+        located = self.hospital_data_manager.locate_city(location) is not None
+        comparison = self.hospital_data_manager.compare_hospitals_page(procedures, location, limit=5) if located else None
         
-        if hospitals:
-            response_msg = self._format_professional_comparison(hospitals, procedures, location, insurance)
+        if comparison and comparison['hospitals']:
+            response_msg = self._format_professional_comparison(comparison, procedures, location, insurance)
             
             return {
                 'type': 'direct_price_analysis',
                 'message': response_msg,
-                'hospitals': hospitals[:5],
+                'hospitals': comparison['hospitals'],
                 'location': location,
                 'procedures': procedures,
                 'insurance': insurance,
                 'display_format': 'table'
             }
         else:
-            # Try to find nearby major cities if exact location doesn't have data
-            if location and 'texas' in location.lower():
-                major_texas_cities = ['Houston', 'Dallas', 'Austin', 'San Antonio', 'Fort Worth', 'Lubbock']
-                for city in major_texas_cities:
-                    nearby_hospitals = self.hospital_data_manager.compare_hospitals(procedures, city)
-                    if nearby_hospitals:
-                        response_msg = f"I found pricing data for {city}, Texas (near {location}):\n\n"
-                        cheapest = nearby_hospitals[0]
-                        response_msg += f"**🏆 Best Option:** {cheapest['hospital']['name']}\n"
-                        response_msg += f"• Cash Price: ${cheapest['total_cash_cost']}\n"
-                        response_msg += f"• You Save: ${cheapest['total_savings_cash']}\n"
-                        response_msg += f"• Rating: ⭐ {cheapest['hospital']['rating']}/5\n\n"
-                        response_msg += f"Would you like to see more options in {city} or try another city?"
-                        
-                        return {
-                            'type': 'nearby_options',
-                            'message': response_msg,
-                            'hospitals': nearby_hospitals[:3],
-                            'suggested_location': city,
-                            'original_location': location
-                        }
-                        break
+            nearby = self._nearby_options(location, procedures,
+                                          "I found pricing data for {city} ({miles} miles from {location}):\n\n")
+            if nearby:
+                return nearby
             
             return {
                 'type': 'no_data_available',
                 'message': f"I couldn't find specific pricing data for {', '.join(procedures)} in {location}. Let me try a nearby major city, or you can ask about a different procedure."
             }
 
+    def _nearby_options(self, location, procedures, intro):
+        """'nearby_options' response for the closest city with data for every procedure, or None
+
+        intro is formatted with the suggested city, the original location and the distance in miles.
+        """
+        nearest = self.hospital_data_manager.nearest_cities(location, procedures, k=1)
+        if not nearest:
+            return None
+        (state, city), miles = nearest[0]
+        suggested = f"{city}, {state}" if state else city
+        nearby_hospitals = self.hospital_data_manager.compare_hospitals(procedures, suggested, limit=3)
+        if not nearby_hospitals:
+            return None
+        
+        response_msg = intro.format(city=suggested, location=location, miles=round(miles))
+        cheapest = nearby_hospitals[0]
+        response_msg += f"**🏆 Best Option:** {cheapest['hospital']['name']}\n"
+        response_msg += f"• Cash Price: ${cheapest['total_cash_cost']}\n"
+        response_msg += f"• You Save: ${cheapest['total_savings_cash']}\n"
+        response_msg += f"• Rating: ⭐ {cheapest['hospital']['rating']}/5\n\n"
+        response_msg += f"Would you like to see more options in {city} or try another city?"
+        
+        return {
+            'type': 'nearby_options',
+            'message': response_msg,
+            'hospitals': nearby_hospitals,
+            'suggested_location': suggested,
+            'original_location': location,
+            'distance_miles': miles
+        }
+
     def _analyze_conversation_flow(self, message_lower):
         """Analyze conversation flow to improve responsiveness"""
         # Track conversation patterns for better context awareness
@@ -285,6 +301,12 @@ class ConversationManager:
             r'\b(lubbock|houston|dallas|austin|san antonio|fort worth|el paso|arlington|corpus christi|plano|irving|garland|laredo|amarillo|grand prairie|brownsville|pasadena|mesquite|mckinney|frisco|killeen|waco|midland|abilene|beaumont|round rock|richardson|lewisville|college station|pearland|tyler|denton|sugar land|carrollton|edinburg|bryan|pharr|mission|missouri city|temple|flower mound|baytown|harlingen|north richland hills|mansfield|cedar park|port arthur|san angelo|league city|longview|texas city|new braunfels|conroe|the woodlands|new york|los angeles|chicago|boston|miami|seattle|denver|atlanta|philadelphia|phoenix)\b'
         ]
         
+        # ZIP codes ("near 79401") name a city, or at least a state, through the ZIP range index
+        for code in ZIP_PATTERN.findall(message_lower):
+            place = zip_place(code)
+            if place and place not in entities['cities']:
+                entities['cities'].append(place)
+        
         for pattern in city_patterns:
             matches = re.findall(pattern, message_lower)
             if matches:
@@ -296,6 +318,9 @@ class ConversationManager:
                         city_state_matches = re.findall(city_state_pattern, message_lower)
                         for city, state in city_state_matches:
                             city_name = city.strip().title()
+                            # Keep a state qualifier ("portland, or") so same-named cities can be told apart
+                            if split_state(f"{city_name}, {state}")[1]:
+                                city_name = f"{city_name}, {state}"
                             entities['cities'].append(city_name)
                     else:
                         # For single city names
@@ -421,45 +446,28 @@ class ConversationManager:
             procedures = ['Physical examination']  # Default fallback
         
         if location and procedures:
-            # Get hospital comparison
-            hospitals = self.hospital_data_manager.compare_hospitals(procedures, location)
+            # Get hospital comparison; a place without data gets the nearest city that has it instead of New York
+            located = self.hospital_data_manager.locate_city(location) is not None
+            comparison = self.hospital_data_manager.compare_hospitals_page(procedures, location, limit=5) if located else None
             
-            if hospitals:
+            if comparison and comparison['hospitals']:
                 # Use professional formatting
-                response_msg = self._format_professional_comparison(hospitals, procedures, location, insurance)
+                response_msg = self._format_professional_comparison(comparison, procedures, location, insurance)
                 
                 return {
                     'type': 'price_comparison',
                     'message': response_msg,
-                    'hospitals': hospitals[:5],  # Top 5 cheapest
+                    'hospitals': comparison['hospitals'],  # Top 5 cheapest
                     'location': location,
                     'procedures': procedures,
                     'insurance': insurance,
                     'display_format': 'table'
                 }
             else:
-                # Try to find nearby major cities if exact location doesn't have data
-                major_texas_cities = ['Houston', 'Dallas', 'Austin', 'San Antonio', 'Fort Worth', 'Lubbock']
-                if location and 'texas' in location.lower():
-                    for city in major_texas_cities:
-                        nearby_hospitals = self.hospital_data_manager.compare_hospitals(procedures, city)
-                        if nearby_hospitals:
-                            response_msg = f"I couldn't find data for {location}, but here are options in nearby {city}, Texas:\n\n"
-                            cheapest = nearby_hospitals[0]
-                            response_msg += f"**🏆 Best Option:** {cheapest['hospital']['name']}\n"
-                            response_msg += f"• Cash Price: ${cheapest['total_cash_cost']}\n"
-                            response_msg += f"• You Save: ${cheapest['total_savings_cash']}\n"
-                            response_msg += f"• Rating: ⭐ {cheapest['hospital']['rating']}/5\n\n"
-                            response_msg += f"Would you like to see more options in {city} or try another city?"
-                            
-                            return {
-                                'type': 'nearby_options',
-                                'message': response_msg,
-                                'hospitals': nearby_hospitals[:3],
-                                'suggested_location': city,
-                                'original_location': location
-                            }
-                            break
+                nearby = self._nearby_options(location, procedures,
+                                              "I couldn't find data for {location}, but here are options in nearby {city} ({miles} miles away):\n\n")
+                if nearby:
+                    return nearby
                 
                 return {
                     'type': 'no_data',
@@ -509,23 +517,29 @@ class ConversationManager:
             self.conversation_context['user_location'] = location
             self.conversation_context['required_procedures'] = procedures
             
-            # Get hospital comparison
-            hospitals = self.hospital_data_manager.compare_hospitals(procedures, location)
+            # Get hospital comparison; a place without data gets the nearest city that has it instead of New York
+            located = self.hospital_data_manager.locate_city(location) is not None
+            comparison = self.hospital_data_manager.compare_hospitals_page(procedures, location, limit=5) if located else None
             
-            if hospitals:
+            if comparison and comparison['hospitals']:
                 # Use professional formatting for complete analysis
                 insurance = self.conversation_context.get('insurance_plan')
-                response_msg = self._format_professional_comparison(hospitals, procedures, location, insurance)
+                response_msg = self._format_professional_comparison(comparison, procedures, location, insurance)
                 
                 return {
                     'type': 'complete_analysis',
                     'message': response_msg,
-                    'hospitals': hospitals[:3],
+                    'hospitals': comparison['hospitals'][:3],
                     'location': location,
                     'procedures': procedures,
                     'display_format': 'table'
                 }
             else:
+                nearby = self._nearby_options(location, procedures,
+                                              "I couldn't find data for {location}, but here are options in nearby {city} ({miles} miles away):\n\n")
+                if nearby:
+                    return nearby
+
                 return {
                     'type': 'no_data',
                     'message': f"I couldn't find pricing data for {location}. Let me try a nearby major city. What's the closest big city to you?"
@@ -604,11 +618,11 @@ class ConversationManager:
         if location:
             # Get general hospital information for the location
             procedures = ['Physical examination']  # Default procedure for hospital search
-            hospitals = self.hospital_data_manager.compare_hospitals(procedures, location)
+            hospitals = self.hospital_data_manager.compare_hospitals(procedures, location, limit=3)
             
             if hospitals:
                 response_msg = f"Here are the top hospitals in {location}:\n\n"
-                for i, hospital_data in enumerate(hospitals[:3], 1):
+                for i, hospital_data in enumerate(hospitals, 1):
                     hospital = hospital_data['hospital']
                     response_msg += f"**{i}. {hospital['name']}**\n"
                     response_msg += f"• Rating: ⭐ {hospital['rating']}/5\n"
@@ -620,7 +634,7 @@ class ConversationManager:
                 return {
                     'type': 'hospital_list',
                     'message': response_msg,
-                    'hospitals': hospitals[:3],
+                    'hospitals': hospitals,
                     'location': location
                 }
             else:
@@ -701,8 +715,13 @@ class ConversationManager:
             ]
         }
 
-    def _format_professional_comparison(self, hospitals, procedures, location, insurance=None):
-        """Format hospital comparison in professional tabular format"""
+    def _format_professional_comparison(self, comparison, procedures, location, insurance=None):
+        """Format hospital comparison in professional tabular format
+
+        comparison is a compare_hospitals_page result: the table shows its page, the
+        summary its cheapest and most expensive hospitals.
+        """
+        hospitals = comparison['hospitals']
         if not hospitals:
             return "No hospital data available for comparison."
         
@@ -711,11 +730,19 @@ class ConversationManager:
         response_msg += f"📋 **Procedure(s):** {', '.join(procedures)}\n"
         if insurance:
             response_msg += f"🛡️ **Insurance:** {insurance}\n"
-        response_msg += f"📅 **Report Date:** {datetime.now().strftime('%B %d, %Y at %I:%M %p')}\n\n"
+        response_msg += f"📅 **Report Date:** {datetime.now().strftime('%B %d, %Y at %I:%M %p')}\n"
+        
+        # Name shared by cities in several states: say which one is shown and how to pick another
+        candidates = [(state, city) for state, city in self.hospital_data_manager.city_candidates(location) if state]
+        if len(candidates) > 1:
+            others = '; '.join(f"{city}, {state}" for state, city in candidates[1:])
+            response_msg += f"📍 **Showing:** {candidates[0][1]}, {candidates[0][0]} (also: {others}). "
+            response_msg += f"Add the state, e.g. \"{candidates[1][1]}, {candidates[1][0]}\", to choose.\n"
+        response_msg += "\n"
         
         # Summary section
-        cheapest = hospitals[0]
-        most_expensive = hospitals[-1]
+        cheapest = comparison['cheapest']
+        most_expensive = comparison['most_expensive']
         total_savings = most_expensive['total_cash_cost'] - cheapest['total_cash_cost']
         
         response_msg += "📊 **EXECUTIVE SUMMARY**\n"
@@ -734,7 +761,7 @@ class ConversationManager:
         response_msg += "─" * 80 + "\n"
         
         # Table rows
-        for rank, hospital_data in enumerate(hospitals[:5], 1):
+        for rank, hospital_data in enumerate(hospitals, 1):
             hospital = hospital_data['hospital']
             name = hospital['name'][:22] + '...' if len(hospital['name']) > 25 else hospital['name']
             price = f"${hospital_data['total_cash_cost']:,}"
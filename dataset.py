@@ -0,0 +1,451 @@
+#!/usr/bin/env python3
+"""
+Shared Dataset Registry for FinHealth Bot
+Loads the hospital pricing dataset once per process and hands the same read-only snapshot to every component
+"""
+
+import gc
+import hashlib
+import itertools
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Mapping
+from types import MappingProxyType
+from compile_dataset import COMPILED_SUFFIX, CompiledDataset, compiled_path_for
+from ingest_dataset import NDJSON_SUFFIX, ingest_ndjson, ndjson_path_for
+from build_dataset import build_locations, ensure_built, is_built
+from geo_index import build_location_coordinates
+from records import RecordBuilder, compact_hospital_data
+
+NATIONWIDE_DATA_FILE = os.path.join('data', 'nationwide_hospital_data.json')
+DEFAULT_DATA_FILE = os.path.join('data', 'hospital_pricing_data.json')
+SHARD_MANIFEST_FILE = os.path.join('data', 'shards', 'manifest.json')
+
+# Rough in-memory size of a parsed shard relative to its JSON file size
+SHARD_MEMORY_FACTOR = 4
+
+
+_snapshot_counter = itertools.count(1)
+
+
+def _content_version(content):
+    """Short content hash used as a snapshot version id"""
+    return hashlib.sha1(content).hexdigest()[:12]
+
+
+class DatasetSnapshot:
+    """Immutable view of one loaded dataset, shared by reference between analyzers
+
+    Every snapshot carries a version id (a hash of the source file when loaded from
+    disk) that caches can key on; it changes whenever the pricing data changes.
+    Data that has not been through the build step is built here, so every hospital
+    carries its defaulted and derived fields.
+    """
+
+    def __init__(self, data, source=None, version=None):
+        self.source = source
+        self.version = version or f"mem-{next(_snapshot_counter)}"
+        self.loaded_at = time.time()
+        hospitals = data.get('hospitals', {})
+        if not isinstance(hospitals, ShardedHospitals):
+            data = ensure_built(data, source or 'dataset')
+            hospitals = data['hospitals']
+        # Sharded hospitals are already a read-only mapping
+        self.hospitals = hospitals if isinstance(hospitals, ShardedHospitals) else MappingProxyType(hospitals)
+        # (city_lower, state, city) per city in data order; state is None in the flat format
+        self.locations = tuple(tuple(location) for location in data.get('locations') or build_locations(hospitals))
+        # [lat, lon] or None per location; data built before coordinates existed gets them here
+        coordinates = data.get('location_coordinates')
+        if coordinates is None or len(coordinates) != len(self.locations):
+            coordinates = build_location_coordinates(self.locations, data.get('city_coordinates'))
+        self.location_coordinates = tuple(tuple(point) if point else None for point in coordinates)
+        self.insurance_plans = MappingProxyType(data.get('insurance_plans', {}))
+        self.medical_conditions = MappingProxyType(data.get('medical_conditions', {}))
+        self.metadata = MappingProxyType(data.get('metadata', {}))
+        self._derived = {}
+        self._derived_lock = threading.Lock()
+
+    def derived(self, key, build):
+        """Return a structure derived from this snapshot, building it once on first use"""
+        value = self._derived.get(key)
+        if value is None:
+            with self._derived_lock:
+                value = self._derived.get(key)
+                if value is None:
+                    value = build()
+                    self._derived[key] = value
+        return value
+
+    def __repr__(self):
+        return f"<DatasetSnapshot source={self.source!r} version={self.version} locations={len(self.locations)}>"
+
+
+class ShardedHospitals(Mapping):
+    """State -> city -> hospitals mapping backed by one JSON shard file per state
+
+    The manifest lists every state's cities, so lookups can walk states and cities
+    without touching the shards. A shard is parsed the first time one of its cities'
+    hospitals is read, and least recently used shards are evicted once the estimated
+    memory of loaded shards exceeds max_bytes (None keeps every loaded shard).
+    The budget only counts parsed shards: per-city indexes cached on the snapshot
+    (facets, rankings, price matrices) are not counted and outlive eviction.
+    Each shard is checked against the sha1 the manifest lists for it.
+    With compact=True each shard's hospitals are converted to compact records on load,
+    and with build=True shards that predate the build step are built on load.
+    """
+
+    def __init__(self, directory, states, max_bytes=None, compact=False, build=False):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._builder = RecordBuilder() if compact else None
+        self._build = build
+        self._states = states
+        self._cities = {state: _ShardCities(self, state, info['cities']) for state, info in states.items()}
+        self._loaded = OrderedDict()
+        self._loaded_bytes = 0
+        self._lock = threading.Lock()
+
+    def __getitem__(self, state):
+        return self._cities[state]
+
+    def __iter__(self):
+        return iter(self._cities)
+
+    def __len__(self):
+        return len(self._cities)
+
+    def load_state(self, state):
+        """Return a state's city -> hospitals dict, loading its shard on first use"""
+        with self._lock:
+            shard = self._loaded.get(state)
+            if shard is not None:
+                self._loaded.move_to_end(state)
+                return shard
+
+        info = self._states[state]
+        with open(os.path.join(self.directory, info['file']), 'rb') as f:
+            content = f.read()
+        if 'sha1' in info and hashlib.sha1(content).hexdigest() != info['sha1']:
+            raise ValueError(f"Shard {info['file']} does not match its manifest; regenerate the shards")
+        shard = json.loads(content)
+        if self._build:
+            shard = ensure_built({'hospitals': shard}, info['file'])['hospitals']
+        if self._builder is not None:
+            shard = compact_hospital_data(shard, self._builder)
+
+        with self._lock:
+            if state not in self._loaded:
+                self._loaded[state] = shard
+                self._loaded_bytes += info['bytes'] * SHARD_MEMORY_FACTOR
+                self._evict()
+            return self._loaded.get(state, shard)
+
+    def _evict(self):
+        """Drop least recently used shards until the memory budget is met"""
+        if self.max_bytes is None:
+            return
+        while self._loaded_bytes > self.max_bytes and len(self._loaded) > 1:
+            state, _ = self._loaded.popitem(last=False)
+            self._loaded_bytes -= self._states[state]['bytes'] * SHARD_MEMORY_FACTOR
+
+    def loaded_states(self):
+        """States whose shards are currently in memory, least recently used first"""
+        with self._lock:
+            return list(self._loaded)
+
+    def estimated_bytes(self):
+        return self._loaded_bytes
+
+
+class _ShardCities(Mapping):
+    """One state's cities; hospital lists come from the state's shard on access"""
+
+    def __init__(self, shards, state, cities):
+        self._shards = shards
+        self._state = state
+        self._city_names = cities
+
+    def __getitem__(self, city):
+        if city not in self._city_names:
+            raise KeyError(city)
+        return self._shards.load_state(self._state)[city]
+
+    def __contains__(self, city):
+        return city in self._city_names
+
+    def __iter__(self):
+        return iter(self._city_names)
+
+    def __len__(self):
+        return len(self._city_names)
+
+
+_registry_lock = threading.Lock()
+_reload_lock = threading.Lock()
+_current_dataset = None
+_snapshot_warmers = []
+
+
+def _resolve_data_file():
+    """Pick the dataset file to load, preferring the nationwide data, compiled artifacts and NDJSON
+
+    Per-state shards are opt-in: they are used only when DATA_SHARD_MEMORY_MB sets their budget.
+    """
+    if _shard_memory_budget() is not None and os.path.exists(SHARD_MANIFEST_FILE):
+        return SHARD_MANIFEST_FILE
+
+    for path in (NATIONWIDE_DATA_FILE, DEFAULT_DATA_FILE):
+        for derived_path in (compiled_path_for(path), ndjson_path_for(path)):
+            if os.path.exists(derived_path):
+                if os.path.exists(path) and os.path.getmtime(path) > os.path.getmtime(derived_path):
+                    print(f"Dataset {derived_path} is older than {path}, skipping it")
+                    continue
+                return derived_path
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def _shard_memory_budget():
+    """Memory budget for loaded shards from DATA_SHARD_MEMORY_MB, or None for no limit"""
+    budget_mb = os.getenv('DATA_SHARD_MEMORY_MB')
+    return int(float(budget_mb) * 1024 * 1024) if budget_mb else None
+
+
+def _compact_records_enabled():
+    """Hospitals are kept as compact records unless DATA_COMPACT_RECORDS is set to 0"""
+    return os.getenv('DATA_COMPACT_RECORDS', '1') != '0'
+
+
+def _prepare(data, source, compact=True):
+    """Build freshly loaded data if needed, then replace its hospital dicts with compact records
+
+    compact=False keeps the hospital lists as loaded, e.g. the lazy lists of a compiled artifact.
+    """
+    data = ensure_built(data, source)
+    if compact and _compact_records_enabled():
+        data['hospitals'] = compact_hospital_data(data.get('hospitals', {}))
+    return data
+
+
+def load_sharded_dataset(manifest_path, max_bytes=None):
+    """Load a per-state sharded dataset; only the manifest is read up front"""
+    with open(manifest_path, 'rb') as f:
+        content = f.read()
+    manifest = json.loads(content)
+
+    data = {key: value for key, value in manifest.items() if key not in ('format', 'states')}
+    data['hospitals'] = ShardedHospitals(
+        os.path.dirname(manifest_path), manifest['states'],
+        max_bytes if max_bytes is not None else _shard_memory_budget(),
+        compact=_compact_records_enabled(), build=not is_built(manifest)
+    )
+    return DatasetSnapshot(data, source=manifest_path, version=_content_version(content))
+
+
+def load_ndjson_dataset(path, progress=None):
+    """Stream an NDJSON dataset in hospital by hospital, keeping the city index it builds"""
+    to_record = RecordBuilder().hospital if _compact_records_enabled() else None
+    data, stats = ingest_ndjson(path, progress=progress, to_record=to_record)
+    snapshot = DatasetSnapshot(data, source=path, version=stats['version'])
+    snapshot.derived('city_to_state', lambda: stats['city_to_state'])
+    print(f"Streamed {stats['hospitals']:,} hospitals from {path} in {stats['seconds']:.2f}s")
+    return snapshot
+
+
+def load_dataset(path=None):
+    """Load a dataset file (JSON, NDJSON, compiled artifact or shard manifest) from disk into a new snapshot"""
+    path = path or _resolve_data_file()
+    if not path:
+        return DatasetSnapshot(_get_fallback_data(), source='fallback', version='fallback')
+
+    if os.path.basename(path) == os.path.basename(SHARD_MANIFEST_FILE):
+        try:
+            return load_sharded_dataset(path)
+        except Exception as e:
+            print(f"Error loading sharded dataset {path}: {e}")
+            path = NATIONWIDE_DATA_FILE
+
+    if path.endswith(COMPILED_SUFFIX):
+        try:
+            compiled = CompiledDataset(path)
+            # Hospitals stay in the shared memory map, decoded one at a time on access
+            return DatasetSnapshot(_prepare(compiled.to_data(), path, compact=False), source=path,
+                                   version=compiled.version)
+        except Exception as e:
+            print(f"Error mapping compiled dataset {path}: {e}")
+            path = os.path.splitext(path)[0] + '.json'
+
+    if path.endswith(NDJSON_SUFFIX):
+        try:
+            return load_ndjson_dataset(path)
+        except Exception as e:
+            print(f"Error streaming dataset {path}: {e}")
+            path = os.path.splitext(path)[0] + '.json'
+
+    try:
+        with open(path, 'rb') as f:
+            content = f.read()
+        return DatasetSnapshot(_prepare(json.loads(content), path), source=path, version=_content_version(content))
+    except Exception as e:
+        print(f"Error loading hospital data: {e}")
+        return DatasetSnapshot(_get_fallback_data(), source='fallback', version='fallback')
+
+
+def get_dataset():
+    """Return the process-wide dataset snapshot, loading it on first use"""
+    global _current_dataset
+    if _current_dataset is None:
+        with _registry_lock:
+            if _current_dataset is None:
+                _current_dataset = load_dataset()
+    return _current_dataset
+
+
+def set_dataset(snapshot):
+    """Install a snapshot as the process-wide dataset
+
+    The swap is a single reference assignment: requests that already hold the
+    previous snapshot finish on it, new requests see the new one.
+    """
+    global _current_dataset
+    with _registry_lock:
+        _current_dataset = snapshot
+    return snapshot
+
+
+def add_snapshot_warmer(warm):
+    """Have reload_dataset call warm(snapshot) on each new snapshot before installing it
+
+    Lets HospitalDataManager.warm_indexes build a reloaded snapshot's indexes off the
+    request path, so the first requests after a swap do not pay for them.
+    """
+    _snapshot_warmers.append(warm)
+    return warm
+
+
+def reload_dataset(path=None):
+    """Build a fresh snapshot from disk, warm its indexes and swap it in atomically
+
+    Returns the installed snapshot, or the current one unchanged when the data
+    on disk is identical or could not be loaded.
+    """
+    with _reload_lock:
+        current = _current_dataset
+        snapshot = load_dataset(path)
+        if snapshot.source == 'fallback' and current is not None and current.source != 'fallback':
+            print("Dataset reload failed, keeping the current snapshot")
+            return current
+        if current is not None and snapshot.version == current.version:
+            return current
+        for warm in _snapshot_warmers:
+            try:
+                warm(snapshot)
+            except Exception as e:
+                print(f"Error warming reloaded dataset {snapshot.version}: {e}")
+        print(f"Dataset reloaded from {snapshot.source} (version {snapshot.version})")
+        return set_dataset(snapshot)
+
+
+def reload_dataset_async(path=None):
+    """Reload the dataset on a background thread; returns the started thread"""
+    thread = threading.Thread(target=reload_dataset, args=(path,), name='dataset-reload', daemon=True)
+    thread.start()
+    return thread
+
+
+def freeze_loaded_objects():
+    """Move every object allocated so far out of the cyclic garbage collector's reach
+
+    Call this in a preloading server's master process after the dataset and its
+    indexes are built. Forked workers then never write the GC headers of the shared
+    dataset pages during collections, so those pages stay shared copy-on-write.
+    Returns the number of frozen objects (0 when gc.freeze is unavailable).
+    """
+    if not hasattr(gc, 'freeze'):
+        return 0
+    gc.collect()
+    gc.freeze()
+    return gc.get_freeze_count()
+
+
+class DatasetWatcher(threading.Thread):
+    """Polls the dataset files and reloads the shared snapshot when one of them changes"""
+
+    def __init__(self, interval=30, paths=None):
+        super().__init__(name='dataset-watcher', daemon=True)
+        self.interval = interval
+        self.paths = paths or [
+            SHARD_MANIFEST_FILE, NATIONWIDE_DATA_FILE, compiled_path_for(NATIONWIDE_DATA_FILE),
+            ndjson_path_for(NATIONWIDE_DATA_FILE), DEFAULT_DATA_FILE, compiled_path_for(DEFAULT_DATA_FILE),
+            ndjson_path_for(DEFAULT_DATA_FILE)
+        ]
+        self._stop_event = threading.Event()
+        self._last_seen = self._file_stamps()
+
+    def _file_stamps(self):
+        stamps = {}
+        for path in self.paths:
+            try:
+                stat = os.stat(path)
+                stamps[path] = (stat.st_mtime, stat.st_size)
+            except OSError:
+                stamps[path] = None
+        return stamps
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            stamps = self._file_stamps()
+            if stamps != self._last_seen:
+                self._last_seen = stamps
+                reload_dataset()
+
+    def stop(self):
+        self._stop_event.set()
+
+
+def _get_fallback_data():
+    """Fallback data structure used when no dataset file is available"""
+    return {
+        "hospitals": {
+            "New York": [
+                {
+                    "name": "NYC General Hospital",
+                    "rating": 4.2,
+                    "address": "123 Medical Center Dr, New York, NY",
+                    "phone": "(212) 555-1234",
+                    "emergency": True,
+                    "insurance_accepted": ["Aetna", "Blue Cross", "Cigna", "UnitedHealth"],
+                    "procedures": {
+                        "ECG": {"base_price": 250, "insurance_price": 180, "cash_price": 212}
+                    }
+                }
+            ]
+        },
+        "insurance_plans": {
+            "Aetna": {
+                "deductible": 1500,
+                "out_of_pocket_max": 3500,
+                "coverage_percent": 80
+            },
+            "Blue Cross Blue Shield": {
+                "deductible": 1000,
+                "out_of_pocket_max": 3000,
+                "coverage_percent": 75
+            },
+            "Cigna": {
+                "deductible": 1200,
+                "out_of_pocket_max": 3200,
+                "coverage_percent": 85
+            },
+            "UnitedHealth": {
+                "deductible": 2000,
+                "out_of_pocket_max": 4000,
+                "coverage_percent": 70
+            }
+        },
+        "medical_conditions": {}
+    }
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Hospital Facet Index for FinHealth Bot
+Precomputed hospital bitsets that turn filter queries into integer AND operations
+
+A bitset is a Python int where bit r is set when hospital row r (its position in the
+city's hospital list) matches. Combining filters ("accepting Aetna and Medicare") is a
+bitwise AND of the precomputed sets, and rows_of() turns the result back into rows in
+data order.
+
+Filters are a dict with any of these keys, all of which must match:
+    emergency       True or False
+    specialties     specialty names the hospital must all have (case-insensitive)
+    min_rating      lowest acceptable rating
+    max_wait_time   highest acceptable average_wait_time in minutes
+    insurance       plans the hospital must all accept (case-insensitive)
+    procedures      procedures the hospital must all offer
+"""
+
+from bisect import bisect_left, bisect_right
+from collections.abc import Mapping
+
+NAME_FILTERS = ('specialties', 'insurance', 'procedures')
+FILTER_KEYS = ('emergency', 'min_rating', 'max_wait_time') + NAME_FILTERS
+
+
+def bitset(rows, size):
+    """Bitset with the given rows set, built in one pass instead of one shift per row"""
+    data = bytearray((size + 7) // 8)
+    for row in rows:
+        data[row >> 3] |= 1 << (row & 7)
+    return int.from_bytes(data, 'little')
+
+
+def check_filters(filters):
+    """Validate a filters dict, returning a copy with single names turned into lists
+
+    Raises ValueError when filters is not a dict, or naming the first unknown key or badly typed value.
+    """
+    if filters is not None and not isinstance(filters, Mapping):
+        raise ValueError("Hospital filters should be an object")
+    checked = {}
+    for key, value in (filters or {}).items():
+        if key not in FILTER_KEYS:
+            raise ValueError(f"Unknown hospital filter: {key}")
+        if value is None:
+            continue
+        if key in NAME_FILTERS:
+            value = [value] if isinstance(value, str) else value
+            if not isinstance(value, (list, tuple)) or not all(isinstance(name, str) for name in value):
+                raise ValueError(f"Hospital filter {key} should be a list of names")
+            value = list(value)
+        elif key == 'emergency':
+            if not isinstance(value, bool):
+                raise ValueError("Hospital filter emergency should be true or false")
+        elif isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f"Hospital filter {key} should be a number")
+        checked[key] = value
+    return checked
+
+
+def rows_of(bits):
+    """Set rows of a bitset in ascending order"""
+    data = bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+    for position, byte in enumerate(data):
+        while byte:
+            low = byte & -byte
+            yield (position << 3) + low.bit_length() - 1
+            byte ^= low
+
+
+class _Threshold:
+    """Bitsets of hospitals at or above (and at or below) each distinct value of a field"""
+
+    def __init__(self, value_rows, size):
+        self.values = sorted(value_rows)
+        groups = [bitset(value_rows[value], size) for value in self.values]
+        self.at_least = groups[:]
+        self.at_most = groups[:]
+        for position in range(len(groups) - 2, -1, -1):
+            self.at_least[position] |= self.at_least[position + 1]
+        for position in range(1, len(groups)):
+            self.at_most[position] |= self.at_most[position - 1]
+
+    def minimum(self, value):
+        position = bisect_left(self.values, value)
+        return self.at_least[position] if position < len(self.values) else 0
+
+    def maximum(self, value):
+        position = bisect_right(self.values, value) - 1
+        return self.at_most[position] if position >= 0 else 0
+
+
+class HospitalFacets:
+    """Bitsets over one list of hospitals for every filter in FILTER_KEYS"""
+
+    def __init__(self, hospitals):
+        name_rows = {key: {} for key in NAME_FILTERS}
+        emergency_rows = []
+        rating_rows = {}
+        wait_rows = {}
+        rows = 0
+        for row, hospital in enumerate(hospitals):
+            for plan in hospital['insurance_lower']:
+                name_rows['insurance'].setdefault(plan, {})[row] = None
+            for specialty in hospital['specialties']:
+                name_rows['specialties'].setdefault(specialty.lower(), {})[row] = None
+            for procedure in hospital['procedures']:
+                name_rows['procedures'].setdefault(procedure, {})[row] = None
+            if hospital['emergency']:
+                emergency_rows.append(row)
+            rating_rows.setdefault(hospital['rating'], []).append(row)
+            wait_rows.setdefault(hospital['average_wait_time'], []).append(row)
+            rows = row + 1
+
+        self.rows = rows
+        self.all = (1 << rows) - 1
+        self.names = {key: {name: bitset(name_rows[key][name], rows) for name in name_rows[key]}
+                      for key in NAME_FILTERS}
+        self.emergency = bitset(emergency_rows, rows)
+        self.rating = _Threshold(rating_rows, rows)
+        self.wait_time = _Threshold(wait_rows, rows)
+
+    def matching(self, filters):
+        """Bitset of the hospitals matching every filter (see check_filters)"""
+        bits = self.all
+        for key, value in check_filters(filters).items():
+            if key == 'emergency':
+                bits &= self.emergency if value else ~self.emergency
+            elif key == 'min_rating':
+                bits &= self.rating.minimum(value)
+            elif key == 'max_wait_time':
+                bits &= self.wait_time.maximum(value)
+            else:
+                index = self.names[key]
+                for name in value:
+                    bits &= index.get(name if key == 'procedures' else name.lower(), 0)
+        return bits
+
+
+class NationalFacets(HospitalFacets):
+    """Facets over every hospital of a dataset, rows numbered city by city in data order
+
+    Only bitsets and row offsets are kept, so sharded datasets are not pinned in memory.
+    """
+
+    def __init__(self, locations, city_hospitals):
+        self.locations = [(state, city) for _, state, city in locations]
+        self.offsets = []
+
+        def every_hospital():
+            row = 0
+            for state, city in self.locations:
+                self.offsets.append(row)
+                for hospital in city_hospitals(state, city):
+                    row += 1
+                    yield hospital
+
+        super().__init__(every_hospital())
+
+    def locate(self, row):
+        """((state, city), row within that city) of a national row"""
+        position = bisect_right(self.offsets, row) - 1
+        return self.locations[position], row - self.offsets[position]
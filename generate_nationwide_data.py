@@ -4,10 +4,12 @@ Comprehensive Nationwide Hospital and Insurance Data Generator
 Generates realistic data for hospitals and insurance companies across all 50 US states
 """
 
+import hashlib
 import json
 import random
 import os
 from datetime import datetime
+from build_dataset import build_dataset
 
 class NationwideDataGenerator:
     def __init__(self):
@@ -674,6 +676,39 @@ class NationwideDataGenerator:
         file_size = os.path.getsize(filename)
         print(f"📁 File size: {file_size:,} bytes ({file_size/1024/1024:.1f} MB)")
 
+    def save_sharded_data(self, data, directory="data/shards"):
+        """Save the generated data as one JSON file per state plus a manifest
+
+        The manifest lists each state's file and cities so the app can resolve
+        cities without reading the shards, and load states only when needed.
+        """
+        os.makedirs(directory, exist_ok=True)
+        
+        states = {}
+        for state, cities in data["hospitals"].items():
+            filename = f"{state.lower().replace(' ', '_')}.json"
+            content = json.dumps(cities).encode("utf-8")
+            with open(os.path.join(directory, filename), 'wb') as f:
+                f.write(content)
+            
+            states[state] = {
+                "file": filename,
+                "cities": list(cities.keys()),
+                "hospital_count": sum(len(city_hospitals) for city_hospitals in cities.values()),
+                "bytes": len(content),
+                "sha1": hashlib.sha1(content).hexdigest()
+            }
+        
+        manifest = {key: value for key, value in data.items() if key != "hospitals"}
+        manifest["format"] = "finhealth-shards-v1"
+        manifest["states"] = states
+        
+        manifest_file = os.path.join(directory, "manifest.json")
+        with open(manifest_file, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        
+        print(f"💾 Saved {len(states)} state shards to {directory}")
+
 if __name__ == "__main__":
     # Generate comprehensive nationwide data
     generator = NationwideDataGenerator()
@@ -681,8 +716,12 @@ if __name__ == "__main__":
     # Generate with 8 hospitals per city (50 states × ~10 cities × 8 hospitals = ~4000 hospitals)
     data = generator.generate_comprehensive_data(hospitals_per_city=8)
     
-    # Save the data
+    # Validate the records and precompute derived fields once, at build time
+    data, _ = build_dataset(data)
+    
+    # Save the data, plus per-state shards for lazy loading
     generator.save_data(data)
+    generator.save_sharded_data(data)
     
     print("\n🎉 Comprehensive nationwide healthcare data generation complete!")
     print("The system now covers all 50 US states with comprehensive hospital and insurance data.")
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+City Coordinate Index for FinHealth Bot
+Lat/lon centroids for dataset cities and a grid index that finds the nearest cities to a point
+
+Centroids come from the dataset's own city_coordinates when it has them and otherwise
+from data/city_coordinates.json, which also lists towns without pricing data and a
+centroid per state, so "Waco, TX" or just "Texas" can still be placed on the map.
+
+CityGrid buckets points into one-degree cells. A nearest query walks rings of cells
+outwards from the query point and stops once no unvisited cell can hold anything
+closer than the k-th city found, so it only measures distances to nearby cities.
+"""
+
+import json
+import math
+import os
+from collections.abc import Mapping
+from functools import lru_cache
+from city_index import CityIndex, split_state, state_name
+
+COORDINATES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'city_coordinates.json')
+
+EARTH_RADIUS_MILES = 3958.8
+MILES_PER_DEGREE = 69.0  # miles per degree of latitude, and of longitude at the equator
+CELL_DEGREES = 1.0
+
+
+@lru_cache(maxsize=1)
+def reference_coordinates():
+    """(state centroids, {state: {city: [lat, lon]}}) from data/city_coordinates.json"""
+    try:
+        with open(COORDINATES_FILE, 'r') as f:
+            reference = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"City coordinates unavailable: {e}")
+        return {}, {}
+    return reference.get('states', {}), reference.get('cities', {})
+
+
+@lru_cache(maxsize=1)
+def _reference_places():
+    """CityIndex over every reference city and the coordinates of each"""
+    _, cities = reference_coordinates()
+    coordinates = {(state, city): point for state, state_cities in cities.items()
+                   for city, point in state_cities.items()}
+    index = CityIndex([city.lower(), state, city] for state, city in coordinates)
+    return index, coordinates
+
+
+def build_location_coordinates(locations, city_coordinates=None):
+    """[lat, lon] (or None when unknown) for each [city_lower, state, city] location
+
+    city_coordinates may give the dataset's own centroids, nested by state like the
+    hospitals ({state: {city: [lat, lon]}}) or by city for the flat format. Cities it
+    leaves out are looked up in the reference file; flat-format cities take the first
+    reference city of the same name.
+    """
+    city_coordinates = city_coordinates or {}
+    _, reference = reference_coordinates()
+    index, places = _reference_places()
+    coordinates = []
+    for _, state, city in locations:
+        given = city_coordinates.get(state) if state is not None else city_coordinates
+        point = given.get(city) if isinstance(given, Mapping) else None
+        if point is None:
+            if state is not None:
+                point = reference.get(state, {}).get(city)
+            else:
+                place = index.lookup(city)
+                point = places.get(place) if place else None
+        coordinates.append([float(point[0]), float(point[1])] if point else None)
+    return coordinates
+
+
+def location_states(locations):
+    """State of each [city_lower, state, city] location
+
+    Flat-format locations have no state, so they take the state of the first
+    reference city of the same name, or None when there is none.
+    """
+    index, _ = _reference_places()
+    states = []
+    for _, state, city in locations:
+        if state is None:
+            place = index.lookup(city)
+            state = place[0] if place else None
+        states.append(state)
+    return states
+
+
+def place_coordinates(name):
+    """(lat, lon) of a reference city spelled exactly ("Killeen" or "Killeen, TX"), or None"""
+    index, places = _reference_places()
+    city, state = split_state(name)
+    location = index.lookup_in_state(city, state) if state is not None else index.lookup(name)
+    return tuple(places[location]) if location is not None else None
+
+
+def state_coordinates(name):
+    """(lat, lon) centroid of a state named on its own ("Texas") or after a place ("Waco, TX"), or None"""
+    state = state_name(name) or split_state(name)[1]
+    centroid = reference_coordinates()[0].get(state) if state else None
+    return tuple(centroid) if centroid else None
+
+
+def haversine_miles(lat1, lon1, lat2, lon2):
+    """Great-circle distance between two points in miles"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _cell(lat, lon):
+    return math.floor(lat / CELL_DEGREES), math.floor(lon / CELL_DEGREES)
+
+
+class CityGrid:
+    """Points bucketed into CELL_DEGREES cells for nearest-neighbour queries"""
+
+    def __init__(self, points):
+        """points: (lat, lon, item) tuples; item is returned by nearest()"""
+        self.cells = {}
+        self.points = {}
+        for lat, lon, item in points:
+            self.cells.setdefault(_cell(lat, lon), []).append((lat, lon, item))
+            self.points[item] = (lat, lon)
+        rows = [row for row, _ in self.cells] or [0]
+        cols = [col for _, col in self.cells] or [0]
+        self._bounds = (min(rows), max(rows), min(cols), max(cols))
+
+    def __len__(self):
+        return len(self.points)
+
+    def _ring(self, row, col, radius):
+        """Cells exactly radius steps away from (row, col)"""
+        if radius == 0:
+            yield row, col
+            return
+        for step in range(-radius, radius + 1):
+            yield row - radius, col + step
+            yield row + radius, col + step
+        for step in range(-radius + 1, radius):
+            yield row + step, col - radius
+            yield row + step, col + radius
+
+    def _gap_miles(self, lat, radius):
+        """Fewest miles from a point to any cell more than radius rings away"""
+        # Longitude degrees shrink towards the poles, so use the widest latitude those cells reach
+        widest = min(89.9, abs(lat) + (radius + 1) * CELL_DEGREES)
+        return radius * CELL_DEGREES * MILES_PER_DEGREE * math.cos(math.radians(widest))
+
+    def nearest(self, lat, lon, k=1, accept=None):
+        """Up to k (miles, item) pairs closest to (lat, lon), nearest first
+
+        accept, when given, is called with each candidate item in distance order
+        and items it rejects are skipped, so it is only asked about nearby cities.
+        """
+        row, col = _cell(lat, lon)
+        low_row, high_row, low_col, high_col = self._bounds
+        last_ring = max(abs(row - low_row), abs(row - high_row), abs(col - low_col), abs(col - high_col))
+        found = []
+        pending = []
+        for radius in range(last_ring + 1):
+            for cell in self._ring(row, col, radius):
+                for point_lat, point_lon, item in self.cells.get(cell, ()):
+                    pending.append((haversine_miles(lat, lon, point_lat, point_lon), item))
+            # Only points closer than anything outside this ring can be settled now
+            gap = self._gap_miles(lat, radius)
+            pending.sort(key=lambda pair: pair[0])
+            settled = 0
+            for distance, item in pending:
+                if distance > gap and radius < last_ring:
+                    break
+                settled += 1
+                if accept is None or accept(item):
+                    found.append((distance, item))
+                    if len(found) >= k:
+                        return found
+            del pending[:settled]
+        return found
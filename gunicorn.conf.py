@@ -0,0 +1,31 @@
+"""
+Gunicorn Configuration for FinHealth Bot
+Preloads the dataset in the master process so every worker shares it copy-on-write
+
+Usage:
+    pip install gunicorn
+    gunicorn -c gunicorn.conf.py app:app
+
+The master imports the app, builds the dataset indexes and freezes the loaded objects
+out of the cyclic GC before forking. Use measure_worker_memory.py with the master's pid
+to see how much of each worker's memory is still shared.
+"""
+
+import multiprocessing
+import os
+
+bind = os.getenv('BIND', '0.0.0.0:5000')
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+preload_app = True
+
+
+def when_ready(server):
+    """Runs in the master after the app is imported and before any worker is forked"""
+    import app
+    app.preload()
+
+
+def post_fork(server, worker):
+    """Threads do not survive fork, so each worker runs its own data file watcher"""
+    import app
+    app.start_data_watcher()
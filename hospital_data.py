@@ -1,145 +1,480 @@
-import json
-import os
-from datetime import datetime
+import logging
+from collections.abc import Mapping
+from city_index import CityIndex, split_state, state_name
+from dataset import ShardedHospitals, get_dataset
+from facet_index import HospitalFacets, NationalFacets, check_filters, rows_of
+from geo_index import CityGrid, location_states, place_coordinates, state_coordinates
+from hospital_index import HospitalIndex
+from price_matrix import RANKED_PRICES, ComparisonRanking, NationalRankings, PriceMatrix, ProcedureRankings
+from records import ComparisonResult
+from value_ranking import HospitalFeatures, check_ranking, rank_by_value
+from vector_pricing import HAVE_NUMPY, VECTORIZED_MIN_ROWS, VectorPriceMatrix
+from zip_index import resolve_place, zip_code
+
+logger = logging.getLogger(__name__)
+
+
+def check_procedures(procedures):
+    """procedures if it is a non-empty list of procedure names; raises ValueError otherwise"""
+    if not procedures:
+        raise ValueError("No procedures provided")
+    if not isinstance(procedures, list) or not all(isinstance(procedure, str) for procedure in procedures):
+        raise ValueError("procedures should be a list of procedure names")
+    return procedures
+
 
 class HospitalDataManager:
-    def __init__(self):
-        # Load data from JSON file
-        self.data = self._load_hospital_data()
-        self.hospitals_data = self.data.get('hospitals', {})
-        self.insurance_plans = self.data.get('insurance_plans', {})
-        self.medical_conditions = self.data.get('medical_conditions', {})
-        
-        # Create a city-to-state mapping for easy lookups
-        self.city_to_state = self._create_city_state_mapping()
-    
-    def _load_hospital_data(self):
-        """Load hospital pricing data from JSON file"""
-        try:
-            # Try nationwide data first
-            nationwide_file = os.path.join('data', 'nationwide_hospital_data.json')
-            if os.path.exists(nationwide_file):
-                with open(nationwide_file, 'r') as f:
-                    return json.load(f)
-            
-            # Fallback to original data
-            data_file = os.path.join('data', 'hospital_pricing_data.json')
-            if os.path.exists(data_file):
-                with open(data_file, 'r') as f:
-                    return json.load(f)
-            else:
-                # Fallback data if file doesn't exist
-                return self._get_fallback_data()
-        except Exception as e:
-            print(f"Error loading hospital data: {e}")
-            return self._get_fallback_data()
-    
-    def _get_fallback_data(self):
-        """Fallback data structure"""
+    def __init__(self, dataset=None, store=None, vectorized=False):
+        # Pin the given snapshot, or follow the shared registry so reloaded data is picked up
+        self._pinned_dataset = dataset
+        if vectorized and not HAVE_NUMPY:
+            logger.warning("NumPy is not installed, pricing hospital by hospital instead")
+            vectorized = False
+        # Price and rank larger cities in one NumPy pass over their price matrix (see vector_pricing)
+        self.vectorized = vectorized
+        # Answer hospital queries from a SQLiteHospitalStore instead of the in-memory snapshot
+        self.store = store
+
+    @property
+    def dataset(self):
+        """Dataset snapshot used by new requests; each request reads it once and keeps it"""
+        return self._pinned_dataset or get_dataset()
+
+    @property
+    def hospitals_data(self):
+        return self.dataset.hospitals
+
+    @property
+    def insurance_plans(self):
+        return self.dataset.insurance_plans
+
+    @property
+    def medical_conditions(self):
+        return self.dataset.medical_conditions
+
+    @property
+    def city_to_state(self):
+        """City-to-state mapping for easy lookups, built once per snapshot (or read from the store)"""
+        if self.store is not None:
+            return self.store.city_to_state
+        dataset = self.dataset
+        return dataset.derived('city_to_state', lambda: self._create_city_state_mapping(dataset.hospitals))
+
+    def compare_hospitals(self, procedures, location="New York", filters=None, limit=None, offset=0,
+                          sort_by=None, weights=None):
+        """Compare hospital prices for given procedures
+
+        filters (see facet_index) limits the comparison to matching hospitals. limit and
+        offset pick one page of the ranking; only that page's results are built. Hospitals
+        rank cheapest first unless sort_by or weights ask for another order (see value_ranking).
+        """
+        return self._rank_hospitals(procedures, location, filters, sort_by, weights).page(offset, limit)
+    
+    def compare_hospitals_page(self, procedures, location="New York", filters=None, limit=5, offset=0,
+                               sort_by=None, weights=None):
+        """One page of compare_hospitals plus what summary lines need
+
+        Returns {'hospitals', 'count', 'cheapest', 'most_expensive'}: count is how many
+        hospitals were ranked, cheapest and most_expensive are the first and last results
+        of the whole ranking (None when there are none; with sort_by or weights, the best
+        and worst ranked). Only the page and those two results are built.
+        """
+        ranking = self._rank_hospitals(procedures, location, filters, sort_by, weights)
+        cheapest, most_expensive = ranking.extreme_results()
         return {
-            "hospitals": {
-                "New York": [
-                    {
-                        "name": "NYC General Hospital",
-                        "rating": 4.2,
-                        "address": "123 Medical Center Dr, New York, NY",
-                        "phone": "(212) 555-1234",
-                        "emergency": True,
-                        "insurance_accepted": ["Aetna", "Blue Cross", "Cigna", "UnitedHealth"],
-                        "procedures": {
-                            "ECG": {"base_price": 250, "insurance_price": 180, "cash_price": 212}
-                        }
-                    }
-                ]
-            },
-            "insurance_plans": {},
-            "medical_conditions": {}
+            "hospitals": ranking.page(offset, limit),
+            "count": ranking.count,
+            "cheapest": cheapest,
+            "most_expensive": most_expensive
         }
+    
+    def compare_hospitals_batch(self, queries, chunk_size=None):
+        """compare_hospitals for many queries, one entry per query in input order
 
-    def compare_hospitals(self, procedures, location="New York"):
-        """Compare hospital prices for given procedures"""
+        Each query is a dict of compare_hospitals arguments: procedures (required),
+        location, filters, limit, offset, sort_by and weights. Entries are
+        {'index', 'hospitals', 'count'}, or {'index', 'error'} for a query that is not
+        valid. See iter_compare_hospitals_batch for chunk_size.
+        """
+        return list(self.iter_compare_hospitals_batch(queries, chunk_size))
+    
+    def iter_compare_hospitals_batch(self, queries, chunk_size=None):
+        """Yield compare_hospitals_batch entries in input order, chunk_size queries at a time
+
+        The whole batch reads one snapshot, and each distinct location is resolved once.
+        Within a chunk, queries are answered city by city, so each city's indexes and price
+        columns are looked up together and identical queries share one ranking. Entries are
+        yielded as each chunk finishes; by default the batch is a single chunk.
+        """
+        dataset = self.dataset if self.store is None else None
+        cities = {}
+        chunk_size = chunk_size or max(len(queries), 1)
+        for start in range(0, len(queries), chunk_size):
+            chunk = queries[start:start + chunk_size]
+            entries = [None] * len(chunk)
+            groups = {}
+            for position, query in enumerate(chunk):
+                try:
+                    query = self._check_batch_query(query)
+                except ValueError as e:
+                    entries[position] = {"index": start + position, "error": str(e)}
+                    continue
+                location = query['location']
+                if location not in cities:
+                    cities[location] = (self._store_location(location, fallback_requires_key=True)
+                                        if self.store is not None else self._comparison_city(dataset, location))
+                city = cities[location]
+                groups.setdefault(city if self.store is not None else city[0], []).append((position, query, city))
+            
+            for members in groups.values():
+                rankings = {}
+                for position, query, city in members:
+                    key = (tuple(query['procedures']), repr(sorted(query['filters'].items())), query['weights'])
+                    ranking = rankings.get(key)
+                    if ranking is None:
+                        if self.store is not None:
+                            ranking = self._rank_store_city(city, query['procedures'], query['filters'], query['weights'])
+                        else:
+                            ranking = self._rank_city(dataset, *city, query['procedures'], query['filters'],
+                                                      query['weights'])
+                        rankings[key] = ranking
+                    entries[position] = {
+                        "index": start + position,
+                        "hospitals": ranking.page(query['offset'], query['limit']),
+                        "count": ranking.count
+                    }
+            yield from entries
+    
+    def _check_batch_query(self, query):
+        """A batch query with defaults filled in and filters and weights checked; raises ValueError"""
+        if not isinstance(query, Mapping):
+            raise ValueError("Each query should be an object")
+        procedures = check_procedures(query.get('procedures'))
+        location = query.get('location', "New York")
+        if not isinstance(location, str):
+            raise ValueError("location should be a string")
+        limit = query.get('limit')
+        offset = query.get('offset', 0)
+        if limit is not None and (isinstance(limit, bool) or not isinstance(limit, int) or limit < 1):
+            raise ValueError("limit should be a whole number of at least 1")
+        if isinstance(offset, bool) or not isinstance(offset, int) or offset < 0:
+            raise ValueError("offset should be a whole number of at least 0")
+        return {
+            "procedures": procedures,
+            "location": location,
+            "filters": check_filters(query.get('filters')),
+            "limit": limit,
+            "offset": offset,
+            "weights": check_ranking(query.get('sort_by'), query.get('weights'))
+        }
+    
+    def _rank_hospitals(self, procedures, location, filters, sort_by=None, weights=None):
+        """ComparisonRanking of the hospitals compare_hospitals would return"""
+        filters = check_filters(filters)
+        weights = check_ranking(sort_by, weights)
+        if self.store is not None:
+            location_id = self._store_location(location, fallback_requires_key=True)
+            return self._rank_store_city(location_id, procedures, filters, weights)
+        
+        # Read the snapshot once so a reload mid-request cannot mix two versions
+        dataset = self.dataset
+        location_key, hospitals = self._comparison_city(dataset, location)
+        return self._rank_city(dataset, location_key, hospitals, procedures, filters, weights)
+    
+    def _rank_store_city(self, location_id, procedures, filters, weights):
+        """ComparisonRanking of one store city's hospitals; weights are checked ranking weights or None"""
+        hospitals = self.store.city_prices(location_id, procedures, filters) if location_id is not None else []
+        ranking = self._rank_by_dicts(hospitals, procedures)
+        if weights is None:
+            return ranking
+        # Store rows are fetched per query, so their features are too, scaled over the whole city
+        ranges = self.store.feature_ranges(location_id) if filters and hospitals else (None, None)
+        return rank_by_value(ranking, HospitalFeatures(hospitals, ranges), range(len(hospitals)), weights)
+    
+    def _comparison_city(self, dataset, location):
+        """((state, city), hospitals) a comparison for location ranks, falling back to New York"""
         # Use the new city lookup system
-        hospitals = self.find_city_hospitals(location)
+        location_key, hospitals = self._locate_city(dataset, location)
         
-        # If no hospitals found, try fallback
+        # If no hospitals found, try fallback (a state name maps to cities, not hospitals)
         if not hospitals:
-            hospitals = self.hospitals_data.get(location, [])
-            if not hospitals and "New York" in self.hospitals_data:
-                hospitals = self.find_city_hospitals("New York")
+            fallback = dataset.hospitals.get(location, [])
+            if not isinstance(fallback, Mapping):
+                location_key, hospitals = (None, location), fallback
+            if not hospitals and "New York" in dataset.hospitals:
+                location_key, hospitals = self._locate_city(dataset, "New York")
+        return location_key, hospitals
+    
+    def _rank_city(self, dataset, location_key, hospitals, procedures, filters, weights):
+        """ComparisonRanking of one city's hospitals; filters and weights are already checked"""
+        rows = None
+        if filters and hospitals:
+            rows = list(rows_of(self.get_facets(location_key, hospitals, dataset).matching(filters)))
         
-        comparison_results = []
+        if len(procedures) == 1 and hospitals and weights is None:
+            # Single procedure: read the pre-sorted ranking instead of sorting
+            order = self.get_procedure_rankings(location_key, hospitals, dataset).comparison(procedures[0])
+            if rows is not None:
+                matching = set(rows)
+                order = [row for row in order if row in matching]
+            return ComparisonRanking(lambda selected: self._build_ranked_results(hospitals, procedures, selected),
+                                     order=order)
         
+        if self.vectorized and len(hospitals if rows is None else rows) >= VECTORIZED_MIN_ROWS:
+            ranking = self._rank_vectorized(dataset, location_key, hospitals, procedures, rows)
+        else:
+            ranking = self._rank_by_dicts(hospitals if rows is None else [hospitals[row] for row in rows], procedures)
+        
+        if weights is None:
+            return ranking
+        features = self.get_hospital_features(location_key, hospitals, dataset)
+        return rank_by_value(ranking, features, range(len(hospitals)) if rows is None else rows, weights)
+    
+    def _rank_by_dicts(self, hospitals, procedures):
+        """ComparisonRanking of hospitals by total cash cost read from their procedure dicts"""
+        keys = []
         for hospital in hospitals:
-            hospital_pricing = self._calculate_hospital_pricing(hospital, procedures)
-            comparison_results.append(hospital_pricing)
+            hospital_procedures = hospital['procedures']
+            # Add up cash prices in the same order as _calculate_hospital_pricing, so totals match to the bit
+            total_cash_cost = 0
+            for procedure in procedures:
+                if procedure in hospital_procedures:
+                    total_cash_cost += hospital_procedures[procedure]['cash_price']
+            keys.append(round(total_cash_cost, 2))
+        return ComparisonRanking(lambda positions: [self._calculate_hospital_pricing(hospitals[position], procedures)
+                                                    for position in positions], keys=keys)
+    
+    def cheapest_hospitals(self, procedure, location="New York", limit=5, price='cash_price', filters=None):
+        """The limit cheapest hospitals offering one procedure, by cash_price, base_price or insurance_price
+
+        Results have the compare_hospitals format and come from a slice of the city's
+        pre-sorted ranking, so nothing is sorted per request.
+        """
+        if price not in RANKED_PRICES:
+            raise ValueError(f"Unknown price to rank by: {price}")
+        filters = check_filters(filters)
+        if self.store is not None:
+            location_id = self._store_location(location, fallback_requires_key=True)
+            if location_id is None:
+                return []
+            hospitals = self.store.cheapest_prices(location_id, procedure, price, limit, filters)
+            return [self._calculate_hospital_pricing(hospital, [procedure]) for hospital in hospitals]
         
-        # Sort by total cash cost (most relevant for users)
-        comparison_results.sort(key=lambda x: x['total_cash_cost'])
+        dataset = self.dataset
+        location_key, hospitals = self._locate_city(dataset, location)
+        if not hospitals:
+            location_key, hospitals = self._locate_city(dataset, "New York")
+        if not hospitals:
+            return []
         
-        return comparison_results
+        order = self.get_procedure_rankings(location_key, hospitals, dataset).ranked(procedure, price)
+        if filters:
+            bits = self.get_facets(location_key, hospitals, dataset).matching(filters)
+            order = [row for row in order if bits >> row & 1]
+        return self._build_ranked_results(hospitals, [procedure], order[:limit])
     
-    def _calculate_hospital_pricing(self, hospital, procedures):
-        """Calculate pricing for a specific hospital using real data"""
-        procedure_costs = []
-        total_cost = 0
-        total_cash_cost = 0
-        cash_discount = hospital.get('cash_discount', 15)
-        
-        hospital_procedures = hospital.get('procedures', {})
-        
-        for procedure in procedures:
-            if procedure in hospital_procedures:
-                proc_data = hospital_procedures[procedure]
-                base_price = proc_data.get('base_price', 0)
-                cash_price = proc_data.get('cash_price', base_price * 0.85)
-                insurance_price = proc_data.get('insurance_price', base_price * 0.75)
-                
-                procedure_cost = {
-                    "procedure": procedure,
-                    "base_price": base_price,
-                    "cash_price": cash_price,
-                    "insurance_price": insurance_price,
-                    "savings_cash": base_price - cash_price
-                }
-                
-                procedure_costs.append(procedure_cost)
-                total_cost += base_price
-                total_cash_cost += cash_price
+    def cheapest_in_region(self, procedures, state=None, limit=10, price='cash_price', filters=None):
+        """The limit cheapest hospitals nationwide, or in one state, offering every procedure
+
+        Hospitals are ranked by the total of one price (cash_price, base_price or
+        insurance_price) over the procedures, compared to the cent, ties in data order.
+        Results have the compare_hospitals format plus the hospital's "state" and "city";
+        flat-format cities are placed in the state of the reference city of that name.
+        Raises ValueError for an unknown state or price.
+        """
+        if price not in RANKED_PRICES:
+            raise ValueError(f"Unknown price to rank by: {price}")
+        filters = check_filters(filters)
+        if state is not None:
+            region = state_name(state)
+            if region is None:
+                raise ValueError(f"Unknown state: {state}")
+            state = region
         
-        return {
-            "hospital": {
-                "name": hospital.get('name', ''),
-                "rating": hospital.get('rating', 0),
-                "address": hospital.get('address', ''),
-                "phone": hospital.get('phone', ''),
-                "emergency": hospital.get('emergency', False),
-                "insurance_accepted": hospital.get('insurance_accepted', []),
-                "specialties": hospital.get('specialties', []),
-                "average_wait_time": hospital.get('average_wait_time', 45)
-            },
-            "procedures": procedure_costs,
-            "total_cost": round(total_cost, 2),
-            "total_cash_cost": round(total_cash_cost, 2),
-            "total_savings_cash": round(total_cost - total_cash_cost, 2),
-            "cash_discount_percent": cash_discount,
-            "estimated_wait_time": f"{hospital.get('average_wait_time', 45)} minutes"
-        }
+        if self.store is not None:
+            located = self.store.cheapest_in_region(procedures, price, limit, state, filters)
+        else:
+            dataset = self.dataset
+            rankings = self.get_national_rankings(dataset)
+            accept = None
+            if filters:
+                bits = self.get_national_facets(dataset).matching(filters)
+                accept = lambda row: bits >> row & 1
+            located = []
+            for _, row in rankings.cheapest(procedures, price, limit, state, accept):
+                location, city_row = rankings.locate(row)
+                located.append((rankings.state_of(row), location[1],
+                                self._location_hospitals(dataset, *location)[1][city_row]))
+        
+        return [ComparisonResult(hospital, procedures, {"state": region, "city": city})
+                for region, city, hospital in located]
+    
+    def _build_ranked_results(self, hospitals, procedures, order):
+        """Comparison results for hospital rows already in ranked order"""
+        return [self._calculate_hospital_pricing(hospitals[row], procedures) for row in order]
     
-    def get_hospital_details(self, hospital_name, location="New York"):
-        """Get detailed information about a specific hospital"""
-        hospitals = self.hospitals_data.get(location, self.hospitals_data["New York"])
+    def _store_location(self, location, fallback_requires_key=False):
+        """Location id of a city in the store, falling back to New York like the in-memory path"""
+        location_id, _, hospital_count = self.store.locate_city(location)
+        if not hospital_count and (not fallback_requires_key or self.store.has_top_level_key("New York")):
+            location_id = self.store.locate_city("New York")[0]
+        return location_id
+    
+    def warm_indexes(self, dataset=None):
+        """Build the snapshot's derived indexes up front instead of on first request
+
+        Used when preloading in a master process, so forked workers share the
+        indexes instead of each building a private copy. Sharded datasets only get
+        the city indexes, since facets, rankings and price matrices would load every shard.
+        A store keeps its own indexes, so there is nothing to build.
+        """
+        if self.store is not None:
+            return
+        dataset = dataset or self.dataset
+        dataset.derived('city_to_state', lambda: self._create_city_state_mapping(dataset.hospitals))
+        self.get_city_index(dataset)
+        self.get_geo_index(dataset)
+        if isinstance(dataset.hospitals, ShardedHospitals):
+            return
+        self.get_hospital_index(dataset)
         
-        for hospital in hospitals:
-            if hospital["name"].lower() == hospital_name.lower():
-                return hospital
+        for _, state, city in dataset.locations:
+            location_key, hospitals = self._location_hospitals(dataset, state, city)
+            self.get_facets(location_key, hospitals, dataset)
+            self.get_hospital_features(location_key, hospitals, dataset)
+            self.get_procedure_rankings(location_key, hospitals, dataset)
+            if self.vectorized and len(hospitals) >= VECTORIZED_MIN_ROWS:
+                self.get_vector_matrix(location_key, hospitals, dataset)
+        self.get_national_facets(dataset)
+        self.get_national_rankings(dataset)
+    
+    def get_city_index(self, dataset=None):
+        """Normalized city name index of a snapshot, built once and cached on it"""
+        dataset = dataset or self.dataset
+        return dataset.derived('city_index', lambda: CityIndex(dataset.locations))
+    
+    def get_geo_index(self, dataset=None):
+        """Grid of the snapshot's city centroids for nearest-city queries, built once and cached on it"""
+        if self.store is not None:
+            return self.store.geo_index
+        dataset = dataset or self.dataset
+        return dataset.derived('geo_index', lambda: CityGrid(
+            (point[0], point[1], (state, city))
+            for (_, state, city), point in zip(dataset.locations, dataset.location_coordinates) if point))
+    
+    def get_hospital_index(self, dataset=None):
+        """Id and name index over every hospital in the snapshot; sharded data loads each shard once to build it"""
+        dataset = dataset or self.dataset
+        return dataset.derived('hospital_index', lambda: HospitalIndex(
+            dataset.locations, lambda state, city: self._location_hospitals(dataset, state, city)[1]))
+    
+    def get_facets(self, location_key, hospitals, dataset=None):
+        """Facet bitsets of a city's hospital list, cached on the snapshot by (state, city)"""
+        dataset = dataset or self.dataset
+        return dataset.derived(('facets', location_key), lambda: HospitalFacets(hospitals))
+    
+    def get_hospital_features(self, location_key, hospitals, dataset=None):
+        """Scaled rating, wait time and emergency care of a city's hospitals for value rankings, cached on the snapshot"""
+        dataset = dataset or self.dataset
+        return dataset.derived(('hospital_features', location_key), lambda: HospitalFeatures(hospitals))
+    
+    def get_national_facets(self, dataset=None):
+        """Facet bitsets over every hospital in the snapshot; sharded data loads each shard once to build them"""
+        dataset = dataset or self.dataset
+        return dataset.derived('national_facets', lambda: NationalFacets(
+            dataset.locations, lambda state, city: self._location_hospitals(dataset, state, city)[1]))
+    
+    def get_procedure_rankings(self, location_key, hospitals, dataset=None):
+        """Per-procedure pre-sorted price rankings of a city's hospital list, cached on the snapshot"""
+        dataset = dataset or self.dataset
+        return dataset.derived(('procedure_rankings', location_key), lambda: ProcedureRankings(hospitals))
+    
+    def get_national_rankings(self, dataset=None):
+        """Per-procedure price orders over every hospital in the snapshot; sharded data loads each shard once to build them"""
+        dataset = dataset or self.dataset
+        return dataset.derived('national_rankings', lambda: NationalRankings(
+            dataset.locations, lambda state, city: self._location_hospitals(dataset, state, city)[1],
+            location_states(dataset.locations)))
+    
+    def get_price_matrix(self, location_key, hospitals, dataset=None):
+        """Get the columnar price matrix for a city's hospital list, building it on first use
+
+        Matrices are cached on the dataset snapshot, keyed by (state, city), so they are
+        shared by every manager using that snapshot and survive shard eviction.
+        """
+        dataset = dataset or self.dataset
+        return dataset.derived(('price_matrix', location_key), lambda: PriceMatrix(hospitals))
+    
+    def get_vector_matrix(self, location_key, hospitals, dataset=None):
+        """NumPy views of a city's price matrix, cached on the snapshot next to the matrix"""
+        dataset = dataset or self.dataset
+        # Build the matrix first: derived() holds its lock while building, so builds cannot nest
+        matrix = self.get_price_matrix(location_key, hospitals, dataset)
+        return dataset.derived(('vector_prices', location_key), lambda: VectorPriceMatrix(matrix))
+    
+    def _rank_vectorized(self, dataset, location_key, hospitals, procedures, rows=None):
+        """ComparisonRanking of hospitals (or just the given rows) priced in one NumPy pass over the city's price matrix"""
+        matrix = self.get_vector_matrix(location_key, hospitals, dataset)
+        rows, cash_total = matrix.cash_totals(procedures, rows)
+        keys = matrix.cents(cash_total)
+        
+        def build(positions):
+            return [self._calculate_hospital_pricing(hospitals[row], procedures) for row in rows[positions].tolist()]
         
+        return ComparisonRanking(build, keys=keys.tolist(),
+                                 select=lambda start, stop: matrix.rank(keys, stop)[start:].tolist())
+    
+    def _calculate_hospital_pricing(self, hospital, procedures):
+        """Comparison entry for one hospital; a view that prices the hospital when first read (see records)"""
+        return ComparisonResult(hospital, procedures)
+    
+    def get_hospital(self, hospital_id):
+        """The hospital with this id from anywhere in the dataset, as ((state, city), hospital), or None"""
+        if self.store is not None:
+            return self.store.hospital_by_id(hospital_id)
+        dataset = self.dataset
+        entry = self.get_hospital_index(dataset).by_id(hospital_id)
+        if entry is None:
             return None
+        (state, city), row = entry
+        location_key, hospitals = self._location_hospitals(dataset, state, city)
+        return location_key, hospitals[row]
     
-    def _create_city_state_mapping(self):
+    def find_hospitals_by_name(self, hospital_name):
+        """Every hospital with this name, ignoring case and punctuation, as ((state, city), hospital)"""
+        if self.store is not None:
+            return self.store.hospitals_named(hospital_name)
+        dataset = self.dataset
+        matches = []
+        for (state, city), row in self.get_hospital_index(dataset).by_name(hospital_name):
+            location_key, hospitals = self._location_hospitals(dataset, state, city)
+            matches.append((location_key, hospitals[row]))
+        return matches
+    
+    def get_hospital_details(self, hospital_name, location=None):
+        """Get detailed information about a specific hospital, given its id or name
+
+        Names are not unique across the country, so the hospital in location wins when
+        one matches there; otherwise the first match in data order. Returns None when
+        nothing matches.
+        """
+        match = self.get_hospital(hospital_name)
+        if match is not None:
+            return match[1]
+        matches = self.find_hospitals_by_name(hospital_name)
+        if not matches:
+            return None
+        located = self.locate_city(location) if location else None
+        for location_key, hospital in matches:
+            if location_key == located:
+                return hospital
+        return matches[0][1]
+    
+    def _create_city_state_mapping(self, hospitals_data):
         """Create a mapping from city names to states for easy lookup"""
         city_state_map = {}
-        for state, state_data in self.hospitals_data.items():
-            if isinstance(state_data, dict):  # New nationwide format
+        for state, state_data in hospitals_data.items():
+            if isinstance(state_data, Mapping):  # New nationwide format
                 for city in state_data.keys():
                     city_state_map[city.lower()] = state
             else:  # Old format fallback
@@ -148,48 +483,139 @@ class HospitalDataManager:
     
     def find_city_hospitals(self, city_name):
         """Find hospitals in a specific city, handling both old and new data formats"""
-        city_lower = city_name.lower()
-        
-        # Check if we have the new state-based structure
-        for state, state_data in self.hospitals_data.items():
-            if isinstance(state_data, dict):  # New format: state -> city -> hospitals
-                for city, hospitals in state_data.items():
-                    if city.lower() == city_lower:
-                        return hospitals
-            else:  # Old format: city -> hospitals
-                if state.lower() == city_lower:
-                    return state_data
-        
-        # Try partial matching for city names
-        for state, state_data in self.hospitals_data.items():
-            if isinstance(state_data, dict):
-                for city, hospitals in state_data.items():
-                    if city_lower in city.lower() or city.lower() in city_lower:
-                        return hospitals
-        
-        return []
+        if self.store is not None:
+            location_id = self.store.locate_city(city_name)[0]
+            return self.store.city_hospitals(location_id) if location_id is not None else []
+        return self._locate_city(self.dataset, city_name)[1]
     
-    def search_hospitals_by_insurance(self, insurance_plan, location="New York"):
-        """Find hospitals that accept specific insurance"""
-        hospitals = self.find_city_hospitals(location)
+    def locate_city(self, city_name):
+        """(state, city) a name resolves to, or None, without the New York fallback or loading hospitals"""
+        if self.store is not None:
+            return resolve_place(city_name, self.store.city_index, self.store.geo_index)
+        return resolve_place(city_name, self.get_city_index(), self.get_geo_index())
+    
+    def nearest_cities(self, location, procedures=None, k=3, filters=None):
+        """Up to k cities with data closest to a location, as [((state, city), miles)], nearest first
+
+        The location may be a dataset city, any town listed in data/city_coordinates.json
+        or a state, which stands for its centroid. Only cities with a hospital offering
+        every requested procedure (and matching the filters) count, and cities are
+        checked in distance order so far-away ones are never looked at. Returns []
+        when the location cannot be placed.
+        """
+        filters = check_filters(filters)
+        if procedures:
+            filters['procedures'] = filters.get('procedures', []) + list(procedures)
+        grid = self.get_geo_index()
         
-        if not hospitals:
-            hospitals = self.find_city_hospitals("New York")
+        # Known towns first, then a (possibly misspelled) dataset city, then the state's centroid
+        point = place_coordinates(location)
+        if point is None:
+            point = grid.points.get(self.locate_city(location)) or state_coordinates(location)
+        if point is None:
+            return []
         
-        matching_hospitals = []
+        if self.store is not None:
+            accept = self.store.locations_matching(filters).__contains__
+        else:
+            dataset = self.dataset
+            
+            def accept(location_key):
+                hospitals = self._location_hospitals(dataset, *location_key)[1]
+                return bool(hospitals) and bool(self.get_facets(location_key, hospitals, dataset).matching(filters))
         
-        for hospital in hospitals:
-            if insurance_plan.lower() in [ins.lower() for ins in hospital.get("insurance_accepted", [])]:
-                matching_hospitals.append(hospital)
+        return [(location_key, round(miles, 1)) for miles, location_key in grid.nearest(*point, k=k, accept=accept)]
+    
+    def city_candidates(self, city_name):
+        """Every (state, city) a name refers to, in data order, without loading any hospitals
+
+        Several states share city names (Portland, Columbus, Springfield); a
+        state-qualified name such as "Portland, OR" narrows the list to one city.
+        """
+        index = self.store.city_index if self.store is not None else self.get_city_index()
+        candidates = index.candidates(city_name)
+        if not candidates and split_state(city_name)[1] is None:
+            # A longer or misspelled name: the cities sharing the name it resolves to
+            location = self.locate_city(city_name)
+            if location is None:
+                candidates = []
+            elif zip_code(city_name) is not None:
+                candidates = [location]  # A ZIP code names one city
+            else:
+                candidates = index.candidates(location[1])
+        return candidates
+    
+    def find_city_candidates(self, city_name):
+        """Every city a name refers to as ((state, city), hospitals)"""
+        if self.store is not None:
+            return [(location, self.store.city_hospitals(self.store.location_id(*location)))
+                    for location in self.city_candidates(city_name)]
+        dataset = self.dataset
+        return [self._location_hospitals(dataset, *location) for location in self.city_candidates(city_name)]
+    
+    def _locate_city(self, dataset, city_name):
+        """Find a city within one dataset snapshot, returning ((state, city), hospitals)
+
+        Only the matching city's hospital list is accessed, so sharded datasets load
+        just the shard that holds it.
+        """
+        # A ZIP code's city (or the nearest dataset city); otherwise an exact match on the
+        # normalized name or a known alias, then the best ranked partial or misspelled match
+        location = resolve_place(city_name, self.get_city_index(dataset), self.get_geo_index(dataset))
+        if location is not None:
+            return self._location_hospitals(dataset, *location)
         
-        return matching_hospitals
+        return (None, None), []
     
-    def get_emergency_hospitals(self, location="New York"):
-        """Get hospitals with emergency services"""
-        hospitals = self.find_city_hospitals(location)
+    def _location_hospitals(self, dataset, state, city):
+        """The ((state, city), hospitals) entry for one known location"""
+        if state is None:
+            return (None, city), dataset.hospitals[city]
+        return (state, city), dataset.hospitals[state][city]
+    
+    def filter_hospitals(self, location="New York", filters=None):
+        """Hospitals of a city matching every filter (see facet_index), in data order"""
+        filters = check_filters(filters)
+        if self.store is not None:
+            location_id = self._store_location(location)
+            return self.store.filtered_hospitals(location_id, filters) if location_id is not None else []
+        
+        dataset = self.dataset
+        location_key, hospitals = self._locate_city(dataset, location)
+        
+        if not hospitals:
+            location_key, hospitals = self._locate_city(dataset, "New York")
         
         if not hospitals:
-            hospitals = self.find_city_hospitals("New York")
+            return []
+        facets = self.get_facets(location_key, hospitals, dataset)
+        return [hospitals[row] for row in rows_of(facets.matching(filters))]
+    
+    def filter_hospitals_nationwide(self, filters=None):
+        """Every hospital in the dataset matching every filter, as ((state, city), hospital)"""
+        filters = check_filters(filters)
+        if self.store is not None:
+            return self.store.filtered_hospitals_nationwide(filters)
         
-        emergency_hospitals = [h for h in hospitals if h.get("emergency", False)]
-        return emergency_hospitals
+        dataset = self.dataset
+        facets = self.get_national_facets(dataset)
+        results = []
+        for row in rows_of(facets.matching(filters)):
+            location, city_row = facets.locate(row)
+            results.append((location, self._location_hospitals(dataset, *location)[1][city_row]))
+        return results
+    
+    def search_hospitals_by_insurance(self, insurance_plan, location="New York"):
+        """Find hospitals that accept specific insurance
+
+        insurance_plan may be one plan or a list of plans that must all be accepted.
+        """
+        return self.filter_hospitals(location, {'insurance': insurance_plan})
+    
+    def search_hospitals_by_insurance_nationwide(self, insurance_plans):
+        """Every hospital in the dataset accepting all the given plans, as ((state, city), hospital)"""
+        return self.filter_hospitals_nationwide({'insurance': insurance_plans})
+    
+    def get_emergency_hospitals(self, location="New York"):
+        """Get hospitals with emergency services"""
+        return self.filter_hospitals(location, {'emergency': True})
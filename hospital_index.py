@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Hospital Lookup Index for FinHealth Bot
+Finds any hospital in the dataset by its id or name with one dict lookup
+
+Entries are ((state, city), row) positions rather than the hospital records themselves,
+so sharded datasets are not pinned in memory; the manager reads the record from its
+city's hospital list, which for sharded data loads only that state.
+"""
+
+from city_index import normalize_city_name
+
+
+def normalize_hospital_name(name):
+    """Name key that ignores case, punctuation and "Saint"/"St." spellings, like city names"""
+    return normalize_city_name(name)
+
+
+class HospitalIndex:
+    """Hospital id -> position and normalized name -> [positions] over every city of a dataset"""
+
+    def __init__(self, locations, city_hospitals):
+        self.ids = {}
+        self.names = {}
+        for _, state, city in locations:
+            for row, hospital in enumerate(city_hospitals(state, city)):
+                entry = ((state, city), row)
+                hospital_id = hospital.get('id')
+                if hospital_id is not None:
+                    # Ids are unique in generated data; should a source repeat one, the first wins
+                    self.ids.setdefault(str(hospital_id), entry)
+                self.names.setdefault(normalize_hospital_name(hospital['name']), []).append(entry)
+
+    def by_id(self, hospital_id):
+        """((state, city), row) of the hospital with this id, or None"""
+        return self.ids.get(str(hospital_id))
+
+    def by_name(self, name):
+        """((state, city), row) of every hospital with this name, in data order"""
+        return self.names.get(normalize_hospital_name(name), [])
+
+    def __len__(self):
+        return sum(len(entries) for entries in self.names.values())
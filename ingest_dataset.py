@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Streaming Dataset Ingest for FinHealth Bot
+Converts the JSON pricing data to newline-delimited JSON and loads it back one hospital at a time
+
+Usage:
+    python ingest_dataset.py data/*.json                 # write a .ndjson file next to each JSON file
+    python ingest_dataset.py --ingest data/*.ndjson      # stream a file in, reporting progress and memory
+
+An NDJSON dataset starts with a header line, followed by one line per top-level section
+(insurance plans, medical conditions, metadata) and one line per hospital tagged with its
+state and city. Ingesting it never holds more than one line of raw text, so peak memory stays
+close to the size of the parsed dataset instead of several times the file size.
+"""
+
+import hashlib
+import json
+import os
+import sys
+import time
+import tracemalloc
+from build_dataset import (BUILD_FORMAT, DatasetValidationError, build_hospital, build_locations, ensure_built,
+                           is_dataset)
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+NDJSON_FORMAT = 'finhealth-ndjson-v1'
+NDJSON_SUFFIX = '.ndjson'
+
+# Report progress every this many hospitals
+PROGRESS_INTERVAL = 1000
+
+
+def ndjson_path_for(json_path):
+    """Path of the NDJSON variant that sits next to a JSON dataset file"""
+    return os.path.splitext(json_path)[0] + NDJSON_SUFFIX
+
+
+def write_ndjson(data, output_path):
+    """Write a dataset as NDJSON, building it first if needed; returns the number of hospital lines written"""
+    data = ensure_built(data, output_path)
+    hospitals = data.get('hospitals', {})
+    nested = any(isinstance(value, dict) for value in hospitals.values())
+    count = 0
+
+    tmp_path = output_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(json.dumps({"format": NDJSON_FORMAT, "nested": nested, "built": True}) + '\n')
+        for key, value in data.items():
+            if key != 'hospitals':
+                f.write(json.dumps({"section": key, "data": value}) + '\n')
+
+        if nested:
+            locations = ((state, city, city_hospitals)
+                         for state, cities in hospitals.items()
+                         for city, city_hospitals in cities.items())
+        else:
+            locations = ((None, city, city_hospitals) for city, city_hospitals in hospitals.items())
+
+        for state, city, city_hospitals in locations:
+            if not city_hospitals:
+                f.write(json.dumps({"state": state, "city": city}) + '\n')
+            for hospital in city_hospitals:
+                f.write(json.dumps({"state": state, "city": city, "hospital": hospital}) + '\n')
+                count += 1
+
+    os.replace(tmp_path, output_path)
+    return count
+
+
+def peak_rss_bytes():
+    """Peak resident set size of this process so far, or None when it cannot be measured"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def ingest_ndjson(path, progress=None, trace_memory=False, to_record=None):
+    """Stream an NDJSON dataset into the in-memory dataset structure
+
+    Hospitals are added to their city lists as each line is parsed, and the
+    city -> state index is built along the way. progress, when given, is called
+    as progress(bytes_read, total_bytes, hospitals) every PROGRESS_INTERVAL
+    hospitals and once at the end. to_record, when given, converts each built
+    hospital dict as it is read (e.g. into a compact record). Files written before
+    the build step existed are built line by line, skipping malformed hospitals.
+
+    Returns (data, stats); stats holds the content version, the city -> state
+    index, the number of rejected hospitals and the timing and peak memory figures.
+    """
+    total_bytes = os.path.getsize(path)
+    bytes_read = 0
+    hospital_count = 0
+    rejected = 0
+    data = {}
+    hospitals = {}
+    city_to_state = {}
+    digest = hashlib.sha1()
+
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+
+    with open(path, 'rb') as f:
+        header = json.loads(f.readline() or b'{}')
+        if header.get('format') != NDJSON_FORMAT:
+            raise ValueError(f"{path} is not a {NDJSON_FORMAT} file")
+        nested = header.get('nested', False)
+        built = header.get('built', False)
+
+        for line in f:
+            bytes_read += len(line)
+            digest.update(line)
+            if not line.strip():
+                continue
+            record = json.loads(line)
+
+            if 'section' in record:
+                data[record['section']] = record['data']
+                continue
+
+            state, city = record['state'], record['city']
+            if nested:
+                city_hospitals = hospitals.setdefault(state, {}).setdefault(city, [])
+                city_to_state[city.lower()] = state
+            else:
+                city_hospitals = hospitals.setdefault(city, [])
+                city_to_state[city.lower()] = city
+
+            hospital = record.get('hospital')
+            if hospital is not None and not built:
+                try:
+                    hospital = build_hospital(hospital)
+                except DatasetValidationError:
+                    rejected += 1
+                    continue
+            if hospital is not None:
+                city_hospitals.append(to_record(hospital) if to_record else hospital)
+                hospital_count += 1
+                if progress and hospital_count % PROGRESS_INTERVAL == 0:
+                    progress(bytes_read, total_bytes, hospital_count)
+
+    if progress:
+        progress(bytes_read, total_bytes, hospital_count)
+
+    data['hospitals'] = hospitals
+    if not built:
+        data['locations'] = build_locations(hospitals)
+        data['metadata'] = dict(data.get('metadata', {}), build_format=BUILD_FORMAT)
+    stats = {
+        "version": digest.hexdigest()[:12],
+        "city_to_state": city_to_state,
+        "hospitals": hospital_count,
+        "rejected": rejected,
+        "bytes": total_bytes,
+        "seconds": time.perf_counter() - started,
+        "peak_rss_bytes": peak_rss_bytes(),
+        "peak_traced_bytes": None
+    }
+    if trace_memory:
+        stats["peak_traced_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return data, stats
+
+
+def _print_progress(bytes_read, total_bytes, hospitals):
+    percent = 100 * bytes_read / total_bytes if total_bytes else 100
+    print(f"   ⏳ {percent:5.1f}% - {hospitals:,} hospitals")
+
+
+def _megabytes(value):
+    return "n/a" if value is None else f"{value / (1024 * 1024):,.1f} MB"
+
+
+def main(args):
+    """Convert JSON files to NDJSON, or stream NDJSON files in with --ingest"""
+    ingest = '--ingest' in args
+    trace_memory = '--trace-memory' in args
+    paths = [arg for arg in args if not arg.startswith('--')]
+    if not paths:
+        print("Usage: python ingest_dataset.py [--ingest [--trace-memory]] data/*.json")
+        return 1
+
+    for path in paths:
+        if ingest:
+            print(f"📥 Ingesting {path}")
+            data, stats = ingest_ndjson(path, progress=_print_progress, trace_memory=trace_memory)
+            print(f"✅ {stats['hospitals']:,} hospitals in {stats['seconds']:.2f}s (version {stats['version']})")
+            print(f"   📁 File size: {_megabytes(stats['bytes'])}")
+            if stats['rejected']:
+                print(f"   ⚠️ Skipped {stats['rejected']:,} malformed hospitals")
+            print(f"   🧠 Peak process memory: {_megabytes(stats['peak_rss_bytes'])}")
+            if trace_memory:
+                print(f"   🧠 Peak traced allocations: {_megabytes(stats['peak_traced_bytes'])}")
+        else:
+            with open(path, 'r') as f:
+                data = json.load(f)
+            if not is_dataset(data):
+                print(f"Skipping {path}: it holds no hospitals")
+                continue
+            output_path = ndjson_path_for(path)
+            count = write_ndjson(data, output_path)
+            print(f"✅ Converted {path} -> {output_path} ({count:,} hospitals)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
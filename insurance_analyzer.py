@@ -1,57 +1,21 @@
-import json
-import os
+from collections import ChainMap
+from dataset import get_dataset
 
 class InsuranceAnalyzer:
-    def __init__(self):
-        # Load insurance data from the hospital data file
-        self.insurance_plans = self._load_insurance_data()
-    
-    def _load_insurance_data(self):
-        """Load insurance plans data from JSON file"""
-        try:
-            # Try nationwide data first
-            nationwide_file = os.path.join('data', 'nationwide_hospital_data.json')
-            if os.path.exists(nationwide_file):
-                with open(nationwide_file, 'r') as f:
-                    data = json.load(f)
-                    return data.get('insurance_plans', {})
-            
-            # Fallback to original data
-            data_file = os.path.join('data', 'hospital_pricing_data.json')
-            if os.path.exists(data_file):
-                with open(data_file, 'r') as f:
-                    data = json.load(f)
-                    return data.get('insurance_plans', {})
-            else:
-                return self._get_fallback_insurance_data()
-        except Exception as e:
-            print(f"Error loading insurance data: {e}")
-            return self._get_fallback_insurance_data()
-    
-    def _get_fallback_insurance_data(self):
-        """Fallback insurance data"""
-        return {
-            "Aetna": {
-                "deductible": 1500,
-                "out_of_pocket_max": 3500,
-                "coverage_percent": 80
-            },
-            "Blue Cross Blue Shield": {
-                "deductible": 1000,
-                "out_of_pocket_max": 3000,
-                "coverage_percent": 75
-            },
-            "Cigna": {
-                "deductible": 1200,
-                "out_of_pocket_max": 3200,
-                "coverage_percent": 85
-            },
-            "UnitedHealth": {
-                "deductible": 2000,
-                "out_of_pocket_max": 4000,
-                "coverage_percent": 70
-            }
-        }
+    def __init__(self, dataset=None):
+        # Pin the given snapshot, or follow the shared registry so reloaded plans are picked up
+        self._pinned_dataset = dataset
+        # Plans added or edited at runtime stay local to this analyzer
+        self._plan_overrides = {}
+
+    @property
+    def dataset(self):
+        return self._pinned_dataset or get_dataset()
+
+    @property
+    def insurance_plans(self):
+        """Runtime plan edits layered over the current snapshot's plans"""
+        return ChainMap(self._plan_overrides, self.dataset.insurance_plans)
 
     def analyze_coverage(self, procedures, insurance_plan, hospital):
         """Calculate costs for covered procedures vs out-of-pocket expenses"""
@@ -97,8 +61,11 @@ class InsuranceAnalyzer:
         if not plan:
             return {'error': 'Insurance plan not found'}
 
+        # Copy before editing so the shared snapshot is never mutated
+        plan = dict(plan)
         for key, value in kwargs.items():
             if key in plan:
                 plan[key] = value
+        self.insurance_plans[insurance_name] = plan
 
         return plan
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Worker Memory Measurement for FinHealth Bot
+Reports how much of each worker process's memory is shared with its siblings and how much is private
+
+Usage:
+    python measure_worker_memory.py <master_pid>             # a running gunicorn master and its workers
+    python measure_worker_memory.py --simulate 4             # preload, fork 4 workers and serve requests
+    python measure_worker_memory.py --simulate 4 --no-freeze # the same without freezing the dataset
+
+Memory figures come from /proc/<pid>/smaps_rollup, so this only runs on Linux.
+"""
+
+import gc
+import os
+import signal
+import sys
+import time
+
+SMAPS_FIELDS = ('Rss', 'Pss', 'Shared_Clean', 'Shared_Dirty', 'Private_Clean', 'Private_Dirty')
+
+
+def process_memory(pid):
+    """Rss, Pss, shared and private bytes of one process"""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup", 'r') as f:
+        for line in f:
+            parts = line.split()
+            if parts and parts[0].rstrip(':') in SMAPS_FIELDS:
+                values[parts[0].rstrip(':')] = int(parts[1]) * 1024
+    return {
+        "rss": values.get('Rss', 0),
+        "pss": values.get('Pss', 0),
+        "shared": values.get('Shared_Clean', 0) + values.get('Shared_Dirty', 0),
+        "private": values.get('Private_Clean', 0) + values.get('Private_Dirty', 0)
+    }
+
+
+def child_pids(pid):
+    """Direct children of a process"""
+    children = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", 'r') as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # The command name is in parentheses and may contain spaces; ppid follows the state
+        if int(stat.rsplit(')', 1)[1].split()[1]) == pid:
+            children.append(int(entry))
+    return sorted(children)
+
+
+def _mb(value):
+    return f"{value / (1024 * 1024):8.1f}"
+
+
+def print_report(master_pid, worker_pids):
+    """Print one line per process plus the worker totals"""
+    print(f"{'process':>14} {'RSS MB':>8} {'PSS MB':>8} {'shared':>8} {'private':>8}")
+    for label, pid in [(f"master {master_pid}", master_pid)] + [(f"worker {pid}", pid) for pid in worker_pids]:
+        memory = process_memory(pid)
+        print(f"{label:>14} {_mb(memory['rss'])} {_mb(memory['pss'])} {_mb(memory['shared'])} {_mb(memory['private'])}")
+
+    workers = [process_memory(pid) for pid in worker_pids]
+    if workers:
+        private = sum(memory['private'] for memory in workers)
+        rss = sum(memory['rss'] for memory in workers)
+        print(f"\n📊 {len(workers)} workers: {_mb(rss).strip()} MB summed RSS, "
+              f"{_mb(private).strip()} MB private ({100 * private / rss:.0f}% of RSS)")
+
+
+def _serve_requests(manager, cities, rounds):
+    """Exercise the dataset the way request handlers do, including GC passes"""
+    procedures = ['MRI', 'ECG', 'X-ray', 'Blood tests']
+    for _ in range(rounds):
+        for city in cities:
+            manager.compare_hospitals(procedures, city)
+            manager.search_hospitals_by_insurance('Aetna', city)
+        gc.collect()
+
+
+def simulate(worker_count, freeze=True, rounds=3):
+    """Preload the dataset, fork workers that serve requests, then measure them"""
+    from dataset import freeze_loaded_objects, get_dataset
+    from hospital_data import HospitalDataManager
+
+    manager = HospitalDataManager()
+    snapshot = get_dataset()
+    manager.warm_indexes(snapshot)
+    cities = [city.title() for city in manager.city_to_state]
+    if freeze:
+        print(f"🧊 Froze {freeze_loaded_objects():,} objects before forking")
+
+    workers = []
+    for _ in range(worker_count):
+        ready_read, ready_write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(ready_read)
+            _serve_requests(manager, cities, rounds)
+            os.write(ready_write, b'1')
+            while True:
+                time.sleep(60)
+        os.close(ready_write)
+        workers.append((pid, ready_read))
+
+    try:
+        for pid, ready_read in workers:
+            os.read(ready_read, 1)
+            os.close(ready_read)
+        print(f"🏥 {len(cities)} cities served {rounds} times per worker (dataset {snapshot.version})\n")
+        print_report(os.getpid(), [pid for pid, _ in workers])
+    finally:
+        for pid, _ in workers:
+            os.kill(pid, signal.SIGTERM)
+            os.waitpid(pid, 0)
+
+
+def main(args):
+    if not os.path.exists('/proc/self/smaps_rollup'):
+        print("This script needs /proc/<pid>/smaps_rollup (Linux 4.14+)")
+        return 1
+
+    if '--simulate' in args:
+        position = args.index('--simulate')
+        worker_count = int(args[position + 1]) if len(args) > position + 1 else 4
+        simulate(worker_count, freeze='--no-freeze' not in args)
+        return 0
+
+    if not args:
+        print(__doc__)
+        return 1
+    master_pid = int(args[0])
+    print_report(master_pid, child_pids(master_pid))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
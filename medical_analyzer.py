@@ -1,12 +1,12 @@
 import os
 import requests
 from dotenv import load_dotenv
-import json
+from dataset import get_dataset
 
 load_dotenv()
 
 class MedicalAnalyzer:
-    def __init__(self):
+    def __init__(self, dataset=None):
         self.together_api_key = os.getenv('TOGETHER_API_KEY')
         self.api_url = "https://api.together.xyz/v1/chat/completions"
         self.headers = {
@@ -14,8 +14,8 @@ class MedicalAnalyzer:
             "Content-Type": "application/json"
         }
         
-        # Load medical conditions data
-        self.medical_conditions = self._load_data()
+        # Pin the given snapshot, or follow the shared registry so reloaded data is picked up
+        self._pinned_dataset = dataset
         
         # Common medical procedures mapped to conditions
         self.procedure_mapping = {
@@ -29,6 +29,15 @@ class MedicalAnalyzer:
             "skin rash": ["Physical examination", "Blood tests"]
         }
 
+    @property
+    def dataset(self):
+        return self._pinned_dataset or get_dataset()
+
+    @property
+    def medical_conditions(self):
+        """Medical conditions from the current dataset snapshot"""
+        return self.dataset.medical_conditions
+
     def analyze_symptoms(self, symptoms):
         """Analyze symptoms using AI to predict medical condition"""
         if not self.together_api_key or self.together_api_key == "your_together_ai_api_key_here":
@@ -88,20 +97,6 @@ class MedicalAnalyzer:
         # Fallback to hardcoded mapping
         return self.procedure_mapping.get(condition.lower(), [])
 
-    def _load_data(self):
-        """Load medical data from JSON file"""
-        try:
-            data_file = os.path.join('data', 'hospital_pricing_data.json')
-            if os.path.exists(data_file):
-                with open(data_file, 'r') as f:
-                    data = json.load(f)
-                    return data.get('medical_conditions', {})
-            else:
-                return {}
-        except Exception as e:
-            print(f"Error loading data: {e}")
-            return {}
-
     def analyze_symptoms_using_data(self, symptoms):
         """Use dataset to analyze symptoms and suggest procedures"""
         condition = self.analyze_symptoms(symptoms)
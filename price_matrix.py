@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+Columnar Price Matrix for FinHealth Bot
+Stores a city's cash prices as a contiguous hospital x procedure array for the NumPy kernel,
+plus per-procedure hospital orders pre-sorted by price for single-procedure queries
+and nationwide orders for statewide and national cheapest-provider queries
+"""
+
+import heapq
+import itertools
+import math
+from array import array
+from bisect import bisect_right
+
+MISSING = math.nan  # sentinel for a procedure the hospital does not offer
+
+
+class PriceMatrix:
+    """Hospital x procedure cash price array for one city
+
+    Row r, column c lives at index r * len(procedures) + c. Hospitals come from
+    the built dataset, so fallback prices are already resolved and a cell is
+    either a real cash price or MISSING when the hospital does not offer the
+    procedure. The NumPy kernel (see vector_pricing) ranks large cities over a
+    view of it; results are still priced from the hospital records.
+    """
+
+    def __init__(self, hospitals):
+        procedure_names = []
+        procedure_index = {}
+        for hospital in hospitals:
+            for procedure in hospital['procedures']:
+                if procedure not in procedure_index:
+                    procedure_index[procedure] = len(procedure_names)
+                    procedure_names.append(procedure)
+
+        self.procedures = procedure_names
+        self.procedure_index = procedure_index
+        self.rows = len(hospitals)
+        self.columns = len(procedure_names)
+        self.cash = array('d', [MISSING]) * (self.rows * self.columns)
+
+        for row, hospital in enumerate(hospitals):
+            offset = row * self.columns
+            for procedure, proc_data in hospital['procedures'].items():
+                self.cash[offset + procedure_index[procedure]] = proc_data['cash_price']
+
+    def memory_bytes(self):
+        """Bytes used by the price array"""
+        return self.cash.itemsize * len(self.cash)
+
+
+RANKED_PRICES = ('cash_price', 'base_price', 'insurance_price')
+
+
+class ProcedureRankings:
+    """Per-procedure hospital rows of one city, pre-sorted by each price kind
+
+    by_price[procedure][price] lists the rows offering the procedure, cheapest first;
+    comparison_order[procedure] lists every row in the order compare_hospitals ranks
+    a single-procedure query (by cash price rounded to cents, hospitals without the
+    procedure counting as 0, ties in data order). Both are built once, so a
+    single-procedure ranking is read instead of sorted.
+    """
+
+    def __init__(self, hospitals):
+        offered = {}
+        for row, hospital in enumerate(hospitals):
+            for procedure, proc_data in hospital['procedures'].items():
+                offered.setdefault(procedure, []).append((row, proc_data))
+
+        self.rows = len(hospitals)
+        self.by_price = {}
+        self.comparison_order = {}
+        for procedure, entries in offered.items():
+            self.by_price[procedure] = {
+                price: array('i', [row for row, proc_data in
+                                   sorted(entries, key=lambda entry: (round(entry[1][price], 2), entry[0]))])
+                for price in RANKED_PRICES
+            }
+            cash = {row: round(proc_data['cash_price'], 2) for row, proc_data in entries}
+            self.comparison_order[procedure] = array('i', sorted(range(self.rows), key=lambda row: cash.get(row, 0)))
+
+    def ranked(self, procedure, price='cash_price'):
+        """Rows offering a procedure, cheapest first by the given price"""
+        if price not in RANKED_PRICES:
+            raise ValueError(f"Unknown price to rank by: {price}")
+        orders = self.by_price.get(procedure)
+        return orders[price] if orders is not None else array('i')
+
+    def comparison(self, procedure):
+        """Every row in compare_hospitals order for a single-procedure query"""
+        order = self.comparison_order.get(procedure)
+        return order if order is not None else range(self.rows)
+
+
+class ComparisonRanking:
+    """The hospitals of one comparison in compare_hospitals order, built only where asked
+
+    keys holds each candidate's cash total rounded to the cent (ties rank in candidate
+    order), or order lists the candidates already ranked. build turns a list of
+    candidate positions into results. A page is picked by heap selection, so the top k
+    of n candidates cost O(n log k) instead of a sort and only k results are built;
+    select, when given, picks pages instead (the NumPy kernel uses argpartition).
+    """
+
+    def __init__(self, build, keys=None, order=None, select=None):
+        self.build = build
+        self.keys = keys
+        self.order = order
+        self._select = select
+        self.count = len(order) if order is not None else len(keys)
+
+    def positions(self, start=0, stop=None):
+        """Candidate positions ranked start (inclusive) to stop (exclusive, None for the end)"""
+        if self.order is not None:
+            return list(self.order[start:stop])
+        if self._select is not None:
+            return self._select(start, stop)
+        candidates = range(self.count)
+        if stop is None:
+            return sorted(candidates, key=self.keys.__getitem__)[start:]
+        return heapq.nsmallest(stop, candidates, key=self.keys.__getitem__)[start:]
+
+    def page(self, offset=0, limit=None):
+        """Results ranked offset to offset + limit (to the end when limit is None)"""
+        if offset < 0 or (limit is not None and limit < 0):
+            raise ValueError("limit and offset should not be negative")
+        return self.build(self.positions(offset, None if limit is None else offset + limit))
+
+    def extremes(self):
+        """Positions of the first and the last candidate of the whole ranking, or (None, None)"""
+        if not self.count:
+            return None, None
+        if self.order is not None:
+            return self.order[0], self.order[-1]
+        keys = self.keys
+        return min(range(self.count), key=keys.__getitem__), max(range(self.count), key=lambda position: (keys[position], position))
+
+    def extreme_results(self):
+        """Results of the cheapest and the most expensive candidate, or (None, None)"""
+        first, last = self.extremes()
+        if first is None:
+            return None, None
+        cheapest, most_expensive = self.build([first, last])
+        return cheapest, most_expensive
+
+
+MISSING_CENTS = -1  # cents sentinel for a procedure the hospital does not offer
+
+
+def _cents(price):
+    """A price rounded to the cent, as whole cents so totals add up exactly"""
+    return round(round(price, 2) * 100)
+
+
+class NationalRankings:
+    """Per-procedure price orders over every hospital of a dataset, grouped by state
+
+    Rows are numbered city by city in data order, as in NationalFacets. For each
+    procedure and price kind, orders[(procedure, price)] holds the rows offering the
+    procedure sorted by state, then price, then row, and starts[(procedure, price)][s]
+    is where state s begins in it. A state query reads its slice of the order; a national
+    query merges the per-state slices lazily, so the k cheapest cost O(states + k log states)
+    instead of a sort over every hospital.
+
+    A procedure set is ranked by its total price with the threshold algorithm: the
+    per-procedure orders are read in turn, each new row's total is looked up in a
+    row x procedure array of cents, and reading stops once no unread row can beat
+    the k-th total found. Only row numbers and prices are kept, so sharded datasets
+    are not pinned in memory.
+    """
+
+    def __init__(self, locations, city_hospitals, states):
+        """states: the state of each location, which may differ from its key for flat-format data"""
+        self.locations = [(state, city) for _, state, city in locations]
+        self.offsets = []
+        self.states = list(dict.fromkeys(states))
+        self.state_position = {state: position for position, state in enumerate(self.states)}
+        self.procedure_index = {}
+        row_states = array('i')
+        entries = []
+        for (state, city), region in zip(self.locations, states):
+            self.offsets.append(len(row_states))
+            for hospital in city_hospitals(state, city):
+                row = len(row_states)
+                for procedure, proc_data in hospital['procedures'].items():
+                    column = self.procedure_index.setdefault(procedure, len(self.procedure_index))
+                    entries.append((row, column, [_cents(proc_data[price]) for price in RANKED_PRICES]))
+                row_states.append(self.state_position[region])
+
+        self.row_states = row_states
+        self.rows = len(row_states)
+        self.columns = len(self.procedure_index)
+        self.cents = {price: array('q', [MISSING_CENTS]) * (self.rows * self.columns) for price in RANKED_PRICES}
+        offered = {}
+        for row, column, cents in entries:
+            for price, value in zip(RANKED_PRICES, cents):
+                self.cents[price][row * self.columns + column] = value
+            offered.setdefault(column, []).append(row)
+
+        self.orders = {}
+        self.starts = {}
+        for procedure, column in self.procedure_index.items():
+            for price in RANKED_PRICES:
+                prices = self.cents[price]
+                order = array('i', sorted(offered[column], key=lambda row: (
+                    row_states[row], prices[row * self.columns + column], row)))
+                counts = [0] * len(self.states)
+                for row in order:
+                    counts[row_states[row]] += 1
+                self.orders[(procedure, price)] = order
+                self.starts[(procedure, price)] = array('i', [0, *itertools.accumulate(counts)])
+
+    def locate(self, row):
+        """((state, city), row within that city) of a national row"""
+        position = bisect_right(self.offsets, row) - 1
+        return self.locations[position], row - self.offsets[position]
+
+    def state_of(self, row):
+        """State a national row belongs to"""
+        return self.states[self.row_states[row]]
+
+    def _stream(self, procedure, price, state):
+        """(cents, row) of the rows offering a procedure, cheapest first, in one state or nationwide"""
+        order = self.orders[(procedure, price)]
+        starts = self.starts[(procedure, price)]
+        prices = self.cents[price]
+        column = self.procedure_index[procedure]
+
+        def read(start, end):
+            for position in range(start, end):
+                row = order[position]
+                yield prices[row * self.columns + column], row
+
+        if state is not None:
+            position = self.state_position[state]
+            return read(starts[position], starts[position + 1])
+        return heapq.merge(*(read(starts[position], starts[position + 1])
+                             for position in range(len(self.states)) if starts[position] < starts[position + 1]))
+
+    def cheapest(self, procedures, price='cash_price', limit=10, state=None, accept=None):
+        """Up to limit (total cents, row) of the rows offering every procedure, cheapest first
+
+        Ties keep data order. state limits the ranking to one state; accept, when given,
+        is asked about candidate rows and the ones it rejects are skipped.
+        """
+        if price not in RANKED_PRICES:
+            raise ValueError(f"Unknown price to rank by: {price}")
+        procedures = list(dict.fromkeys(procedures))
+        if (not procedures or limit <= 0 or any(procedure not in self.procedure_index for procedure in procedures)
+                or (state is not None and state not in self.state_position)):
+            return []
+        streams = [self._stream(procedure, price, state) for procedure in procedures]
+        if len(streams) == 1:
+            return list(itertools.islice((entry for entry in streams[0] if accept is None or accept(entry[1])), limit))
+
+        prices = self.cents[price]
+        columns = [self.procedure_index[procedure] for procedure in procedures]
+        best = []  # (-total, -row) heap whose first entry is the worst of the best so far
+        seen = set()
+        last = [0] * len(streams)
+        while True:
+            for position, stream in enumerate(streams):
+                entry = next(stream, None)
+                if entry is None:
+                    # Every row offering this procedure has been read, so nothing unseen qualifies
+                    return sorted((-total, -row) for total, row in best)
+                last[position], row = entry
+                if row in seen:
+                    continue
+                seen.add(row)
+                offset = row * self.columns
+                totals = [prices[offset + column] for column in columns]
+                if MISSING_CENTS in totals or (accept is not None and not accept(row)):
+                    continue
+                key = (-sum(totals), -row)
+                if len(best) < limit:
+                    heapq.heappush(best, key)
+                elif key > best[0]:
+                    heapq.heapreplace(best, key)
+            # An unread row costs at least the sum of the prices just read in each order
+            if len(best) == limit and -best[0][0] < sum(last):
+                return sorted((-total, -row) for total, row in best)
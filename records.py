@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+"""
+Compact Hospital Records for FinHealth Bot
+Slot-based hospital and procedure price records that replace the per-hospital JSON dicts in memory
+
+Records behave like read-only dicts (get, [], in, keys, items), so existing lookups keep
+working unchanged. Insurance, specialty and procedure names are interned and identical
+name lists are shared between hospitals; procedure prices live in one typed array per
+hospital. to_dict() turns a record back into the JSON dict shape at the API boundary.
+
+Comparison results are views of the same kind: ComparisonResult references the hospital
+record and prices it only when a pricing field is first read, and its "hospital" summary
+reads the record's fields on access, so nothing is copied until a response is rendered or
+JSON-encoded (see json_default).
+"""
+
+import math
+import sys
+from array import array
+from collections.abc import Mapping
+
+_MISSING = object()  # marks a field the source record did not have
+
+PRICE_KEYS = ('base_price', 'cash_price', 'insurance_price', 'savings_cash')
+INT_PRICE_MISSING = -2 ** 63  # missing price in an integer price array
+# Fields the build step derives for lookups; they are internal and stay out of API responses
+BUILD_ONLY_FIELDS = frozenset(('estimated_wait_time', 'insurance_lower'))
+
+
+def to_dict(value):
+    """Convert records (and any tuples of names inside them) back to plain JSON values"""
+    if isinstance(value, _Record):
+        return value.to_dict()
+    if isinstance(value, (list, tuple)):
+        return [to_dict(item) for item in value]
+    if isinstance(value, dict):
+        return {key: to_dict(item) for key, item in value.items()}
+    return value
+
+
+def public_hospital(hospital):
+    """Plain dict of a hospital record or dict for API responses, without the build step's lookup fields"""
+    return {key: to_dict(value) for key, value in hospital.items() if key not in BUILD_ONLY_FIELDS}
+
+
+def json_default(value):
+    """json.dumps default= hook that encodes records as the dicts they stand for"""
+    if isinstance(value, _Record):
+        return value.to_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class _Record(Mapping):
+    """Read-only dict behaviour shared by the record types"""
+
+    __slots__ = ()
+
+    def __eq__(self, other):
+        if not isinstance(other, Mapping):
+            return NotImplemented
+        return to_dict(self) == to_dict(other)
+
+    __hash__ = None
+
+    def to_dict(self):
+        return {key: to_dict(item) for key, item in self.items()}
+
+    def __repr__(self):
+        return f"{type(self).__name__}({to_dict(self)!r})"
+
+
+class ProcedurePrice(_Record):
+    """Base, cash and insurance price (and cash savings) of one procedure at one hospital"""
+
+    __slots__ = PRICE_KEYS
+
+    def __init__(self, base_price=_MISSING, cash_price=_MISSING, insurance_price=_MISSING, savings_cash=_MISSING):
+        self.base_price = base_price
+        self.cash_price = cash_price
+        self.insurance_price = insurance_price
+        self.savings_cash = savings_cash
+
+    def __getitem__(self, key):
+        if key in PRICE_KEYS:
+            value = getattr(self, key)
+            if value is not _MISSING:
+                return value
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        if key in PRICE_KEYS:
+            value = getattr(self, key)
+            if value is not _MISSING:
+                return value
+        return default
+
+    def __iter__(self):
+        return (key for key in PRICE_KEYS if getattr(self, key) is not _MISSING)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+class ProcedureTable(_Record):
+    """A hospital's procedures -> ProcedurePrice, backed by one flat price array
+
+    Each procedure takes one cell per PRICE_KEYS entry, and the procedure name ->
+    index mapping is shared by every hospital offering the same procedures in the
+    same order. Prices are stored as 64-bit integers when every price is an
+    integer, otherwise as doubles with a per-price int flag.
+    """
+
+    __slots__ = ('_index', '_prices', '_int_flags')
+
+    def __init__(self, index, prices, int_flags=None):
+        self._index = index
+        self._prices = prices
+        self._int_flags = int_flags
+
+    def _price(self, cell):
+        value = self._prices[cell]
+        if self._int_flags is None:
+            return _MISSING if value == INT_PRICE_MISSING else value
+        if math.isnan(value):
+            return _MISSING
+        return int(value) if self._int_flags[cell] else value
+
+    def __getitem__(self, procedure):
+        cell = self._index[procedure] * len(PRICE_KEYS)
+        return ProcedurePrice(self._price(cell), self._price(cell + 1), self._price(cell + 2), self._price(cell + 3))
+
+    def __contains__(self, procedure):
+        return procedure in self._index
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+
+HOSPITAL_FIELDS = (
+    'id', 'name', 'rating', 'address', 'phone', 'emergency', 'specialties',
+    'insurance_accepted', 'cash_discount', 'average_wait_time', 'procedures',
+    'estimated_wait_time', 'insurance_lower'
+)
+_NAME_LIST_FIELDS = ('specialties', 'insurance_accepted', 'insurance_lower')
+_HOSPITAL_FIELD_SET = frozenset(HOSPITAL_FIELDS)
+
+
+class Hospital(_Record):
+    """One hospital; fields outside HOSPITAL_FIELDS are kept in a small extra dict"""
+
+    __slots__ = HOSPITAL_FIELDS + ('_extra',)
+
+    def __getitem__(self, key):
+        if key in _HOSPITAL_FIELD_SET:
+            value = getattr(self, key)
+            if value is not _MISSING:
+                return value
+        elif self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        if key in _HOSPITAL_FIELD_SET:
+            value = getattr(self, key)
+            return default if value is _MISSING else value
+        if self._extra is not None:
+            return self._extra.get(key, default)
+        return default
+
+    def __iter__(self):
+        for field in HOSPITAL_FIELDS:
+            if getattr(self, field) is not _MISSING:
+                yield field
+        if self._extra is not None:
+            yield from self._extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+class RecordBuilder:
+    """Builds records from JSON dicts, sharing interned names and name tuples between them"""
+
+    def __init__(self):
+        self._tuples = {}
+        self._indexes = {}
+
+    def _names(self, values):
+        names = tuple(sys.intern(value) if isinstance(value, str) else value for value in values)
+        return self._tuples.setdefault(names, names)
+
+    def procedures(self, procedures):
+        """Build a ProcedureTable, or keep the dict when it holds anything but the price keys"""
+        prices = []
+        for proc_data in procedures.values():
+            if not isinstance(proc_data, dict) or not set(proc_data) <= set(PRICE_KEYS):
+                return procedures
+            for key in PRICE_KEYS:
+                value = proc_data.get(key, _MISSING)
+                if value is not _MISSING and (isinstance(value, bool) or not isinstance(value, (int, float))):
+                    return procedures
+                prices.append(value)
+
+        names = self._names(procedures)
+        index = self._indexes.get(names)
+        if index is None:
+            index = self._indexes[names] = {name: column for column, name in enumerate(names)}
+
+        present = [value for value in prices if value is not _MISSING]
+        if all(isinstance(value, int) and INT_PRICE_MISSING < value < 2 ** 63 for value in present):
+            return ProcedureTable(index, array('q', [INT_PRICE_MISSING if value is _MISSING else value
+                                                     for value in prices]))
+        return ProcedureTable(
+            index,
+            array('d', [math.nan if value is _MISSING else value for value in prices]),
+            bytearray(isinstance(value, int) for value in prices)
+        )
+
+    def hospital(self, data):
+        """Build a Hospital record from one hospital dict"""
+        hospital = Hospital()
+        for field in HOSPITAL_FIELDS:
+            value = data.get(field, _MISSING)
+            if field in _NAME_LIST_FIELDS and isinstance(value, list):
+                value = self._names(value)
+            elif field == 'procedures' and isinstance(value, dict):
+                value = self.procedures(value)
+            setattr(hospital, field, value)
+        extra = {key: value for key, value in data.items() if key not in _HOSPITAL_FIELD_SET}
+        hospital._extra = extra or None
+        return hospital
+
+
+def compact_hospital_data(hospitals_data, builder=None):
+    """Return the hospitals section (nationwide or flat format) with every hospital as a record"""
+    builder = builder or RecordBuilder()
+    compacted = {}
+    for key, value in hospitals_data.items():
+        if isinstance(value, Mapping):
+            compacted[key] = {city: [builder.hospital(h) for h in hospitals] for city, hospitals in value.items()}
+        else:
+            compacted[key] = [builder.hospital(h) for h in value]
+    return compacted
+
+
+SUMMARY_FIELDS = (
+    'name', 'rating', 'address', 'phone', 'emergency', 'insurance_accepted', 'specialties', 'average_wait_time'
+)
+_SUMMARY_FIELD_SET = frozenset(SUMMARY_FIELDS)
+
+
+class HospitalSummary(_Record):
+    """The "hospital" part of a comparison result, read from the hospital record on access"""
+
+    __slots__ = ('_hospital',)
+
+    def __init__(self, hospital):
+        self._hospital = hospital
+
+    def __getitem__(self, key):
+        if key not in _SUMMARY_FIELD_SET:
+            raise KeyError(key)
+        value = self._hospital[key]
+        return list(value) if key in _NAME_LIST_FIELDS else value
+
+    def __iter__(self):
+        return iter(SUMMARY_FIELDS)
+
+    def __len__(self):
+        return len(SUMMARY_FIELDS)
+
+    def to_dict(self):
+        hospital = self._hospital
+        return {field: list(hospital[field]) if field in _NAME_LIST_FIELDS else hospital[field]
+                for field in SUMMARY_FIELDS}
+
+
+RESULT_FIELDS = (
+    'hospital', 'procedures', 'total_cost', 'total_cash_cost', 'total_savings_cash',
+    'cash_discount_percent', 'estimated_wait_time'
+)
+_PRICED_FIELDS = frozenset(('procedures', 'total_cost', 'total_cash_cost', 'total_savings_cash'))
+
+
+class ComparisonResult(_Record):
+    """One hospital's comparison entry for a procedure list, priced on first access
+
+    extra holds fields some queries add, such as the "state" and "city" of nationwide results.
+    """
+
+    __slots__ = ('_hospital', '_procedures', '_extra', '_costs', '_total_cost', '_total_cash_cost')
+
+    def __init__(self, hospital, procedures, extra=None):
+        self._hospital = hospital
+        self._procedures = procedures
+        self._extra = extra
+        self._costs = None
+
+    def _price(self):
+        """Per-procedure costs and base and cash totals, added up in request order"""
+        procedure_costs = []
+        total_cost = 0
+        total_cash_cost = 0
+        hospital_procedures = self._hospital['procedures']
+        for procedure in self._procedures:
+            if procedure in hospital_procedures:
+                # Fallback prices and savings are resolved by the dataset build step
+                proc_data = hospital_procedures[procedure]
+                base_price = proc_data['base_price']
+                cash_price = proc_data['cash_price']
+                procedure_costs.append({
+                    "procedure": procedure,
+                    "base_price": base_price,
+                    "cash_price": cash_price,
+                    "insurance_price": proc_data['insurance_price'],
+                    "savings_cash": proc_data['savings_cash']
+                })
+                total_cost += base_price
+                total_cash_cost += cash_price
+        self._costs = procedure_costs
+        self._total_cost = total_cost
+        self._total_cash_cost = total_cash_cost
+
+    def __getitem__(self, key):
+        if key in _PRICED_FIELDS:
+            if self._costs is None:
+                self._price()
+            if key == 'procedures':
+                return self._costs
+            if key == 'total_cost':
+                return round(self._total_cost, 2)
+            if key == 'total_cash_cost':
+                return round(self._total_cash_cost, 2)
+            return round(self._total_cost - self._total_cash_cost, 2)
+        if key == 'hospital':
+            return HospitalSummary(self._hospital)
+        if key == 'cash_discount_percent':
+            return self._hospital['cash_discount']
+        if key == 'estimated_wait_time':
+            return self._hospital['estimated_wait_time']
+        if self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __iter__(self):
+        yield from RESULT_FIELDS
+        if self._extra is not None:
+            yield from self._extra
+
+    def __len__(self):
+        return len(RESULT_FIELDS) + len(self._extra or ())
+
+    def to_dict(self):
+        # Field by field rather than through __getitem__: encoding every result is the common case
+        if self._costs is None:
+            self._price()
+        hospital = self._hospital
+        total_cost = self._total_cost
+        total_cash_cost = self._total_cash_cost
+        result = {
+            "hospital": HospitalSummary(hospital).to_dict(),
+            "procedures": [dict(cost) for cost in self._costs],
+            "total_cost": round(total_cost, 2),
+            "total_cash_cost": round(total_cash_cost, 2),
+            "total_savings_cash": round(total_cost - total_cash_cost, 2),
+            "cash_discount_percent": hospital['cash_discount'],
+            "estimated_wait_time": hospital['estimated_wait_time']
+        }
+        if self._extra is not None:
+            result.update(self._extra)
+        return result
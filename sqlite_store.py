@@ -0,0 +1,457 @@
+#!/usr/bin/env python3
+"""
+SQLite Hospital Store for FinHealth Bot
+Converts the JSON pricing data into an indexed SQLite database that HospitalDataManager can query directly
+
+Usage:
+    python sqlite_store.py data/nationwide_hospital_data.json [data/hospitals.db]
+
+City lookups, hospital filters and procedure prices are answered by indexed
+SQL queries, so only the hospitals of the requested city are ever read into memory and any
+number of worker processes can share one database file.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+from build_dataset import ensure_built
+from city_index import CityIndex
+from dataset import DatasetSnapshot
+from geo_index import CityGrid, build_location_coordinates, location_states
+from hospital_index import normalize_hospital_name
+from zip_index import resolve_place
+
+SQLITE_SUFFIX = '.db'
+SCHEMA_VERSION = 1  # bump whenever SCHEMA or the meta entries change; older files must be rebuilt
+
+SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE locations (
+    id INTEGER PRIMARY KEY,
+    state TEXT,
+    city TEXT NOT NULL,
+    state_norm TEXT,
+    city_norm TEXT NOT NULL,
+    hospital_count INTEGER NOT NULL
+);
+CREATE TABLE hospitals (
+    id INTEGER PRIMARY KEY,
+    location_id INTEGER NOT NULL REFERENCES locations(id),
+    position INTEGER NOT NULL,
+    emergency INTEGER NOT NULL,
+    rating REAL,
+    average_wait_time REAL,
+    source_id TEXT,
+    name_norm TEXT NOT NULL,
+    record TEXT NOT NULL,
+    procedures TEXT NOT NULL
+);
+CREATE TABLE procedure_prices (
+    hospital_id INTEGER NOT NULL REFERENCES hospitals(id),
+    procedure TEXT NOT NULL,
+    base_price,
+    cash_price,
+    insurance_price,
+    savings_cash,
+    PRIMARY KEY (hospital_id, procedure)
+);
+CREATE TABLE hospital_insurance (
+    hospital_id INTEGER NOT NULL REFERENCES hospitals(id),
+    insurance_norm TEXT NOT NULL
+);
+CREATE TABLE hospital_specialty (
+    hospital_id INTEGER NOT NULL REFERENCES hospitals(id),
+    specialty_norm TEXT NOT NULL
+);
+CREATE INDEX idx_locations_city ON locations (city_norm);
+CREATE INDEX idx_locations_state ON locations (state_norm);
+CREATE INDEX idx_hospitals_location ON hospitals (location_id, position);
+CREATE INDEX idx_hospitals_emergency ON hospitals (location_id, emergency, position);
+CREATE INDEX idx_hospitals_rating ON hospitals (location_id, rating);
+CREATE INDEX idx_hospitals_wait_time ON hospitals (location_id, average_wait_time);
+CREATE INDEX idx_hospitals_source_id ON hospitals (source_id);
+CREATE INDEX idx_hospitals_name ON hospitals (name_norm);
+CREATE INDEX idx_prices_procedure ON procedure_prices (procedure, hospital_id);
+CREATE INDEX idx_insurance_plan ON hospital_insurance (insurance_norm, hospital_id);
+CREATE INDEX idx_specialty ON hospital_specialty (specialty_norm, hospital_id);
+"""
+
+PRICE_KEYS = ('base_price', 'cash_price', 'insurance_price', 'savings_cash')
+# Dataset sections kept in the meta table, so a store-backed app never loads the JSON file
+SECTION_KEYS = ('insurance_plans', 'medical_conditions', 'metadata')
+
+
+def sqlite_path_for(json_path):
+    """Path of the SQLite database that sits next to a JSON dataset file"""
+    return os.path.splitext(json_path)[0] + SQLITE_SUFFIX
+
+
+def build_sqlite_store(data, output_path, version=None):
+    """Write a dataset's hospitals into a new SQLite database, building the data first if needed
+
+    Returns build stats.
+    """
+    data = ensure_built(data, output_path)
+    hospitals_data = data.get('hospitals', {})
+    nested = any(isinstance(value, dict) for value in hospitals_data.values())
+    if nested:
+        groups = [(state, city, city_hospitals)
+                  for state, cities in hospitals_data.items()
+                  for city, city_hospitals in cities.items()]
+    else:
+        groups = [(None, city, city_hospitals) for city, city_hospitals in hospitals_data.items()]
+
+    tmp_path = output_path + '.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    stats = {"locations": 0, "hospitals": 0, "prices": 0}
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.executescript(SCHEMA)
+        for state, city, city_hospitals in groups:
+            location_id = conn.execute(
+                "INSERT INTO locations (state, city, state_norm, city_norm, hospital_count) VALUES (?, ?, ?, ?, ?)",
+                (state, city, state.lower() if state is not None else None, city.lower(), len(city_hospitals))
+            ).lastrowid
+            stats["locations"] += 1
+
+            for position, hospital in enumerate(city_hospitals):
+                procedures = hospital['procedures']
+                record = {key: value for key, value in hospital.items() if key != 'procedures'}
+                hospital_id = conn.execute(
+                    "INSERT INTO hospitals (location_id, position, emergency, rating, average_wait_time, source_id, "
+                    "name_norm, record, procedures) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (location_id, position, int(hospital['emergency']),
+                     hospital['rating'], hospital['average_wait_time'],
+                     str(hospital['id']) if hospital.get('id') is not None else None,
+                     normalize_hospital_name(hospital['name']), json.dumps(record), json.dumps(procedures))
+                ).lastrowid
+                conn.executemany(
+                    "INSERT INTO procedure_prices VALUES (?, ?, ?, ?, ?, ?)",
+                    [(hospital_id, procedure, *(proc_data[key] for key in PRICE_KEYS))
+                     for procedure, proc_data in procedures.items()]
+                )
+                conn.executemany(
+                    "INSERT INTO hospital_insurance VALUES (?, ?)",
+                    [(hospital_id, plan) for plan in dict.fromkeys(hospital['insurance_lower'])]
+                )
+                conn.executemany(
+                    "INSERT INTO hospital_specialty VALUES (?, ?)",
+                    [(hospital_id, specialty)
+                     for specialty in dict.fromkeys(name.lower() for name in hospital['specialties'])]
+                )
+                stats["hospitals"] += 1
+                stats["prices"] += len(procedures)
+
+        conn.executemany("INSERT INTO meta VALUES (?, ?)", [
+            ("schema_version", str(SCHEMA_VERSION)),
+            ("nested", json.dumps(nested)),
+            ("version", version or ""),
+            ("top_level_keys", json.dumps(list(hospitals_data))),
+            ("sections", json.dumps({key: data[key] for key in SECTION_KEYS if key in data}))
+        ])
+        conn.commit()
+    finally:
+        conn.close()
+
+    os.replace(tmp_path, output_path)
+    stats["bytes"] = os.path.getsize(output_path)
+    return stats
+
+
+class SQLiteHospitalStore:
+    """Read-only, indexed access to a database written by build_sqlite_store
+
+    Each thread gets its own connection; the database is opened read-only, so
+    many processes can query the same file concurrently.
+    """
+
+    def __init__(self, path):
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+        self.path = path
+        self._local = threading.local()
+        meta = dict(self._connection().execute("SELECT key, value FROM meta"))
+        if meta.get('schema_version') != str(SCHEMA_VERSION):
+            self.close()
+            raise ValueError(f"Hospital database {path} has an outdated schema; "
+                             "rebuild it with python sqlite_store.py <dataset.json>")
+        self.nested = json.loads(meta['nested'])
+        self.version = meta.get('version') or None
+        self._top_level_keys = frozenset(json.loads(meta['top_level_keys']))
+        self.sections = json.loads(meta['sections'])
+        # The locations table is small, so city lookups use the same in-memory index as the snapshot
+        self._locations = {}
+        for location_id, state, city, hospital_count in self._connection().execute(
+                "SELECT id, state, city, hospital_count FROM locations ORDER BY id"):
+            self._locations[(state, city)] = (location_id, hospital_count)
+        locations = [(city.lower(), state, city) for state, city in self._locations]
+        self.city_index = CityIndex(locations)
+        # Same mapping as HospitalDataManager.city_to_state builds from an in-memory dataset
+        self.city_to_state = {city_lower: state if state is not None else city for city_lower, state, city in locations}
+        # Flat-format cities have no state of their own, so state queries use the reference one
+        self._state_locations = {}
+        self._location_places = {}
+        for (_, state, city), region in zip(locations, location_states(locations)):
+            location_id = self._locations[(state, city)][0]
+            self._state_locations.setdefault(region, []).append(location_id)
+            self._location_places[location_id] = (region, city)
+        self.geo_index = CityGrid((point[0], point[1], (state, city)) for (_, state, city), point
+                                  in zip(locations, build_location_coordinates(locations)) if point)
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            self._local.conn = conn
+        return conn
+
+    def snapshot(self):
+        """DatasetSnapshot of the stored sections with no hospitals
+
+        Installed as the shared dataset, it gives the analyzers their insurance plans and
+        medical conditions while every hospital query goes to the store.
+        """
+        return DatasetSnapshot(dict(self.sections, hospitals={}), source=self.path, version=self.version)
+
+    def has_top_level_key(self, name):
+        """Whether the source data has this exact state (nationwide) or city (flat) key"""
+        return name in self._top_level_keys
+
+    def locate_city(self, city_name):
+        """Find a city like HospitalDataManager._locate_city
+
+        Resolved with the same city and ZIP indexes as the in-memory dataset, built from
+        the locations table. Returns (location_id, (state, city), hospital_count), or
+        (None, (None, None), 0) when nothing matches.
+        """
+        location = resolve_place(city_name, self.city_index, self.geo_index)
+        if location is None:
+            return None, (None, None), 0
+        location_id, hospital_count = self._locations[location]
+        return location_id, location, hospital_count
+
+    def location_id(self, state, city):
+        """Location id of a (state, city) from city_index, or None"""
+        location = self._locations.get((state, city))
+        return location[0] if location is not None else None
+
+    def _hospitals(self, query, params):
+        return [dict(json.loads(record), procedures=json.loads(procedures))
+                for record, procedures in self._connection().execute(query, params)]
+
+    def city_hospitals(self, location_id):
+        """Full hospital records of one city, in source order"""
+        return self._hospitals(
+            "SELECT record, procedures FROM hospitals WHERE location_id = ? ORDER BY position", (location_id,)
+        )
+
+    def hospital_by_id(self, hospital_id):
+        """((state, city), hospital) of the hospital with this source id, or None"""
+        rows = self._connection().execute(
+            "SELECT l.state, l.city, h.record, h.procedures FROM hospitals h "
+            "JOIN locations l ON l.id = h.location_id WHERE h.source_id = ? ORDER BY h.id LIMIT 1",
+            (str(hospital_id),)
+        )
+        for state, city, record, procedures in rows:
+            return (state, city), dict(json.loads(record), procedures=json.loads(procedures))
+        return None
+
+    def hospitals_named(self, name):
+        """Every hospital with this name (see normalize_hospital_name), as ((state, city), hospital) in source order"""
+        rows = self._connection().execute(
+            "SELECT l.state, l.city, h.record, h.procedures FROM hospitals h JOIN locations l ON l.id = h.location_id "
+            "WHERE h.name_norm = ? ORDER BY h.location_id, h.position", (normalize_hospital_name(name),)
+        )
+        return [((state, city), dict(json.loads(record), procedures=json.loads(procedures)))
+                for state, city, record, procedures in rows]
+
+    def _filter_condition(self, filters):
+        """SQL condition on hospitals h and its parameters for a checked filters dict (see facet_index)"""
+        conditions = ["1"]
+        params = []
+        for key, value in (filters or {}).items():
+            if key == 'emergency':
+                conditions.append("h.emergency = ?")
+                params.append(int(value))
+            elif key == 'min_rating':
+                conditions.append("h.rating >= ?")
+                params.append(value)
+            elif key == 'max_wait_time':
+                conditions.append("h.average_wait_time <= ?")
+                params.append(value)
+            elif key == 'insurance':
+                conditions.extend(["h.id IN (SELECT hospital_id FROM hospital_insurance WHERE insurance_norm = ?)"] * len(value))
+                params.extend(plan.lower() for plan in value)
+            elif key == 'specialties':
+                conditions.extend(["h.id IN (SELECT hospital_id FROM hospital_specialty WHERE specialty_norm = ?)"]
+                                  * len(value))
+                params.extend(specialty.lower() for specialty in value)
+            elif key == 'procedures':
+                conditions.extend(["h.id IN (SELECT hospital_id FROM procedure_prices WHERE procedure = ?)"] * len(value))
+                params.extend(value)
+        return " AND ".join(conditions), tuple(params)
+
+    def filtered_hospitals(self, location_id, filters):
+        """Hospitals of one city matching every filter, in source order"""
+        condition, params = self._filter_condition(filters)
+        return self._hospitals(
+            f"SELECT h.record, h.procedures FROM hospitals h WHERE h.location_id = ? AND {condition} "
+            "ORDER BY h.position", (location_id, *params)
+        )
+
+    def filtered_hospitals_nationwide(self, filters):
+        """Every hospital matching every filter, as ((state, city), hospital) in source order"""
+        condition, params = self._filter_condition(filters)
+        rows = self._connection().execute(
+            "SELECT l.state, l.city, h.record, h.procedures FROM hospitals h "
+            f"JOIN locations l ON l.id = h.location_id WHERE {condition} ORDER BY h.location_id, h.position", params
+        )
+        return [((state, city), dict(json.loads(record), procedures=json.loads(procedures)))
+                for state, city, record, procedures in rows]
+
+    def locations_matching(self, filters):
+        """Set of (state, city) with at least one hospital matching every filter"""
+        condition, params = self._filter_condition(filters)
+        return set(self._connection().execute(
+            f"SELECT DISTINCT l.state, l.city FROM hospitals h JOIN locations l ON l.id = h.location_id WHERE {condition}",
+            params
+        ))
+
+    def feature_ranges(self, location_id):
+        """((lowest, highest) rating, (lowest, highest) average wait time) over every hospital of a city"""
+        row = self._connection().execute(
+            "SELECT min(rating), max(rating), min(average_wait_time), max(average_wait_time) "
+            "FROM hospitals WHERE location_id = ?",
+            (location_id,)
+        ).fetchone()
+        return (row[0], row[1]), (row[2], row[3])
+
+    def city_prices(self, location_id, procedures, filters=None):
+        """Each hospital of a city (matching the filters) with only the requested procedures' prices
+
+        Returns a list of hospital records, in source order, whose 'procedures' dict
+        holds just the requested procedures the hospital offers.
+        """
+        conn = self._connection()
+        hospitals = {}
+        condition, params = self._filter_condition(filters)
+        for hospital_id, record in conn.execute(
+                f"SELECT h.id, h.record FROM hospitals h WHERE h.location_id = ? AND {condition} ORDER BY h.position",
+                (location_id, *params)):
+            hospital = json.loads(record)
+            hospital['procedures'] = {}
+            hospitals[hospital_id] = hospital
+
+        wanted = list(dict.fromkeys(procedures))
+        if hospitals and wanted:
+            placeholders = ', '.join('?' * len(wanted))
+            rows = conn.execute(
+                "SELECT p.hospital_id, p.procedure, p.base_price, p.cash_price, p.insurance_price, p.savings_cash "
+                "FROM procedure_prices p JOIN hospitals h ON h.id = p.hospital_id "
+                f"WHERE h.location_id = ? AND p.procedure IN ({placeholders})",
+                (location_id, *wanted)
+            )
+            for hospital_id, procedure, *prices in rows:
+                if hospital_id not in hospitals:
+                    continue
+                hospitals[hospital_id]['procedures'][procedure] = {
+                    key: value for key, value in zip(PRICE_KEYS, prices) if value is not None
+                }
+        return list(hospitals.values())
+
+    def cheapest_prices(self, location_id, procedure, price, limit, filters=None):
+        """The limit hospitals of a city offering a procedure with the lowest price of one kind
+
+        price is one of PRICE_KEYS; ties keep source order, prices are compared to the cent.
+        Returns hospital records whose 'procedures' dict holds just that procedure.
+        """
+        if price not in PRICE_KEYS:
+            raise ValueError(f"Unknown price to rank by: {price}")
+        condition, params = self._filter_condition(filters)
+        rows = self._connection().execute(
+            "SELECT h.record, p.base_price, p.cash_price, p.insurance_price, p.savings_cash "
+            "FROM procedure_prices p JOIN hospitals h ON h.id = p.hospital_id "
+            f"WHERE p.procedure = ? AND h.location_id = ? AND {condition} "
+            f"ORDER BY round(p.{price}, 2), h.position LIMIT ?",
+            (procedure, location_id, *params, limit)
+        )
+        hospitals = []
+        for record, *prices in rows:
+            hospital = json.loads(record)
+            hospital['procedures'] = {procedure: {key: value for key, value in zip(PRICE_KEYS, prices)
+                                                  if value is not None}}
+            hospitals.append(hospital)
+        return hospitals
+
+    def cheapest_in_region(self, procedures, price, limit, state=None, filters=None):
+        """Up to limit hospitals, nationwide or in one state, offering every procedure, cheapest first
+
+        Ranked by the total of one of PRICE_KEYS over the procedures, compared to the cent,
+        ties in source order. Returns (state, city, hospital) tuples whose hospital 'procedures'
+        dict holds just the requested procedures.
+        """
+        if price not in PRICE_KEYS:
+            raise ValueError(f"Unknown price to rank by: {price}")
+        wanted = list(dict.fromkeys(procedures))
+        location_ids = self._state_locations.get(state, []) if state is not None else None
+        if not wanted or limit <= 0 or location_ids == []:
+            return []
+        conn = self._connection()
+        condition, params = self._filter_condition(filters)
+        placeholders = ', '.join('?' * len(wanted))
+        region = ""
+        if location_ids is not None:
+            region = f"AND h.location_id IN ({', '.join('?' * len(location_ids))})"
+            params = (*location_ids, *params)
+        rows = conn.execute(
+            "SELECT h.id, h.location_id, h.record FROM procedure_prices p JOIN hospitals h ON h.id = p.hospital_id "
+            f"WHERE p.procedure IN ({placeholders}) {region} AND {condition} GROUP BY h.id HAVING COUNT(*) = ? "
+            f"ORDER BY CAST(round(SUM(round(p.{price}, 2)) * 100) AS INTEGER), h.id LIMIT ?",
+            (*wanted, *params, len(wanted), limit)
+        ).fetchall()
+        if not rows:
+            return []
+
+        hospitals = {hospital_id: dict(json.loads(record), procedures={}) for hospital_id, _, record in rows}
+        for hospital_id, procedure, *prices in conn.execute(
+                "SELECT hospital_id, procedure, base_price, cash_price, insurance_price, savings_cash FROM procedure_prices "
+                f"WHERE hospital_id IN ({', '.join('?' * len(hospitals))}) AND procedure IN ({placeholders})",
+                (*hospitals, *wanted)):
+            hospitals[hospital_id]['procedures'][procedure] = {
+                key: value for key, value in zip(PRICE_KEYS, prices) if value is not None
+            }
+        return [(*self._location_places[location_id], hospitals[hospital_id]) for hospital_id, location_id, _ in rows]
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def main(args):
+    """Convert a JSON dataset file into a SQLite database"""
+    if not args:
+        print("Usage: python sqlite_store.py data/nationwide_hospital_data.json [output.db]")
+        return 1
+
+    path = args[0]
+    output_path = args[1] if len(args) > 1 else sqlite_path_for(path)
+    with open(path, 'rb') as f:
+        content = f.read()
+    version = hashlib.sha1(content).hexdigest()[:12]
+    stats = build_sqlite_store(json.loads(content), output_path, version=version)
+    print(f"✅ Built {output_path} from {path}")
+    print(f"   🏥 {stats['hospitals']:,} hospitals in {stats['locations']:,} locations")
+    print(f"   💲 {stats['prices']:,} procedure prices")
+    print(f"   📁 {stats['bytes']:,} bytes")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+"""
+Dataset Loading Tests
+Checks that every component shares one dataset snapshot and that the loaders agree with each other
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import dataset
+from build_dataset import DatasetValidationError, build_dataset, main as build_main
+from compile_dataset import CompiledDataset, CompiledHospitalList, compile_dataset, main as compile_main
+from dataset import DatasetSnapshot, get_dataset
+from generate_nationwide_data import NationwideDataGenerator
+from ingest_dataset import NDJSON_FORMAT, ingest_ndjson, write_ndjson
+from records import Hospital, compact_hospital_data, to_dict
+from hospital_data import HospitalDataManager
+from insurance_analyzer import InsuranceAnalyzer
+from medical_analyzer import MedicalAnalyzer
+from conversation_manager import ConversationManager
+
+
+def test_components_share_one_snapshot():
+    """Analyzers created without arguments reference the same snapshot"""
+    print("🔍 Testing shared dataset snapshot...")
+    snapshot = get_dataset()
+
+    hdm = HospitalDataManager()
+    ia = InsuranceAnalyzer()
+    ma = MedicalAnalyzer()
+    cm = ConversationManager(ma, hdm, ia)
+
+    assert hdm.dataset is snapshot
+    assert ia.dataset is snapshot
+    assert ma.dataset is snapshot
+    assert cm.hospital_data_manager is hdm
+    assert hdm.hospitals_data is snapshot.hospitals
+    print("✅ All components reference one dataset snapshot")
+
+
+def test_snapshot_is_read_only():
+    """Snapshots cannot be modified through their top-level mappings"""
+    snapshot = DatasetSnapshot({'hospitals': {}, 'insurance_plans': {'Aetna': {'deductible': 1}}})
+    try:
+        snapshot.hospitals['Nowhere'] = []
+    except TypeError:
+        pass
+    else:
+        raise AssertionError("snapshot hospitals should be read-only")
+
+    ia = InsuranceAnalyzer(snapshot)
+    ia.add_insurance_plan('Local Plan', 100, 1000, 80)
+    ia.update_insurance_plan('Aetna', deductible=5)
+    assert 'Local Plan' not in snapshot.insurance_plans
+    assert snapshot.insurance_plans['Aetna']['deductible'] == 1
+    print("✅ Runtime plan edits stay local to the analyzer")
+
+
+def test_fallback_when_file_missing():
+    """A missing dataset file falls back to the built-in data"""
+    snapshot = dataset.load_dataset('data/does_not_exist.json')
+    assert snapshot.source == 'fallback'
+    assert 'New York' in snapshot.hospitals
+    assert 'Aetna' in snapshot.insurance_plans
+    print("✅ Fallback dataset used when the file is missing")
+
+
+def _sample_nested_data():
+    """Small nationwide-format dataset used by the loader tests"""
+    return {
+        "hospitals": {
+            "Texas": {
+                "Lubbock": [
+                    {
+                        "id": "lubbock_texas_hospital_001",
+                        "name": "Lubbock General Hospital",
+                        "rating": 4.1,
+                        "address": "100 Main St, Lubbock, Te 79401",
+                        "phone": "(806) 555-0101",
+                        "emergency": True,
+                        "specialties": ["Cardiology", "Radiology"],
+                        "insurance_accepted": ["Aetna", "Medicare"],
+                        "cash_discount": 20,
+                        "average_wait_time": 30,
+                        "procedures": {
+                            "MRI": {"base_price": 2000, "insurance_price": 1500, "cash_price": 1600},
+                            "X-ray": {"base_price": 300, "cash_price": 240}
+                        }
+                    },
+                    {
+                        "id": "lubbock_texas_hospital_002",
+                        "name": "Lubbock Medical Center",
+                        "rating": 4,
+                        "emergency": False,
+                        "insurance_accepted": ["Cigna"],
+                        "procedures": {"MRI": {"base_price": 1800.5}},
+                        "network": "Covenant"
+                    }
+                ]
+            }
+        },
+        "insurance_plans": {"Aetna PPO": {"deductible": 1000, "out_of_pocket_max": 3000, "coverage_percent": 80}},
+        "medical_conditions": {"fever": {"common_procedures": ["Blood tests"]}},
+        "metadata": {"total_hospitals": 2}
+    }
+
+
+def test_compiled_dataset_round_trip():
+    """Compiled artifacts decode back to exactly the source JSON"""
+    print("🔍 Testing compiled dataset round trip...")
+    data = _sample_nested_data()
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = os.path.join(tmp, 'sample.json')
+        with open(json_path, 'w') as f:
+            json.dump(data, f)
+        compile_dataset(data, os.path.join(tmp, 'sample.fhdb'))
+
+        compiled = CompiledDataset(os.path.join(tmp, 'sample.fhdb'))
+        decoded = compiled.to_data()
+        built = build_dataset(data)[0]
+        lubbock = decoded['hospitals']['Texas']['Lubbock']
+        assert len(lubbock) == 2
+        assert list(lubbock) == built['hospitals']['Texas']['Lubbock']
+        assert lubbock[-1]['procedures']['MRI'] == {'base_price': 1800.5, 'cash_price': 1800.5 * 0.85,
+                                                   'insurance_price': 1800.5 * 0.75,
+                                                   'savings_cash': 1800.5 - 1800.5 * 0.85}
+        assert decoded['insurance_plans'] == data['insurance_plans']
+        # Each hospital is decoded once; the version comes from the header, so it is stable
+        assert lubbock[0] is lubbock[0] and lubbock[-1] is lubbock[1]
+        assert len(compiled.version) == 12
+        assert CompiledDataset(os.path.join(tmp, 'sample.fhdb')).version == compiled.version
+        compile_dataset(dict(data, metadata={'note': 'changed'}), os.path.join(tmp, 'other.fhdb'))
+        assert CompiledDataset(os.path.join(tmp, 'other.fhdb')).version != compiled.version
+
+        # The data/*.json glob also matches reference tables, which are skipped
+        table_path = os.path.join(tmp, 'zip_ranges.json')
+        with open(table_path, 'w') as f:
+            json.dump({'states': {}}, f)
+        assert compile_main([table_path]) == 0 and not os.path.exists(os.path.join(tmp, 'zip_ranges.fhdb'))
+
+        snapshot = dataset.load_dataset(os.path.join(tmp, 'sample.fhdb'))
+        assert snapshot.source.endswith('.fhdb')
+        assert snapshot.hospitals['Texas']['Lubbock'][0]['name'] == 'Lubbock General Hospital'
+        # The default (compact records on) load keeps hospitals in the memory map
+        assert os.getenv('DATA_COMPACT_RECORDS', '1') != '0'
+        assert isinstance(snapshot.hospitals['Texas']['Lubbock'], CompiledHospitalList)
+        assert HospitalDataManager(snapshot).compare_hospitals(['MRI'], 'Lubbock')[0]['total_cash_cost'] == 1530.42
+    print("✅ Compiled artifact matches the JSON source")
+
+
+def test_corrupt_compiled_dataset_falls_back_to_json():
+    """A damaged artifact is ignored in favour of the JSON next to it"""
+    data = _sample_nested_data()
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(os.path.join(tmp, 'sample.json'), 'w') as f:
+            json.dump(data, f)
+        with open(os.path.join(tmp, 'sample.fhdb'), 'wb') as f:
+            f.write(b'not a dataset' * 20)
+
+        snapshot = dataset.load_dataset(os.path.join(tmp, 'sample.fhdb'))
+        assert snapshot.source.endswith('sample.json')
+        assert 'Texas' in snapshot.hospitals
+    print("✅ Corrupt artifact falls back to JSON")
+
+
+def _general_hospital_mri(hdm):
+    """Cash MRI price at Lubbock General Hospital as seen by a manager"""
+    for result in hdm.compare_hospitals(['MRI'], 'Lubbock'):
+        if result['hospital']['name'] == 'Lubbock General Hospital':
+            return result['total_cash_cost']
+
+
+def test_reload_swaps_snapshot_atomically():
+    """Reloading installs a new versioned snapshot while held snapshots stay intact"""
+    print("🔍 Testing dataset hot reload...")
+    previous = get_dataset()
+    data = _sample_nested_data()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'sample.json')
+            with open(path, 'w') as f:
+                json.dump(data, f)
+            old = dataset.set_dataset(dataset.load_dataset(path))
+
+            hdm = HospitalDataManager()
+            ia = InsuranceAnalyzer()
+            ia.add_insurance_plan('Local Plan', 100, 1000, 80)
+            dataset.add_snapshot_warmer(hdm.warm_indexes)
+            assert hdm.dataset is old
+            in_flight = hdm.find_city_hospitals('Lubbock')
+
+            assert dataset.reload_dataset(path) is old  # unchanged file keeps the version
+
+            data['hospitals']['Texas']['Lubbock'][0]['procedures']['MRI']['cash_price'] = 900
+            with open(path, 'w') as f:
+                json.dump(data, f)
+            new = dataset.reload_dataset(path)
+
+            assert new is not old and new.version != old.version
+            assert hdm.dataset is new and ia.dataset is new
+            # Indexes were built before the swap, not by the first request
+            assert 'national_rankings' in new._derived and ('facets', ('Texas', 'Lubbock')) in new._derived
+            assert 'Local Plan' in ia.insurance_plans
+            assert in_flight[0]['procedures']['MRI']['cash_price'] == 1600
+            assert _general_hospital_mri(hdm) == 900
+
+            pinned = HospitalDataManager(old)
+            assert _general_hospital_mri(pinned) == 1600
+
+            os.remove(path)
+            assert dataset.reload_dataset(path) is new  # failed reload keeps serving
+    finally:
+        dataset.set_dataset(previous)
+        dataset._snapshot_warmers.remove(hdm.warm_indexes)
+    print("✅ Reload swapped in a new snapshot version")
+
+
+def test_sharded_dataset_matches_json():
+    """Per-state shards answer like the full JSON and evict shards beyond the budget"""
+    print("🔍 Testing sharded dataset...")
+    data = _sample_nested_data()
+    data['hospitals']['Oregon'] = {"Portland": [
+        {"name": "Portland Medical Center", "rating": 4.4,
+         "procedures": {"MRI": {"base_price": 1900, "cash_price": 1500}}}
+    ]}
+    with tempfile.TemporaryDirectory() as tmp:
+        NationwideDataGenerator().save_sharded_data(data, tmp)
+        full = HospitalDataManager(DatasetSnapshot(data))
+        snapshot = dataset.load_sharded_dataset(os.path.join(tmp, 'manifest.json'), max_bytes=1)
+        sharded = HospitalDataManager(snapshot)
+
+        assert snapshot.hospitals.loaded_states() == []  # only the manifest is read up front
+        assert sharded.city_to_state == full.city_to_state
+        for city in ('Lubbock', 'Portland', 'Nowhere'):
+            assert sharded.compare_hospitals(['MRI', 'X-ray'], city) == full.compare_hospitals(['MRI', 'X-ray'], city)
+        assert snapshot.hospitals.loaded_states() == ['Oregon']  # Texas was evicted
+        assert snapshot.insurance_plans == data['insurance_plans']
+
+        # A shard that no longer matches its manifest hash is refused
+        manifest = dataset.load_sharded_dataset(os.path.join(tmp, 'manifest.json'))
+        with open(os.path.join(tmp, 'texas.json'), 'w') as f:
+            json.dump({"Lubbock": []}, f)
+        try:
+            manifest.hospitals.load_state('Texas')
+            assert False, "tampered shard should not load"
+        except ValueError as e:
+            assert 'manifest' in str(e)
+
+        # Shards are only picked up when a memory budget asks for them
+        json_path = os.path.join(tmp, 'nationwide.json')
+        with open(json_path, 'w') as f:
+            json.dump(data, f)
+        saved = (dataset.SHARD_MANIFEST_FILE, dataset.NATIONWIDE_DATA_FILE,
+                 os.environ.pop('DATA_SHARD_MEMORY_MB', None))
+        dataset.SHARD_MANIFEST_FILE, dataset.NATIONWIDE_DATA_FILE = os.path.join(tmp, 'manifest.json'), json_path
+        try:
+            assert dataset._resolve_data_file() == json_path
+            os.environ['DATA_SHARD_MEMORY_MB'] = '64'
+            assert dataset._resolve_data_file() == dataset.SHARD_MANIFEST_FILE
+        finally:
+            dataset.SHARD_MANIFEST_FILE, dataset.NATIONWIDE_DATA_FILE, budget = saved
+            os.environ.pop('DATA_SHARD_MEMORY_MB', None)
+            if budget is not None:
+                os.environ['DATA_SHARD_MEMORY_MB'] = budget
+    print("✅ Sharded dataset matches the JSON dataset")
+
+
+def test_ndjson_ingest_matches_json():
+    """Streaming an NDJSON dataset rebuilds the JSON dataset and its city index"""
+    print("🔍 Testing streaming NDJSON ingest...")
+    data = _sample_nested_data()
+    data['hospitals']['Texas']['Marfa'] = []
+    assert 'locations=2>' in repr(DatasetSnapshot(data))  # cities, not states
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'sample.ndjson')
+        assert write_ndjson(data, path) == 2
+
+        updates = []
+        snapshot = dataset.load_ndjson_dataset(path, progress=lambda *args: updates.append(args))
+        bytes_read, total_bytes, hospitals = updates[-1]
+        assert hospitals == 2 and 0 < bytes_read <= total_bytes == os.path.getsize(path)
+        assert snapshot.hospitals == build_dataset(data)[0]['hospitals']
+        assert snapshot.insurance_plans == data['insurance_plans']
+        assert snapshot.metadata['total_hospitals'] == data['metadata']['total_hospitals']
+        assert HospitalDataManager(snapshot).city_to_state == \
+            HospitalDataManager(DatasetSnapshot(data)).city_to_state
+        assert dataset.load_dataset(path).version == snapshot.version
+    print("✅ NDJSON ingest matches the JSON dataset")
+
+
+def test_compact_records_round_trip():
+    """Compact records read like the source dicts and convert back to them exactly"""
+    print("🔍 Testing compact hospital records...")
+    data = _sample_nested_data()
+    hospitals = compact_hospital_data(data['hospitals'])
+    general, medical = hospitals['Texas']['Lubbock']
+
+    assert isinstance(general, Hospital)
+    assert to_dict(hospitals) == data['hospitals']
+    assert general == data['hospitals']['Texas']['Lubbock'][0]
+    assert general['procedures']['MRI']['cash_price'] == 1600
+    assert 'insurance_price' not in general['procedures']['X-ray']
+    assert general['procedures']['X-ray'].get('insurance_price', 225) == 225
+    assert medical['procedures']['MRI'] == {'base_price': 1800.5}
+    assert medical.get('network') == 'Covenant' and medical.get('address') is None
+    assert general['insurance_accepted'][0] is sys.intern('Aetna')
+    assert isinstance(to_dict(general)['insurance_accepted'], list)
+    print("✅ Compact records round trip to the JSON shape")
+
+
+def test_build_precomputes_and_validates():
+    """The build step fills derived fields and rejects malformed records"""
+    print("🔍 Testing dataset build step...")
+    data = _sample_nested_data()
+    built, errors = build_dataset(data)
+    general, medical = built['hospitals']['Texas']['Lubbock']
+
+    assert errors == []
+    assert general['procedures']['X-ray'] == {'base_price': 300, 'cash_price': 240,
+                                              'insurance_price': 225.0, 'savings_cash': 60}
+    assert general['estimated_wait_time'] == '30 minutes'
+    assert general['insurance_lower'] == ['aetna', 'medicare']
+    assert medical['cash_discount'] == 15 and medical['address'] == ''
+    assert built['locations'] == [['lubbock', 'Texas', 'Lubbock']]
+    assert build_dataset(built)[0]['hospitals'] == built['hospitals']
+
+    data['hospitals']['Texas']['Lubbock'].append({"name": "Broken Clinic", "procedures": {"MRI": {"cash_price": 10}}})
+    data['hospitals']['Texas']['Lubbock'].append({"name": "", "rating": 4})
+    try:
+        build_dataset(data)
+        assert False, "malformed records should fail a strict build"
+    except DatasetValidationError as e:
+        assert "Texas/Lubbock[2]: Broken Clinic: procedure 'MRI' has no base_price" in str(e)
+
+    snapshot = DatasetSnapshot(data)
+    assert [h['name'] for h in snapshot.hospitals['Texas']['Lubbock']] == \
+        ['Lubbock General Hospital', 'Lubbock Medical Center']
+
+    # build_dataset.py data/*.json leaves the reference tables untouched
+    with tempfile.TemporaryDirectory() as tmp:
+        table_path = os.path.join(tmp, 'city_coordinates.json')
+        with open(table_path, 'w') as f:
+            json.dump({'states': {}, 'cities': {}}, f)
+        assert build_main([table_path]) == 0
+        with open(table_path) as f:
+            assert json.load(f) == {'states': {}, 'cities': {}}
+    print("✅ Build step precomputes fields and rejects malformed records")
+
+
+def test_unbuilt_ndjson_ingest():
+    """NDJSON files written before the build step are built line by line, bad hospitals skipped"""
+    print("🔍 Testing unbuilt NDJSON ingest...")
+    data = _sample_nested_data()
+    lines = [{"format": NDJSON_FORMAT, "nested": True}]
+    lines += [{"section": key, "data": value} for key, value in data.items() if key != 'hospitals']
+    lines += [{"state": "Texas", "city": "Lubbock", "hospital": hospital}
+              for hospital in data['hospitals']['Texas']['Lubbock']]
+    lines.append({"state": "Texas", "city": "Lubbock", "hospital": {"name": "Broken Clinic", "rating": "high"}})
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'unbuilt.ndjson')
+        with open(path, 'w') as f:
+            f.write(''.join(json.dumps(line) + '\n' for line in lines))
+
+        ingested, stats = ingest_ndjson(path)
+        assert stats['hospitals'] == 2 and stats['rejected'] == 1
+        assert ingested['hospitals'] == build_dataset(data)[0]['hospitals']
+
+        snapshot = dataset.load_ndjson_dataset(path)
+        assert isinstance(snapshot.hospitals['Texas']['Lubbock'][0], Hospital)
+        results = HospitalDataManager(snapshot).compare_hospitals(['MRI'], 'Lubbock')
+        assert [result['total_cash_cost'] for result in results] == \
+            [result['total_cash_cost'] for result in HospitalDataManager(DatasetSnapshot(data)).compare_hospitals(
+                ['MRI'], 'Lubbock')]
+    print("✅ Unbuilt NDJSON files are built while ingesting")
+
+
+def test_watcher_not_started_in_gunicorn_master():
+    """Importing the app under gunicorn starts no watcher; each worker starts its own"""
+    print("🔍 Testing data watcher startup...")
+    check = ("import sys, threading, types\n"
+             "{setup}import app\n"
+             "watching = any(thread.name == 'dataset-watcher' for thread in threading.enumerate())\n"
+             "print(watching, app.start_data_watcher().is_alive())\n")
+    env = dict(os.environ, DATA_RELOAD_INTERVAL='60')
+    env.pop('HOSPITAL_DB', None)
+    for setup, expected in (("sys.modules['gunicorn'] = types.ModuleType('gunicorn')\n", "False True"),
+                            ("", "True True")):
+        result = subprocess.run([sys.executable, '-c', check.format(setup=setup)], env=env,
+                                capture_output=True, text=True)
+        assert result.returncode == 0, result.stderr
+        assert result.stdout.splitlines()[-1] == expected, result.stdout
+    print("✅ Watcher starts in workers, not the gunicorn master")
+
+
+if __name__ == "__main__":
+    test_components_share_one_snapshot()
+    test_snapshot_is_read_only()
+    test_fallback_when_file_missing()
+    test_compiled_dataset_round_trip()
+    test_corrupt_compiled_dataset_falls_back_to_json()
+    test_reload_swaps_snapshot_atomically()
+    test_sharded_dataset_matches_json()
+    test_ndjson_ingest_matches_json()
+    test_unbuilt_ndjson_ingest()
+    test_compact_records_round_trip()
+    test_build_precomputes_and_validates()
+    test_watcher_not_started_in_gunicorn_master()
@@ -0,0 +1,830 @@
+#!/usr/bin/env python3
+"""
+Hospital Pricing Engine Tests
+Checks that the alternative pricing paths return exactly what the default dict-based path returns
+"""
+
+import itertools
+import json
+import math
+import os
+import sqlite3
+import tempfile
+
+from city_index import CityIndex, normalize_city_name, split_state, state_name
+from conversation_manager import ConversationManager
+from dataset import DatasetSnapshot, load_dataset
+from facet_index import bitset, rows_of
+from geo_index import CityGrid, haversine_miles, location_states
+from hospital_data import HospitalDataManager
+from price_matrix import PriceMatrix
+from vector_pricing import HAVE_NUMPY, VECTORIZED_MIN_ROWS, VectorPriceMatrix, np
+from records import json_default, to_dict
+from sqlite_store import SQLiteHospitalStore, build_sqlite_store
+from zip_index import ZipIndex, reference_zip_index, zip_code
+
+PROCEDURES = ['MRI', 'ECG', 'X-ray', 'Chest X-ray', 'Blood tests', 'Sleep study']
+
+
+def _sample_city_dataset():
+    """Nationwide-format dataset with a few irregular records"""
+    return DatasetSnapshot({
+        "hospitals": {
+            "Texas": {
+                "Lubbock": [
+                    {"name": "Lubbock General Hospital", "rating": 4.1, "cash_discount": 20,
+                     "procedures": {"MRI": {"base_price": 2000, "insurance_price": 1500, "cash_price": 1600},
+                                    "X-ray": {"base_price": 300}}},
+                    {"name": "Lubbock Medical Center", "rating": 3.8,
+                     "procedures": {"MRI": {"base_price": 1800.5, "cash_price": 1500}}},
+                    {"name": "Lubbock Clinic", "rating": 4.6, "procedures": {}},
+                ],
+                "Dallas": [
+                    {"name": "Dallas Medical Center", "rating": 4.0,
+                     "procedures": {"ECG": {"base_price": 250, "insurance_price": 180, "cash_price": 212}}},
+                ]
+            }
+        }
+    })
+
+
+def test_price_matrix_layout():
+    """Missing procedures use the sentinel and fallback prices are resolved at build time"""
+    hospitals = _sample_city_dataset().hospitals['Texas']['Lubbock']
+    matrix = PriceMatrix(hospitals)
+
+    assert matrix.rows == 3
+    assert matrix.procedures == ['MRI', 'X-ray']
+    assert matrix.cash[1] == 300 * 0.85
+    assert math.isnan(matrix.cash[2 * 2]) and math.isnan(matrix.cash[2 * 2 + 1])
+    assert matrix.memory_bytes() == 3 * 2 * 8
+    print("✅ Price matrix layout is correct")
+
+
+def test_warm_indexes_builds_every_city_index():
+    """Preloading builds each city's rankings and facets so requests only read them"""
+    snapshot = _sample_city_dataset()
+    manager = HospitalDataManager(snapshot)
+    manager.warm_indexes()
+
+    lubbock = snapshot.derived(('procedure_rankings', ('Texas', 'Lubbock')), lambda: None)
+    dallas = snapshot.derived(('procedure_rankings', ('Texas', 'Dallas')), lambda: None)
+    assert lubbock.rows == 3 and dallas.rows == 1
+    assert manager.get_procedure_rankings(('Texas', 'Lubbock'), []) is lubbock
+    assert snapshot.derived(('facets', ('Texas', 'Dallas')), lambda: None) is not None
+    assert 'lubbock' in snapshot.derived('city_to_state', lambda: None)
+    print("✅ Warm indexes built every city index")
+
+
+def test_sqlite_store_matches_in_memory():
+    """Every public query answers the same from the SQLite store as from memory"""
+    print("🔍 Testing SQLite hospital store...")
+    flat = load_dataset('data/hospital_pricing_data.json')
+    sample = _sample_city_dataset()
+    sample_data = {"hospitals": {"Texas": {city: list(hospitals)
+                                           for city, hospitals in sample.hospitals['Texas'].items()}}}
+    with open('data/hospital_pricing_data.json', 'r') as f:
+        flat_data = json.load(f)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for snapshot, data in ((sample, sample_data), (flat, flat_data)):
+            path = os.path.join(tmp, 'hospitals.db')
+            build_sqlite_store(data, path)
+            store = SQLiteHospitalStore(path)
+            default = HospitalDataManager(snapshot)
+            backed = HospitalDataManager(snapshot, store=store)
+            for city in ('Lubbock', 'lubbock', 'Dallas', 'Houston', 'Boston', 'Nowhere'):
+                for procedures in itertools.combinations(PROCEDURES, 2):
+                    assert backed.compare_hospitals(list(procedures), city) == \
+                        default.compare_hospitals(list(procedures), city), (city, procedures)
+                assert backed.find_city_hospitals(city) == default.find_city_hospitals(city)
+                assert backed.get_emergency_hospitals(city) == default.get_emergency_hospitals(city)
+                for plan in ('Aetna', 'medicare'):
+                    assert backed.search_hospitals_by_insurance(plan, city) == \
+                        default.search_hospitals_by_insurance(plan, city)
+            store.close()
+    print("✅ SQLite store matches the in-memory dataset")
+
+
+def test_city_index_resolves_aliases_and_spellings():
+    """Normalized names and aliases resolve in both dataset formats and the SQLite store"""
+    print("🔍 Testing city name index...")
+    assert normalize_city_name("St. Louis") == normalize_city_name("Saint Louis") == "st louis"
+    assert normalize_city_name("Winston-Salem") == normalize_city_name("winston salem")
+
+    index = CityIndex([["st. louis", "Missouri", "St. Louis"], ["manhattan", "Kansas", "Manhattan"],
+                       ["new york", "New York", "New York"], ["portland", "Maine", "Portland"],
+                       ["portland", "Oregon", "Portland"]])
+    assert index.lookup("saint louis") == ("Missouri", "St. Louis")
+    assert index.lookup("NYC") == ("New York", "New York")
+    assert index.candidates("Manhattan") == [("New York", "New York"), ("Kansas", "Manhattan")]
+    assert index.resolve("Manhattan") == ("New York", "New York")
+    assert index.resolve("Manhattan, KS") == ("Kansas", "Manhattan")
+    assert index.candidates("portland") == [("Maine", "Portland"), ("Oregon", "Portland")]
+    assert index.lookup("Springfield") is None
+
+    flat = load_dataset('data/hospital_pricing_data.json')
+    manager = HospitalDataManager(flat)
+    assert manager.find_city_hospitals("nyc") == manager.find_city_hospitals("New York")
+    assert manager.find_city_hospitals("LA") == manager.find_city_hospitals("Los Angeles")
+    manager.warm_indexes()
+    assert flat.derived('city_index', lambda: None) is manager.get_city_index()
+
+    with open('data/hospital_pricing_data.json', 'r') as f:
+        flat_data = json.load(f)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'hospitals.db')
+        build_sqlite_store(flat_data, path)
+        store = SQLiteHospitalStore(path)
+        backed = HospitalDataManager(flat, store=store)
+        for city in ('nyc', 'New York City', 'sf', 'Philly', 'Chicago', 'Chicgo', 'seatle wa', 'york', 'Nowhere'):
+            assert backed.find_city_hospitals(city) == manager.find_city_hospitals(city), city
+        store.close()
+    print("✅ City index resolves aliases and spellings")
+
+
+def test_city_search_ranks_partial_and_misspelled_names():
+    """Search ranks cities named in the query, prefixes, substrings and typos"""
+    print("🔍 Testing city search...")
+    index = CityIndex([["san antonio", "Texas", "San Antonio"], ["sandy", "Utah", "Sandy"],
+                       ["portland", "Maine", "Portland"], ["south portland", "Maine", "South Portland"],
+                       ["portland", "Oregon", "Portland"], ["albuquerque", "New Mexico", "Albuquerque"]])
+    assert index.search("Portland") == [("Maine", "Portland"), ("Oregon", "Portland"), ("Maine", "South Portland")]
+    assert index.search("portlnd", limit=1) == [("Maine", "Portland")]
+    assert index.search("Albuquerqe") == [("New Mexico", "Albuquerque")]
+    assert index.search("hospitals in San Antonio, TX") == [("Texas", "San Antonio")]
+    assert index.search("san")[:2] == [("Texas", "San Antonio"), ("Utah", "Sandy")]
+    assert index.search("xyz") == [] and index.search("") == []
+    assert index.resolve("Portland") == ("Maine", "Portland")
+
+    manager = HospitalDataManager(_sample_city_dataset())
+    assert manager.find_city_hospitals("Lubock") == manager.find_city_hospitals("Lubbock")
+    assert manager.find_city_hospitals("Dallas, Texas") == manager.find_city_hospitals("Dallas")
+    assert manager.find_city_hospitals("Nowhere") == []
+    print("✅ City search ranks partial and misspelled names")
+
+
+def test_state_qualified_cities():
+    """"City, ST" names pick one of several same-named cities by keyed lookup"""
+    print("🔍 Testing state-qualified city lookups...")
+    assert split_state("Portland, OR") == ("Portland", "Oregon")
+    assert split_state("columbus georgia") == ("columbus", "Georgia")
+    assert split_state("Portland or") == ("Portland or", None)
+    assert split_state("Kansas City") == ("Kansas City", None)
+
+    data = {"hospitals": {}}
+    for state, city in (("Maine", "Portland"), ("Oregon", "Portland"), ("Georgia", "Columbus"),
+                        ("Ohio", "Columbus"), ("Texas", "Dallas"), ("Maine", "Saco")):
+        data["hospitals"].setdefault(state, {})[city] = [
+            {"name": f"{city} {state} Hospital", "rating": 4.0, "emergency": True,
+             "procedures": {"MRI": {"base_price": 1000 + len(state)}}}
+        ]
+    snapshot = DatasetSnapshot(data)
+    manager = HospitalDataManager(snapshot)
+
+    assert manager.city_candidates("Portland") == [("Maine", "Portland"), ("Oregon", "Portland")]
+    assert manager.city_candidates("Portland, OR") == [("Oregon", "Portland")]
+    assert manager.city_candidates("mri in columbus") == [("Georgia", "Columbus"), ("Ohio", "Columbus")]
+    assert manager.find_city_hospitals("Portland, OR")[0]['name'] == "Portland Oregon Hospital"
+    assert manager.find_city_hospitals("columbus ohio")[0]['name'] == "Columbus Ohio Hospital"
+    # A state-qualified name never leaves its state, not even for a one-letter look-alike
+    assert manager.find_city_hospitals("Portland, TX") == []
+    assert manager.get_city_index().resolve("Waco, TX") is None
+    assert manager.locate_city("Waco, TX") != ("Maine", "Saco")
+    assert all(result['hospital']['name'] != "Saco Maine Hospital"
+               for result in manager.compare_hospitals(['MRI'], "Waco, TX"))
+    assert manager.compare_hospitals(['MRI'], "Columbus, OH")[0]['hospital']['name'] == "Columbus Ohio Hospital"
+    assert [location for location, _ in manager.find_city_candidates("Columbus")] == \
+        [("Georgia", "Columbus"), ("Ohio", "Columbus")]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'hospitals.db')
+        build_sqlite_store(data, path)
+        store = SQLiteHospitalStore(path)
+        backed = HospitalDataManager(snapshot, store=store)
+        for city in ("Portland", "Portland, OR", "Columbus, GA", "columbus ohio", "Dallas, TX", "Portland, TX", "Waco, TX"):
+            assert backed.city_candidates(city) == manager.city_candidates(city), city
+            assert backed.find_city_candidates(city) == manager.find_city_candidates(city), city
+            assert backed.find_city_hospitals(city) == manager.find_city_hospitals(city), city
+        store.close()
+
+    conversation = ConversationManager(hospital_data_manager=manager)
+    assert conversation._extract_entities("mri prices in portland, or")['cities'] == ["Mri Prices In Portland, or"]
+    assert manager.find_city_hospitals("Mri Prices In Portland, Or")[0]['name'] == "Portland Oregon Hospital"
+    print("✅ State-qualified city lookups work")
+
+
+def test_insurance_bitsets():
+    """Insurance lookups and plan combinations come from precomputed bitsets"""
+    print("🔍 Testing insurance bitset index...")
+    assert list(rows_of(bitset([0, 3, 9, 64], 70))) == [0, 3, 9, 64]
+    assert list(rows_of(0)) == []
+
+    flat = load_dataset('data/hospital_pricing_data.json')
+    manager = HospitalDataManager(flat)
+    for city in ('Boston', 'Miami', 'Nowhere'):
+        hospitals = manager.find_city_hospitals(city) or manager.find_city_hospitals('New York')
+        for plan in ('Aetna', 'medicare', 'Cigna', 'Nothing'):
+            expected = [h for h in hospitals if plan.lower() in [p.lower() for p in h['insurance_accepted']]]
+            assert manager.search_hospitals_by_insurance(plan, city) == expected, (city, plan)
+        both = [h for h in hospitals
+                if {'aetna', 'medicare'} <= {p.lower() for p in h['insurance_accepted']}]
+        assert manager.search_hospitals_by_insurance(['Aetna', 'Medicare'], city) == both
+
+    nationwide = manager.search_hospitals_by_insurance_nationwide(['aetna', 'Cigna'])
+    expected = [((None, city), h) for city, hospitals in flat.hospitals.items() for h in hospitals
+                if {'aetna', 'cigna'} <= {p.lower() for p in h['insurance_accepted']}]
+    assert nationwide == expected and nationwide
+
+    with open('data/hospital_pricing_data.json', 'r') as f:
+        flat_data = json.load(f)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'hospitals.db')
+        build_sqlite_store(flat_data, path)
+        store = SQLiteHospitalStore(path)
+        backed = HospitalDataManager(flat, store=store)
+        for plans in (['Aetna', 'Medicare'], ['cigna'], []):
+            assert backed.search_hospitals_by_insurance(plans, 'Boston') == \
+                manager.search_hospitals_by_insurance(plans, 'Boston')
+            assert backed.search_hospitals_by_insurance_nationwide(plans) == \
+                manager.search_hospitals_by_insurance_nationwide(plans)
+        store.close()
+    print("✅ Insurance bitsets match the list scan")
+
+
+def _matches(hospital, filters):
+    """Reference filter check, one hospital at a time"""
+    lower = lambda names: {name.lower() for name in names}
+    return ((filters.get('emergency') is None or hospital['emergency'] == filters['emergency'])
+            and lower(filters.get('specialties', [])) <= lower(hospital['specialties'])
+            and hospital['rating'] >= filters.get('min_rating', 0)
+            and hospital['average_wait_time'] <= filters.get('max_wait_time', float('inf'))
+            and lower(filters.get('insurance', [])) <= lower(hospital['insurance_accepted'])
+            and set(filters.get('procedures', [])) <= set(hospital['procedures']))
+
+
+def test_faceted_filters():
+    """Combined filters equal a hospital-by-hospital check and feed compare_hospitals"""
+    print("🔍 Testing faceted hospital filters...")
+    filter_sets = [
+        {'emergency': True}, {'emergency': False}, {'min_rating': 4.2}, {'max_wait_time': 30},
+        {'specialties': ['cardiology']}, {'procedures': ['MRI', 'Sleep study']},
+        {'emergency': True, 'min_rating': 4.0, 'insurance': ['Aetna']},
+        {'max_wait_time': 45, 'specialties': ['Emergency Medicine'], 'procedures': ['ECG']},
+        {'min_rating': 5.1}, {}
+    ]
+    flat = load_dataset('data/hospital_pricing_data.json')
+    manager = HospitalDataManager(flat)
+    with open('data/hospital_pricing_data.json', 'r') as f:
+        flat_data = json.load(f)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'hospitals.db')
+        build_sqlite_store(flat_data, path)
+        store = SQLiteHospitalStore(path)
+        backed = HospitalDataManager(flat, store=store)
+        for filters in filter_sets:
+            for city in ('Boston', 'Houston', 'Nowhere'):
+                hospitals = manager.find_city_hospitals(city) or manager.find_city_hospitals('New York')
+                expected = [h for h in hospitals if _matches(h, filters)]
+                assert manager.filter_hospitals(city, filters) == expected, (city, filters)
+                assert backed.filter_hospitals(city, filters) == expected, (city, filters)
+
+                compared = manager.compare_hospitals(['MRI', 'ECG'], city, filters)
+                assert compared == sorted((manager._calculate_hospital_pricing(h, ['MRI', 'ECG']) for h in expected),
+                                          key=lambda result: result['total_cash_cost'])
+                assert backed.compare_hospitals(['MRI', 'ECG'], city, filters) == compared
+
+            nationwide = [((None, city), h) for city, hospitals in flat.hospitals.items()
+                          for h in hospitals if _matches(h, filters)]
+            assert manager.filter_hospitals_nationwide(filters) == nationwide
+            assert backed.filter_hospitals_nationwide(filters) == nationwide
+        store.close()
+
+    for bad in ({'stars': 4}, {'min_rating': 'high'}, {'emergency': 'yes'}, {'insurance': 3}, 'x', ['emergency']):
+        try:
+            manager.compare_hospitals(['MRI'], 'Boston', bad)
+            assert False, bad
+        except ValueError:
+            pass
+
+    from app import app
+    client = app.test_client()
+    for bad in ('x', ['emergency'], 3):
+        response = client.post('/api/compare-hospitals', json={'procedures': ['MRI'], 'location': 'Boston', 'filters': bad})
+        assert response.status_code == 400 and 'filters' in response.get_json()['error'], bad
+    print("✅ Faceted filters match a hospital-by-hospital check")
+
+
+def test_presorted_single_procedure_rankings():
+    """Single-procedure comparisons and cheapest-N slices equal a full price-and-sort"""
+    print("🔍 Testing pre-sorted procedure rankings...")
+    flat = load_dataset('data/hospital_pricing_data.json')
+    managers = [HospitalDataManager(flat)]
+    with open('data/hospital_pricing_data.json', 'r') as f:
+        flat_data = json.load(f)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'hospitals.db')
+        build_sqlite_store(flat_data, path)
+        store = SQLiteHospitalStore(path)
+        managers.append(HospitalDataManager(flat, store=store))
+        reference = managers[0]
+        for city in ('Boston', 'Seattle', 'Nowhere'):
+            hospitals = reference.find_city_hospitals(city) or reference.find_city_hospitals('New York')
+            for procedure in PROCEDURES + ['Not offered']:
+                full = sorted((reference._calculate_hospital_pricing(h, [procedure]) for h in hospitals),
+                              key=lambda result: result['total_cash_cost'])
+                for manager in managers:
+                    assert manager.compare_hospitals([procedure], city) == full, (city, procedure)
+                    assert manager.compare_hospitals([procedure], city, {'emergency': True}) == \
+                        [r for r in full if r['hospital']['emergency']]
+
+                for price in ('cash_price', 'base_price', 'insurance_price'):
+                    offering = [h for h in hospitals if procedure in h['procedures']]
+                    ranked = sorted(offering, key=lambda h: round(h['procedures'][procedure][price], 2))
+                    expected = [reference._calculate_hospital_pricing(h, [procedure]) for h in ranked[:3]]
+                    for manager in managers:
+                        assert manager.cheapest_hospitals(procedure, city, limit=3, price=price) == expected, \
+                            (city, procedure, price)
+        store.close()
+
+    try:
+        managers[0].cheapest_hospitals('MRI', 'Boston', price='rating')
+        assert False
+    except ValueError:
+        pass
+    print("✅ Pre-sorted rankings match a full sort")
+
+
+def test_nearest_city_fallback():
+    """Nearest cities with data come from the centroid grid, matching a brute-force distance sort"""
+    print("🔍 Testing nearest-city fallback...")
+    points = [(lat / 3, lon / 3, (lat, lon)) for lat, lon in itertools.product(range(60, 200, 7), range(-500, -200, 11))]
+    grid = CityGrid(points)
+    for lat, lon, k in ((30.3, -97.7, 1), (47.6, -122.3, 5), (21.3, -157.9, 3), (64.8, -147.7, 4), (0.0, 0.0, 2)):
+        expected = sorted((haversine_miles(lat, lon, p_lat, p_lon), item) for p_lat, p_lon, item in points)[:k]
+        assert grid.nearest(lat, lon, k) == expected, (lat, lon, k)
+
+    snapshot = _sample_city_dataset()
+    manager = HospitalDataManager(snapshot)
+    assert all(snapshot.location_coordinates)
+    assert [location for location, _ in manager.nearest_cities("Waco, TX", ['ECG'])] == [("Texas", "Dallas")]
+    assert [location for location, _ in manager.nearest_cities("Waco, TX")] == [("Texas", "Dallas"), ("Texas", "Lubbock")]
+    assert manager.nearest_cities("Texas", ['MRI'], k=1)[0][0] == ("Texas", "Lubbock")
+    assert manager.nearest_cities("Lubbock", ['MRI'])[0] == (("Texas", "Lubbock"), 0.0)
+    assert manager.nearest_cities("Lubbock", ['MRI', 'ECG']) == []
+    assert manager.nearest_cities("Atlantis", ['MRI']) == []
+
+    flat = HospitalDataManager(load_dataset('data/hospital_pricing_data.json'))
+    nearest = flat.nearest_cities("Killeen, Texas", ['MRI'], k=9)
+    assert nearest[0][0] == (None, "Houston") and len(nearest) == 9
+    assert [miles for _, miles in nearest] == sorted(miles for _, miles in nearest)
+
+    with open('data/hospital_pricing_data.json', 'r') as f:
+        flat_data = json.load(f)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'hospitals.db')
+        build_sqlite_store(flat_data, path)
+        store = SQLiteHospitalStore(path)
+        backed = HospitalDataManager(flat.dataset, store=store)
+        for location in ("Killeen, Texas", "Texas", "Seattle", "Atlantis"):
+            assert backed.nearest_cities(location, ['MRI'], k=4) == flat.nearest_cities(location, ['MRI'], k=4)
+        store.close()
+
+    conversation = ConversationManager(hospital_data_manager=flat)
+    conversation.conversation_context.update(user_location="Killeen, Texas", required_procedures=['MRI'])
+    response = conversation._provide_direct_analysis("mri prices")
+    assert response['type'] == 'nearby_options' and response['suggested_location'] == "Houston"
+    assert response['hospitals'] == flat.compare_hospitals(['MRI'], "Houston")[:3]
+
+    # A known town without hospitals gets its nearest city, not a look-alike name elsewhere
+    towns = HospitalDataManager(DatasetSnapshot({"hospitals": {
+        state: {city: [{"name": f"{city} Hospital", "rating": 4.0, "procedures": {"MRI": {"base_price": 900}}}]}
+        for state, city in (("Texas", "Arlington"), ("Maine", "Saco"))}}))
+    assert towns.locate_city("Waco") is None and towns.locate_city("Waco, TX") is None
+    assert towns.locate_city("Sacoo") == ("Maine", "Saco")
+    assert towns.nearest_cities("Waco", ['MRI'], k=1)[0] == (("Texas", "Arlington"), 82.3)
+    conversation = ConversationManager(hospital_data_manager=towns)
+    conversation.conversation_context.update(user_location="Waco", required_procedures=['MRI'])
+    response = conversation._provide_direct_analysis("mri prices")
+    assert response['type'] == 'nearby_options' and response['suggested_location'] == "Arlington, Texas"
+    print("✅ Nearest-city fallback works")
+
+
+def test_zip_code_resolution():
+    """ZIP codes resolve through the range index to the narrowest matching range and a dataset city"""
+    print("🔍 Testing ZIP code resolution...")
+    ranges = [(75000, 79999, "Texas", None), (77000, 77299, "Texas", "Houston"),
+              (77001, 77001, "Texas", "Downtown"), (73300, 73399, "Texas", None), (73300, 73399, "Texas", "Austin")]
+    index = ZipIndex(ranges)
+    for code in range(72000, 81000, 37):
+        covering = [entry for entry in ranges if entry[0] <= code <= entry[1]]
+        expected = min(covering, key=lambda entry: (entry[1] - entry[0], entry[3] is None))[2:] if covering else None
+        assert index.lookup(code) == expected, code
+    assert index.lookup("77001") == ("Texas", "Downtown") and index.lookup("77300") == ("Texas", None)
+    assert index.lookup("73301") == ("Texas", "Austin") and index.lookup("not a zip") is None
+
+    reference = reference_zip_index()
+    assert reference.lookup("79401") == ("Texas", "Lubbock")
+    assert reference.lookup("73102") == ("Oklahoma", "Oklahoma City")
+    assert reference.lookup("02115") == ("Massachusetts", "Boston")
+    assert reference.lookup("00000") is None
+    assert [zip_code(text) for text in ("77001", " near 79401", "ZIP: 10003-1234", "Houston 77001")] == \
+        ["77001", "79401", "10003", None]
+
+    flat = HospitalDataManager(load_dataset('data/hospital_pricing_data.json'))
+    assert flat.locate_city("77001") == (None, "Houston")
+    assert flat.locate_city("79401") == (None, "Houston")  # Lubbock has no data; Houston is the closest city that does
+    assert flat.locate_city("98101") == (None, "Seattle") and flat.locate_city("00000") is None
+    assert flat.compare_hospitals(['MRI'], "near 02115") == flat.compare_hospitals(['MRI'], "Boston")
+    assert flat.city_candidates("10003") == [(None, "New York")]
+
+    with open('data/hospital_pricing_data.json', 'r') as f:
+        flat_data = json.load(f)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'hospitals.db')
+        build_sqlite_store(flat_data, path)
+        store = SQLiteHospitalStore(path)
+        backed = HospitalDataManager(flat.dataset, store=store)
+        for code in ("77001", "79401", "33101", "00000"):
+            assert backed.locate_city(code) == flat.locate_city(code), code
+            assert backed.compare_hospitals(['ECG'], code) == flat.compare_hospitals(['ECG'], code), code
+        store.close()
+
+    conversation = ConversationManager(hospital_data_manager=flat)
+    assert conversation._extract_entities("mri near 79401")['cities'] == ["Lubbock, Texas"]
+    assert conversation._extract_entities("i live in 77001, under $12000")['cities'] == ["Houston, Texas"]
+    print("✅ ZIP code resolution works")
+
+
+def test_hospital_lookup_index():
+    """Hospitals are found by id or name across every city, in memory and in the SQLite store"""
+    print("🔍 Testing hospital id and name lookups...")
+    with open('data/hospital_pricing_data.json', 'r') as f:
+        flat_data = json.load(f)
+    flat = HospitalDataManager(load_dataset('data/hospital_pricing_data.json'))
+    for city, hospitals in flat_data['hospitals'].items():
+        for hospital in hospitals:
+            location_key, found = flat.get_hospital(hospital['id'])
+            assert location_key == (None, city) and found['name'] == hospital['name'], hospital['id']
+    assert flat.get_hospital("no_such_hospital") is None
+
+    downtown = flat.find_hospitals_by_name("downtown university hospital")
+    assert [location for location, _ in downtown] == [(None, "Chicago"), (None, "Atlanta"), (None, "Phoenix")]
+    assert flat.get_hospital_details("Downtown Community Hospital", "Atlanta")['id'].startswith("atlanta_")
+    assert flat.get_hospital_details("Downtown Community Hospital", "Los Angeles")['id'].startswith("los_angeles_")
+    assert flat.get_hospital_details("downtown community hospital")['id'].startswith("los_angeles_")
+    assert flat.get_hospital_details("new_york_hospital_009")['name'] == "Harlem Regional Medical Center"
+    assert flat.get_hospital_details("Nowhere General") is None
+
+    # Nested data has no "New York" key; names are still found in any state
+    nested = HospitalDataManager(_sample_city_dataset())
+    assert nested.get_hospital_details("Lubbock Clinic")['rating'] == 4.6
+    assert nested.find_hospitals_by_name("Dallas Medical Center")[0][0] == ("Texas", "Dallas")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'hospitals.db')
+        build_sqlite_store(flat_data, path)
+        store = SQLiteHospitalStore(path)
+        backed = HospitalDataManager(flat.dataset, store=store)
+        for hospital_id in ("new_york_hospital_009", "atlanta_hospital_001", "no_such_hospital"):
+            expected = flat.get_hospital(hospital_id)
+            assert to_dict(backed.get_hospital(hospital_id)) == to_dict(expected), hospital_id
+        assert to_dict(backed.find_hospitals_by_name("Downtown University Hospital")) == to_dict(downtown)
+        assert to_dict(backed.get_hospital_details("Downtown Community Hospital", "Atlanta")) == \
+            to_dict(flat.get_hospital_details("Downtown Community Hospital", "Atlanta"))
+        store.close()
+
+    # The build step's lookup fields stay out of API responses
+    from app import app
+    client = app.test_client()
+    responses = [client.get('/api/hospitals/new_york_hospital_009').get_json()['hospital'],
+                 client.get('/api/hospitals?name=Harlem Regional Medical Center').get_json()['hospitals'][0]['hospital']]
+    for hospital in responses:
+        assert hospital['name'] == "Harlem Regional Medical Center" and hospital['insurance_accepted']
+        assert 'insurance_lower' not in hospital and 'estimated_wait_time' not in hospital, sorted(hospital)
+    print("✅ Hospital lookups work")
+
+
+def test_cheapest_in_region():
+    """Statewide and national cheapest-provider rankings match a full sort of every hospital"""
+    print("🔍 Testing statewide and nationwide cheapest hospitals...")
+    flat = HospitalDataManager(load_dataset('data/hospital_pricing_data.json'))
+    states = dict(zip(((state, city) for _, state, city in flat.dataset.locations),
+                      location_states(flat.dataset.locations)))
+    everything = flat.filter_hospitals_nationwide()
+    queries = [(['MRI'], None, 'cash_price', None), (['MRI'], 'TX', 'base_price', None),
+               (['ECG', 'X-ray', 'Blood tests'], None, 'cash_price', {'emergency': True}),
+               (['Sleep study', 'MRI'], 'california', 'insurance_price', {'min_rating': 4.0})]
+    for procedures, state, price, filters in queries:
+        region = state_name(state) if state else None
+        expected = sorted(
+            (sum(round(round(hospital['procedures'][procedure][price], 2) * 100) for procedure in procedures), position)
+            for position, (location, hospital) in enumerate(everything)
+            if (region is None or states[location] == region) and all(p in hospital['procedures'] for p in procedures)
+            and _matches(hospital, filters or {}))[:7]
+        results = flat.cheapest_in_region(procedures, state, 7, price, filters)
+        assert [result['hospital']['name'] for result in results] == \
+            [everything[position][1]['name'] for _, position in expected], (procedures, state)
+        assert all(result['state'] == states[(None, result['city'])] for result in results)
+    assert {result['city'] for result in flat.cheapest_in_region(['MRI'], 'Texas', 50)} == {"Houston"}
+    assert flat.cheapest_in_region(['Unknown scan']) == [] and flat.cheapest_in_region(['MRI'], 'Ohio') == []
+    for bad in ({'state': 'Atlantis'}, {'price': 'savings_cash'}):
+        try:
+            flat.cheapest_in_region(['MRI'], **bad)
+            assert False, bad
+        except ValueError:
+            pass
+
+    with open('data/hospital_pricing_data.json', 'r') as f:
+        flat_data = json.load(f)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'hospitals.db')
+        build_sqlite_store(flat_data, path)
+        store = SQLiteHospitalStore(path)
+        backed = HospitalDataManager(flat.dataset, store=store)
+        for procedures, state, price, filters in queries:
+            assert to_dict(backed.cheapest_in_region(procedures, state, 7, price, filters)) == \
+                to_dict(flat.cheapest_in_region(procedures, state, 7, price, filters)), (procedures, state)
+        store.close()
+
+    # Both endpoints refuse procedures that are not a list of names instead of pricing each character
+    from app import app
+    client = app.test_client()
+    for endpoint in ('/api/cheapest-hospitals', '/api/compare-hospitals'):
+        for bad in ('MRI', [1], {'MRI': 1}, []):
+            response = client.post(endpoint, json={'procedures': bad, 'location': 'Boston'})
+            assert response.status_code == 400 and 'procedures' in response.get_json()['error'], (endpoint, bad)
+        assert client.post(endpoint, json={'procedures': ['MRI'], 'location': 'Boston'}).status_code == 200
+    print("✅ Cheapest hospitals by state and nationwide work")
+
+
+def test_vectorized_pricing_matches_loops():
+    """The NumPy kernel returns exactly what the per-hospital loop returns, ints and ties included"""
+    print("🔍 Testing vectorized pricing...")
+    if not HAVE_NUMPY:
+        print("⚠️ NumPy is not installed, skipping")
+        return
+    with open('data/hospital_pricing_data.json', 'r') as f:
+        flat_data = json.load(f)
+    # One city big enough for the kernel, with integer prices and tied totals mixed in
+    big_city = [dict(hospital, procedures=dict(hospital['procedures']))
+                for hospitals in flat_data['hospitals'].values() for hospital in hospitals][:VECTORIZED_MIN_ROWS + 20]
+    for position, hospital in enumerate(big_city[::3]):
+        hospital['procedures']['MRI'] = {"base_price": 1000 + position % 4, "cash_price": 800, "insurance_price": 300}
+    snapshot = DatasetSnapshot({"hospitals": dict(flat_data['hospitals'], Metropolis=big_city)})
+    loops = HospitalDataManager(snapshot)
+    vectorized = HospitalDataManager(snapshot, vectorized=True)
+    cases = [(['MRI', 'ECG'], None), (['MRI', 'CT scan', 'MRI'], {'emergency': True}), (['MRI', 'Unknown scan'], None),
+             (['Unknown scan', 'Other scan'], None), (['Blood tests', 'Ultrasound', 'MRI'], {'min_rating': 4.0})]
+    for procedures, filters in cases:
+        expected = loops.compare_hospitals(procedures, "Metropolis", filters)
+        assert json.dumps(vectorized.compare_hospitals(procedures, "Metropolis", filters), default=json_default) == \
+            json.dumps(expected, default=json_default)
+        location_key, hospitals = loops._locate_city(snapshot, "Boston")
+        # Small cities take the loop, but the kernel itself must agree there too
+        ranking = vectorized._rank_vectorized(snapshot, location_key, hospitals, procedures)
+        assert json.dumps(ranking.page(), default=json_default) == \
+            json.dumps(loops.compare_hospitals(procedures, "Boston"), default=json_default)
+
+    keys = [5.0, 1.0, 3.0, 1.0, 3.0, 3.0, 0.5]
+    for limit in range(len(keys) + 2):
+        assert VectorPriceMatrix.rank(keys, limit).tolist() == sorted(range(len(keys)), key=keys.__getitem__)[:limit]
+    totals = [0.125, 1.005, 2.675, 1234.565, 0.0, 99.994999]
+    assert VectorPriceMatrix.cents(np.array(totals)).tolist() == [round(total, 2) for total in totals]
+    print("✅ Vectorized pricing matches the per-hospital loop")
+
+
+def test_compare_hospitals_pages():
+    """limit/offset pages are slices of the full ranking on every engine, and the summary covers all of it"""
+    print("🔍 Testing paged hospital comparison...")
+    with open('data/hospital_pricing_data.json', 'r') as f:
+        flat_data = json.load(f)
+    snapshot = DatasetSnapshot(flat_data)
+    managers = [HospitalDataManager(snapshot)]
+    if HAVE_NUMPY:
+        managers.append(HospitalDataManager(snapshot, vectorized=True))
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'pricing.db')
+        build_sqlite_store(flat_data, path)
+        managers.append(HospitalDataManager(store=SQLiteHospitalStore(path)))
+        for procedures, filters in [(['MRI'], None), (['MRI', 'ECG'], None), (['X-ray', 'MRI'], {'emergency': True})]:
+            full = managers[0].compare_hospitals(procedures, "Chicago", filters)
+            for manager in managers:
+                for offset, limit in [(0, 1), (0, 5), (3, 4), (len(full) - 2, 5), (len(full) + 1, 3), (2, None)]:
+                    stop = None if limit is None else offset + limit
+                    assert manager.compare_hospitals(procedures, "Chicago", filters, limit, offset) == full[offset:stop]
+                page = manager.compare_hospitals_page(procedures, "Chicago", filters, limit=3)
+                assert page == {'hospitals': full[:3], 'count': len(full), 'cheapest': full[0], 'most_expensive': full[-1]}
+        empty = managers[0].compare_hospitals_page(['MRI'], "Chicago", {'min_rating': 6})
+        assert empty['count'] == 0 and empty['cheapest'] is None
+        for bad in [(-1, 0), (5, -2)]:
+            try:
+                managers[0].compare_hospitals(['MRI'], "Chicago", None, *bad)
+                assert False, bad
+            except ValueError:
+                pass
+    print("✅ Paged comparisons match slices of the full ranking")
+
+
+def test_lazy_comparison_results():
+    """Comparison results price and copy nothing until read, and encode to the original dict shape"""
+    print("🔍 Testing lazy comparison results...")
+    flat = load_dataset('data/hospital_pricing_data.json')
+    manager = HospitalDataManager(flat)
+    hospital = manager.find_city_hospitals('Boston')[0]
+    result = manager._calculate_hospital_pricing(hospital, ['MRI', 'Not offered', 'ECG'])
+    assert result._costs is None
+    assert result['hospital']['name'] == hospital['name'] and result._costs is None
+
+    prices = [hospital['procedures'][procedure] for procedure in ('MRI', 'ECG')]
+    expected = {
+        "hospital": {field: to_dict(hospital[field]) for field in (
+            'name', 'rating', 'address', 'phone', 'emergency', 'insurance_accepted', 'specialties', 'average_wait_time')},
+        "procedures": [dict(to_dict(price), procedure=procedure) for procedure, price in zip(('MRI', 'ECG'), prices)],
+        "total_cost": round(prices[0]['base_price'] + prices[1]['base_price'], 2),
+        "total_cash_cost": round(prices[0]['cash_price'] + prices[1]['cash_price'], 2),
+        "total_savings_cash": round(prices[0]['base_price'] + prices[1]['base_price']
+                                    - prices[0]['cash_price'] - prices[1]['cash_price'], 2),
+        "cash_discount_percent": hospital['cash_discount'],
+        "estimated_wait_time": hospital['estimated_wait_time']
+    }
+    assert result == expected and to_dict(result) == expected
+    assert json.loads(json.dumps(result, default=json_default)) == expected
+    assert list(json.loads(json.dumps(result, default=json_default))) == list(expected)
+
+    located = manager.cheapest_in_region(['MRI'], 'Massachusetts', limit=1)[0]
+    assert (located['state'], located['city']) == ('Massachusetts', 'Boston')
+    try:
+        json.dumps(object(), default=json_default)
+        assert False
+    except TypeError:
+        pass
+    print("✅ Comparison results are lazy and encode like plain dicts")
+
+
+def test_value_rankings():
+    """sort_by/weights rankings agree across engines and order hospitals by the requested features"""
+    print("🔍 Testing value rankings...")
+    with open('data/hospital_pricing_data.json', 'r') as f:
+        flat_data = json.load(f)
+    big_city = [dict(hospital, id=f"metropolis_{number}") for number, hospital in enumerate(
+        [hospital for hospitals in flat_data['hospitals'].values() for hospital in hospitals][:VECTORIZED_MIN_ROWS + 20])]
+    flat_data = dict(flat_data, hospitals=dict(flat_data['hospitals'], Metropolis=big_city))
+    snapshot = DatasetSnapshot(flat_data)
+    managers = [HospitalDataManager(snapshot)]
+    if HAVE_NUMPY:
+        managers.append(HospitalDataManager(snapshot, vectorized=True))
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'pricing.db')
+        build_sqlite_store(flat_data, path)
+        managers.append(HospitalDataManager(store=SQLiteHospitalStore(path)))
+        reference = managers[0]
+        for city in ('Boston', 'Metropolis'):
+            for procedures, filters in [(['MRI'], None), (['MRI', 'ECG'], {'emergency': True})]:
+                by_price = reference.compare_hospitals(procedures, city, filters)
+                cases = [('rating', None), ('wait_time', None), ('best_value', None),
+                         (None, {'price': 2, 'rating': 1}), ('best_value', {'emergency': 1, 'wait_time': 0.5})]
+                for sort_by, weights in cases:
+                    expected = reference.compare_hospitals(procedures, city, filters, sort_by=sort_by, weights=weights)
+                    for manager in managers[1:]:
+                        assert manager.compare_hospitals(procedures, city, filters, sort_by=sort_by,
+                                                         weights=weights) == expected, (city, sort_by, weights)
+                        assert manager.compare_hospitals(procedures, city, filters, 3, 2, sort_by=sort_by,
+                                                         weights=weights) == expected[2:5]
+                    assert sorted(result['hospital']['name'] for result in expected) == \
+                        sorted(result['hospital']['name'] for result in by_price)
+                ratings = [result['hospital']['rating']
+                           for result in reference.compare_hospitals(procedures, city, filters, sort_by='rating')]
+                assert ratings == sorted(ratings, reverse=True)
+                waits = [result['hospital']['average_wait_time']
+                         for result in reference.compare_hospitals(procedures, city, filters, sort_by='wait_time')]
+                assert waits == sorted(waits)
+                cheapest_first = reference.compare_hospitals(procedures, city, filters, weights={'price': 1})
+                assert [result['total_cash_cost'] for result in cheapest_first] == \
+                    [result['total_cash_cost'] for result in by_price]
+                assert reference.compare_hospitals(procedures, city, filters, sort_by='price') == by_price
+
+    for sort_by, weights in [('fastest', None), ('rating', {'rating': 1}), (None, {'distance': 1}),
+                             (None, {'price': -1}), (None, {'price': 0}), (None, {'price': True}), (None, [1, 2])]:
+        try:
+            reference.compare_hospitals(['MRI'], 'Boston', sort_by=sort_by, weights=weights)
+            assert False, (sort_by, weights)
+        except ValueError:
+            pass
+    print("✅ Value rankings agree across engines")
+
+
+def test_compare_hospitals_batch():
+    """Batch entries equal one compare_hospitals call per query, in input order, on every engine"""
+    print("🔍 Testing batch hospital comparison...")
+    with open('data/hospital_pricing_data.json', 'r') as f:
+        flat_data = json.load(f)
+    snapshot = DatasetSnapshot(flat_data)
+    queries = [
+        {'procedures': ['MRI'], 'location': 'Boston', 'limit': 3},
+        {'procedures': ['MRI', 'ECG'], 'location': 'Chicago', 'filters': {'emergency': True}},
+        {'procedures': ['MRI'], 'location': 'boston', 'limit': 3, 'offset': 3},
+        {'procedures': ['X-ray', 'MRI'], 'location': 'Seattle', 'sort_by': 'best_value', 'limit': 5},
+        {'procedures': ['MRI'], 'location': 'Boston', 'limit': 3},
+        {'procedures': ['ECG'], 'location': 'Atlantis', 'limit': 2},
+        {'procedures': ['MRI']},
+        {'location': 'Boston'},
+        {'procedures': ['MRI'], 'limit': 0},
+        {'procedures': ['MRI'], 'filters': {'stars': 5}},
+        {'procedures': ['MRI'], 'filters': ['emergency']},
+        {'procedures': ['MRI'], 'sort_by': ['rating']},
+        'MRI in Boston',
+    ]
+    managers = [HospitalDataManager(snapshot)]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'pricing.db')
+        build_sqlite_store(flat_data, path)
+        managers.append(HospitalDataManager(store=SQLiteHospitalStore(path)))
+        for manager in managers:
+            entries = manager.compare_hospitals_batch(queries)
+            assert [entry['index'] for entry in entries] == list(range(len(queries)))
+            for query, entry in zip(queries[:7], entries):
+                arguments = {key: value for key, value in query.items() if key != 'procedures'}
+                assert entry['hospitals'] == managers[0].compare_hospitals(query['procedures'], **arguments), query
+                assert entry['count'] == managers[0].compare_hospitals_page(
+                    query['procedures'], query.get('location', "New York"), query.get('filters'),
+                    sort_by=query.get('sort_by'))['count']
+            assert all(set(entry) == {'index', 'error'} for entry in entries[7:])
+            assert list(manager.iter_compare_hospitals_batch(queries, chunk_size=2)) == entries
+    assert managers[0].compare_hospitals_batch([]) == []
+
+    from app import app
+    response = app.test_client().post('/api/compare-hospitals/batch', json={'queries': [
+        {'procedures': ['MRI'], 'location': 'Boston', 'filters': 'emergency'},
+        {'procedures': ['MRI'], 'location': 'Boston', 'limit': 1}]})
+    results = response.get_json()['results']
+    assert response.status_code == 200 and 'filters' in results[0]['error'] and len(results[1]['hospitals']) == 1
+    print("✅ Batch comparisons match single comparisons")
+
+
+def test_store_serves_without_dataset():
+    """A store answers hospital queries and holds the plans and conditions without the JSON dataset"""
+    print("🔍 Testing store-only serving...")
+    flat = load_dataset('data/hospital_pricing_data.json')
+    manager = HospitalDataManager(flat)
+    with open('data/hospital_pricing_data.json', 'r') as f:
+        flat_data = json.load(f)
+    filter_sets = [{'min_rating': 4.2}, {'max_wait_time': 30}, {'specialties': ['CARDIOLOGY']},
+                   {'max_wait_time': 45, 'specialties': ['Emergency Medicine'], 'min_rating': 4.0}]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'hospitals.db')
+        build_sqlite_store(flat_data, path)
+        store = SQLiteHospitalStore(path)
+        snapshot = store.snapshot()
+        assert not snapshot.hospitals and snapshot.source == path
+        assert snapshot.insurance_plans == flat.insurance_plans and snapshot.medical_conditions == flat.medical_conditions
+        backed = HospitalDataManager(snapshot, store=store)
+        backed.warm_indexes()
+        assert backed.city_to_state == manager.city_to_state
+        assert backed.insurance_plans == flat.insurance_plans
+        assert backed.compare_hospitals(['MRI', 'ECG'], 'Boston') == manager.compare_hospitals(['MRI', 'ECG'], 'Boston')
+        for filters in filter_sets:
+            assert backed.filter_hospitals('Boston', filters) == manager.filter_hospitals('Boston', filters), filters
+        store.close()
+
+        # Filtered fields are indexed columns, and a file with another schema is refused
+        conn = sqlite3.connect(path)
+        assert conn.execute(
+            "SELECT count(*) FROM hospitals WHERE rating IS NULL OR average_wait_time IS NULL").fetchone()[0] == 0
+        plan = ' '.join(row[-1] for row in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT hospital_id FROM hospital_specialty WHERE specialty_norm = 'cardiology'"))
+        assert 'idx_specialty' in plan, plan
+        conn.execute("DELETE FROM meta WHERE key = 'schema_version'")
+        conn.commit()
+        conn.close()
+        try:
+            SQLiteHospitalStore(path)
+            assert False, "outdated schema accepted"
+        except ValueError as e:
+            assert 'rebuild' in str(e)
+    print("✅ Store serves hospitals, plans and conditions on its own")
+
+
+if __name__ == "__main__":
+    test_price_matrix_layout()
+    test_warm_indexes_builds_every_city_index()
+    test_sqlite_store_matches_in_memory()
+    test_city_index_resolves_aliases_and_spellings()
+    test_city_search_ranks_partial_and_misspelled_names()
+    test_state_qualified_cities()
+    test_insurance_bitsets()
+    test_faceted_filters()
+    test_presorted_single_procedure_rankings()
+    test_nearest_city_fallback()
+    test_zip_code_resolution()
+    test_hospital_lookup_index()
+    test_cheapest_in_region()
+    test_vectorized_pricing_matches_loops()
+    test_compare_hospitals_pages()
+    test_lazy_comparison_results()
+    test_value_rankings()
+    test_compare_hospitals_batch()
+    test_store_serves_without_dataset()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Value Ranking for FinHealth Bot
+Ranks a comparison by a weighted score of price, rating, wait time and emergency care
+
+Each feature is scaled to 0..1 within the city, 1 being best: the highest rating, the
+shortest average wait, an emergency department. Those scales only depend on the
+hospitals, so HospitalFeatures computes them once per city. Price depends on the
+procedures asked for, so it is scaled per query from the comparison's cash totals,
+cheapest = 1. The score is the weighted sum; hospitals rank by score, highest first,
+ties in data order.
+
+sort_by picks a mode:
+    price       total cash cost, cheapest first (the default)
+    rating      rating only
+    wait_time   average wait time only
+    best_value  weights, by default DEFAULT_WEIGHTS
+
+weights, a dict over FEATURES, can be given with best_value or on its own; features it
+leaves out weigh 0. Larger cities are scored in one NumPy pass when NumPy is installed.
+"""
+
+import math
+from array import array
+from price_matrix import ComparisonRanking
+from vector_pricing import HAVE_NUMPY, VECTORIZED_MIN_ROWS, VectorPriceMatrix, np
+
+FEATURES = ('price', 'rating', 'wait_time', 'emergency')
+DEFAULT_WEIGHTS = {'price': 0.5, 'rating': 0.3, 'wait_time': 0.1, 'emergency': 0.1}
+RANKING_MODES = {
+    'price': None,
+    'rating': {'rating': 1},
+    'wait_time': {'wait_time': 1},
+    'best_value': DEFAULT_WEIGHTS
+}
+
+
+def check_ranking(sort_by=None, weights=None):
+    """Feature weights in FEATURES order for a sort_by/weights pair, or None to rank by price
+
+    Raises ValueError for an unknown mode or feature, weights with a mode other than
+    best_value, or weights that are not non-negative numbers with at least one above 0.
+    """
+    if sort_by is not None and (not isinstance(sort_by, str) or sort_by not in RANKING_MODES):
+        raise ValueError(f"Unknown ranking: {sort_by}")
+    if weights is None:
+        weights = RANKING_MODES[sort_by or 'price']
+        if weights is None:
+            return None
+    elif sort_by not in (None, 'best_value'):
+        raise ValueError("weights can only be given with sort_by best_value")
+    if not isinstance(weights, dict):
+        raise ValueError("weights should map features to numbers")
+    for feature, weight in weights.items():
+        if feature not in FEATURES:
+            raise ValueError(f"Unknown ranking feature: {feature}")
+        if isinstance(weight, bool) or not isinstance(weight, (int, float)) \
+                or not math.isfinite(weight) or weight < 0:
+            raise ValueError(f"Weight of {feature} should be a number of at least 0")
+    if not any(weights.values()):
+        raise ValueError("At least one ranking weight should be above 0")
+    return tuple(float(weights.get(feature, 0)) for feature in FEATURES)
+
+
+def _scale(values, higher_is_better=True, bounds=None):
+    """values scaled to 0..1 with the best at 1; all 1 when they are all equal
+
+    bounds, (low, high), scales against a wider set of values than the ones given.
+    """
+    low, high = bounds or (min(values, default=0), max(values, default=0))
+    span = high - low
+    if not span:
+        return array('d', [1.0] * len(values))
+    if higher_is_better:
+        return array('d', [(value - low) / span for value in values])
+    return array('d', [(high - value) / span for value in values])
+
+
+class HospitalFeatures:
+    """Rating, wait time and emergency care of a city's hospitals, scaled to 0..1 by row
+
+    ranges, the (low, high) rating and wait time of the whole city, scales a filtered
+    subset of its hospitals as the full list would be.
+    """
+
+    def __init__(self, hospitals, ranges=(None, None)):
+        self.rating = _scale([hospital['rating'] for hospital in hospitals], bounds=ranges[0])
+        self.wait_time = _scale([hospital['average_wait_time'] for hospital in hospitals],
+                                higher_is_better=False, bounds=ranges[1])
+        self.emergency = array('d', [1.0 if hospital['emergency'] else 0.0 for hospital in hospitals])
+
+    def scores(self, price_keys, rows, weights):
+        """Score of each candidate, given its cash total (price_keys) and row
+
+        Terms are added in FEATURES order, skipping zero weights, so the NumPy pass and
+        the loop give the same floats.
+        """
+        low, high = min(price_keys, default=0), max(price_keys, default=0)
+        span = high - low
+        terms = [(weight, column) for weight, column in zip(weights, FEATURES) if weight]
+        if HAVE_NUMPY and len(rows) >= VECTORIZED_MIN_ROWS:
+            rows = np.asarray(rows, dtype=np.intp)
+            scores = np.zeros(len(rows))
+            for weight, column in terms:
+                if column == 'price':
+                    values = (high - np.asarray(price_keys, dtype=np.float64)) / span if span else np.ones(len(rows))
+                else:
+                    values = np.frombuffer(getattr(self, column), dtype=np.float64)[rows]
+                scores += weight * values
+            return scores
+        scores = [0.0] * len(rows)
+        for weight, column in terms:
+            if column == 'price':
+                values = [(high - key) / span for key in price_keys] if span else [1.0] * len(rows)
+            else:
+                feature = getattr(self, column)
+                values = [feature[row] for row in rows]
+            scores = [score + weight * value for score, value in zip(scores, values)]
+        return scores
+
+
+def rank_by_value(ranking, features, rows, weights):
+    """ComparisonRanking of a price ranking's candidates by score instead of price
+
+    ranking must hold cash totals as keys; rows are the candidates' rows in features.
+    """
+    scores = features.scores(ranking.keys, rows, weights)
+    if HAVE_NUMPY and not isinstance(scores, list):
+        keys = -scores
+        return ComparisonRanking(ranking.build, keys=keys.tolist(),
+                                 select=lambda start, stop: VectorPriceMatrix.rank(keys, stop)[start:].tolist())
+    return ComparisonRanking(ranking.build, keys=[-score for score in scores])
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Vectorized Pricing Kernel for FinHealth Bot
+Prices and ranks every hospital of a city in one NumPy pass over its PriceMatrix
+
+The NumPy array is a zero-copy view of the PriceMatrix cash prices, so it adds no memory.
+Cash totals are accumulated one procedure column at a time, in request order, so every
+float matches the per-hospital loop exactly. Only the cash totals that rank hospitals
+are computed here; the results, totals and savings included, are priced from the
+hospital records of the page being returned.
+
+NumPy is optional: HAVE_NUMPY is False when it is not installed, and
+HospitalDataManager(vectorized=True) then keeps pricing hospital by hospital.
+"""
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency
+    np = None
+
+HAVE_NUMPY = np is not None
+
+# Smaller cities are priced hospital by hospital, where NumPy's fixed per-call cost outweighs
+# the gain (see benchmark_pricing.py)
+VECTORIZED_MIN_ROWS = 100
+
+
+def _view(values, dtype, shape):
+    """NumPy view of an array('d') or bytearray laid out row by row"""
+    if not len(values):
+        return np.zeros(shape, dtype=dtype)
+    return np.frombuffer(values, dtype=dtype).reshape(shape)
+
+
+class VectorPriceMatrix:
+    """Rows x procedures NumPy view of one city's PriceMatrix"""
+
+    def __init__(self, matrix):
+        if not HAVE_NUMPY:
+            raise RuntimeError("NumPy is not installed")
+        self.rows = matrix.rows
+        self.procedure_index = matrix.procedure_index
+        self.cash = _view(matrix.cash, np.float64, (matrix.rows, matrix.columns))
+
+    def cash_totals(self, procedures, rows=None):
+        """Row numbers and each row's total cash price over the procedures it offers, as arrays"""
+        rows = np.arange(self.rows) if rows is None else np.asarray(rows, dtype=np.intp)
+        columns = [self.procedure_index[procedure] for procedure in procedures if procedure in self.procedure_index]
+        if not columns:
+            return rows, np.zeros(len(rows))
+        cash = self.cash[np.ix_(rows, columns)]
+        cash = np.where(np.isnan(cash), 0.0, cash)
+        # Add the columns in request order, like the per-hospital loop
+        total = cash[:, 0].copy()
+        for column in range(1, len(columns)):
+            total += cash[:, column]
+        return rows, total
+
+    @staticmethod
+    def rank(cash_keys, limit=None):
+        """Positions of cash_keys, cheapest first with ties in row order; only the limit cheapest if given
+
+        With a limit, argpartition finds the cutoff and only the rows at or below it are sorted.
+        """
+        keys = np.asarray(cash_keys, dtype=np.float64)
+        if limit is None or limit >= len(keys):
+            return np.argsort(keys, kind='stable')
+        if limit <= 0:
+            return np.arange(0)
+        cutoff = keys[np.argpartition(keys, limit - 1)[limit - 1]]
+        candidates = np.flatnonzero(keys <= cutoff)
+        return candidates[np.argsort(keys[candidates], kind='stable')][:limit]
+
+    @staticmethod
+    def cents(totals):
+        """Totals rounded to the cent exactly as Python's round(total, 2) does
+
+        np.round scales by 100 first, which can land on the other side of a half cent;
+        the few totals that close to one are rounded by Python instead.
+        """
+        scaled = totals * 100
+        rounded = np.rint(scaled) / 100
+        near_half = np.flatnonzero(np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6)
+        for position in near_half.tolist():
+            rounded[position] = round(float(totals[position]), 2)
+        return rounded
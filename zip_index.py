@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+ZIP Code Index for FinHealth Bot
+Resolves five-digit ZIP codes to a state and city with a binary search over ZIP ranges
+
+data/zip_ranges.json lists the ZIP ranges of each state and of the cities whose ranges
+are known, mostly the three-digit prefixes of their postal sectional centers. The ranges
+are flattened into sorted, non-overlapping intervals where the narrowest range wins, so
+"79401" finds Lubbock inside Texas with one bisect.
+
+A ZIP whose city has no pricing data resolves to the nearest city that has it, using
+the city coordinate grid from geo_index.
+"""
+
+import json
+import os
+import re
+from bisect import bisect_right
+from functools import lru_cache
+from geo_index import place_coordinates, state_coordinates
+
+ZIP_RANGES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'zip_ranges.json')
+
+# A ZIP (or ZIP+4) on its own, optionally after "near" or "zip"
+_ZIP_LOCATION = re.compile(r"^\s*(?:near\s+|zip(?:\s+code)?\s*:?\s*)?(\d{5})(?:-\d{4})?\s*$", re.IGNORECASE)
+# ZIPs inside a sentence; amounts such as "$12000" or "12,000" are not ZIPs
+ZIP_PATTERN = re.compile(r"(?<![\d$])(?<!\d[,.])(\d{5})(?:-\d{4})?(?!\d|[,.]\d)")
+
+
+def zip_code(location):
+    """The five-digit ZIP a location string consists of ("77001", "near 79401"), or None"""
+    match = _ZIP_LOCATION.match(location) if isinstance(location, str) else None
+    return match.group(1) if match else None
+
+
+def _parse_range(text):
+    low, _, high = text.partition('-')
+    return int(low), int(high or low)
+
+
+class ZipIndex:
+    """Sorted, non-overlapping ZIP intervals -> (state, city); city is None for state-only ranges"""
+
+    def __init__(self, ranges):
+        """ranges: (low, high, state, city) tuples; where ranges overlap the narrowest one wins,
+        and a city range wins over a state range of the same width"""
+        ranges = sorted(ranges, key=lambda entry: entry[0])
+        boundaries = sorted({low for low, _, _, _ in ranges} | {high + 1 for _, high, _, _ in ranges})
+        self._starts = []
+        self._intervals = []
+        active = []
+        next_range = 0
+        for position, start in enumerate(boundaries[:-1]):
+            while next_range < len(ranges) and ranges[next_range][0] <= start:
+                active.append(ranges[next_range])
+                next_range += 1
+            active = [entry for entry in active if entry[1] >= start]
+            if not active:
+                continue
+            low, high, state, city = min(active, key=lambda entry: (entry[1] - entry[0], entry[3] is None))
+            end = boundaries[position + 1] - 1
+            if self._intervals and self._intervals[-1] == (start - 1, state, city):
+                self._intervals[-1] = (end, state, city)
+            else:
+                self._starts.append(start)
+                self._intervals.append((end, state, city))
+
+    def lookup(self, code):
+        """(state, city) of a ZIP code string or number, or None when no range holds it"""
+        try:
+            code = int(code)
+        except (TypeError, ValueError):
+            return None
+        position = bisect_right(self._starts, code) - 1
+        if position < 0 or self._intervals[position][0] < code:
+            return None
+        _, state, city = self._intervals[position]
+        return state, city
+
+    def __len__(self):
+        return len(self._intervals)
+
+
+@lru_cache(maxsize=1)
+def reference_zip_index():
+    """ZipIndex over data/zip_ranges.json, loaded once per process"""
+    try:
+        with open(ZIP_RANGES_FILE, 'r') as f:
+            reference = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"ZIP ranges unavailable: {e}")
+        reference = {}
+    ranges = [(*_parse_range(text), state, None)
+              for state, texts in reference.get('states', {}).items() for text in texts]
+    ranges.extend((*_parse_range(text), state, city)
+                  for state, cities in reference.get('cities', {}).items()
+                  for city, texts in cities.items() for text in texts)
+    return ZipIndex(ranges)
+
+
+def zip_place(code):
+    """"City, State" (or just the state) a ZIP code belongs to, or None"""
+    place = reference_zip_index().lookup(code)
+    if place is None:
+        return None
+    state, city = place
+    return f"{city}, {state}" if city else state
+
+
+def resolve_zip(code, city_index, grid):
+    """Dataset (state, city) for a ZIP code, or None
+
+    The ZIP's own city when the dataset has it, otherwise the dataset city nearest
+    to that city (or to the state's centroid when only the state is known).
+    """
+    place = reference_zip_index().lookup(code)
+    if place is None:
+        return None
+    state, city = place
+    if city is not None:
+        location = city_index.lookup_in_state(city, state)
+        if location is not None:
+            return location
+    point = (place_coordinates(f"{city}, {state}") if city else None) or state_coordinates(state)
+    nearest = grid.nearest(*point, k=1) if point else []
+    return nearest[0][1] if nearest else None
+
+
+def resolve_place(name, city_index, grid):
+    """(state, city) for a user-typed location: ZIP codes through the ZIP index, names through the city index
+
+    A known town that is not a dataset city ("Waco") gives None instead of a partial or
+    misspelled match ("Saco"), so callers fall back to the nearest cities with data.
+    """
+    code = zip_code(name)
+    if code is not None:
+        return resolve_zip(code, city_index, grid)
+    location = city_index.resolve(name, search=False)
+    if location is None and place_coordinates(name) is None:
+        location = city_index.resolve(name)
+    return location